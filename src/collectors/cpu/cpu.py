@@ -24,6 +24,7 @@ class CPUCollector(diamond.collector.Collector):
 
     PROC = '/proc/stat'
     INTERVAL = 1
+    SHAREABLE = True
 
     MAX_VALUES = {
         'user': diamond.collector.MAX_COUNTER,
@@ -151,24 +152,24 @@ class CPUCollector(diamond.collector.Collector):
             # "since the number of cpus rarely, if ever, changes, we don't need a cpu_count metric."
             # metrics['cpu_count'] = ncpus
 
+            names = []
+            values = []
+            max_values = []
             for cpu in results.keys():
                 stats = results[cpu]
                 for s in stats.keys():
                     # Get Metric Name
-                    metric_name = '.'.join([cpu, s])
-                    # Get actual data
-                    if ((str_to_bool(self.config['normalize']) and
-                         cpu == 'total' and
-                         ncpus > 0)):
-                        metrics[metric_name] = self.derivative(
-                            metric_name,
-                            long(stats[s]),
-                            self.MAX_VALUES[s]) / ncpus
-                    else:
-                        metrics[metric_name] = self.derivative(
-                            metric_name,
-                            long(stats[s]),
-                            self.MAX_VALUES[s])
+                    names.append('.'.join([cpu, s]))
+                    values.append(long(stats[s]))
+                    max_values.append(self.MAX_VALUES[s])
+
+            # Get actual data
+            normalize = str_to_bool(self.config['normalize']) and ncpus > 0
+            for metric_name, value in zip(
+                    names, self.derivatives(names, values, max_values)):
+                if normalize and metric_name.startswith('total.'):
+                    value /= ncpus
+                metrics[metric_name] = value
 
             # Check for a bug in xen where the idle time is doubled for guest
             # See https://bugzilla.redhat.com/show_bug.cgi?id=624756
@@ -23,7 +23,7 @@ Uses /proc/mounts and os.statvfs() to get disk space usage
 import diamond.collector
 import diamond.convertor
 import os
-import re
+from diamond.utils.filters import MetricFilter
 from diamond.collector import str_to_bool
 
 try:
@@ -86,7 +86,8 @@ class DiskSpaceCollector(diamond.collector.Collector):
         if isinstance(self.exclude_filters, basestring):
             self.exclude_filters = [self.exclude_filters]
 
-        self.exclude_reg = re.compile('|'.join(self.exclude_filters))
+        self.exclude_filter = MetricFilter(self.exclude_filters,
+                                           anchored=False)
 
         self.filesystems = []
         if isinstance(self.config['filesystems'], basestring):
@@ -141,7 +142,7 @@ class DiskSpaceCollector(diamond.collector.Collector):
                     continue
 
                 # Process the filters
-                if self.exclude_reg.search(mount_point):
+                if self.exclude_filter.matches(mount_point):
                     self.log.debug("Ignoring %s since it is in the " +
                                    "exclude_filter list.", mount_point)
                     continue
@@ -164,8 +164,14 @@ class DiskUsageCollector(diamond.collector.Collector):
             self.log.error('No diskspace metrics retrieved')
             return None
 
+        devices = []
+        names = []
+        values = []
+        max_values = []
         for key, info in results.iteritems():
             metrics = {}
+            # Index of the derivative of each counter
+            counters = {}
             name = info['device']
             if not reg.match(name):
                 continue
@@ -191,16 +197,21 @@ class DiskUsageCollector(diamond.collector.Collector):
 
                     metric_name = '.'.join([info['device'], key])
                     # io_in_progress is a point in time counter, !derivative
-                    if key != 'io_in_progress':
-                        metric_value = self.derivative(
-                            metric_name,
-                            value,
-                            self.MAX_VALUES[key],
-                            time_delta=False)
-                    else:
-                        metric_value = value
-
-                    metrics[key] = metric_value
+                    if key == 'io_in_progress':
+                        metrics[key] = value
+                    elif key not in counters:
+                        counters[key] = len(names)
+                        names.append(metric_name)
+                        values.append(value)
+                        max_values.append(self.MAX_VALUES[key])
+
+            devices.append((info, metrics, counters))
+
+        rates = self.derivatives(names, values, max_values, time_delta=False)
+
+        for info, metrics, counters in devices:
+            for key, index in counters.iteritems():
+                metrics[key] = rates[index]
 
             if self.proc_diskstats:
                 metrics['read_requests_merged_per_second'] = (
@@ -8,10 +8,29 @@ collect data about docker and the containers.
 
 * docker -- Install via `pip install docker-py`
   Source https://github.com/docker/docker-py
+
+docker-py is not needed when stats_threads is set. The stats of the
+containers are then fetched in parallel by that many threads, each with a
+one-shot request straight to the docker API at docker_url. The collector
+waits stats_timeout seconds at most for every container a thread fetches,
+and skips the containers whose stats are still missing by then.
+
+With stats_backend = cgroup the stats are read from the cgroups of the
+containers under cgroup_path instead, v1 or v2, and the docker API is only
+asked for the lists of containers and images. docker-py is not needed
+either.
 """
 
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import httplib
 import json
+import socket
+import time
+import urllib
+import urlparse
 import diamond.collector
+from diamond.utils.cgroups import ContainerCgroups
 
 try:
     import docker
@@ -19,6 +38,84 @@ except ImportError:
     docker = None
 
 
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """
+    HTTP connection over a unix socket
+    """
+
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerAPI(object):
+    """
+    The calls of docker.Client the collector makes, requesting the docker
+    API directly. Every call has a connection of its own so they can be
+    made from several threads
+    """
+
+    def __init__(self, url, timeout):
+        self.url = urlparse.urlsplit(url)
+        self.timeout = timeout
+
+    def connect(self):
+        if self.url.scheme == 'unix':
+            return UnixHTTPConnection(self.url.path, timeout=self.timeout)
+        if self.url.scheme == 'https':
+            return httplib.HTTPSConnection(self.url.netloc,
+                                           timeout=self.timeout)
+        # tcp or http
+        return httplib.HTTPConnection(self.url.netloc, timeout=self.timeout)
+
+    def get(self, path, **params):
+        if params:
+            path += '?' + urllib.urlencode(params)
+        connection = self.connect()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise Exception('docker API %s returned %d %s' % (
+                path, response.status, response.reason))
+        return json.loads(body)
+
+    def containers(self, all=False):
+        return self.get('/containers/json', all=int(all))
+
+    def images(self, quiet=False, all=False, filters=None):
+        params = {'all': int(all)}
+        if filters:
+            params['filters'] = json.dumps(dict(
+                (key, [str(value).lower()]) for key, value in
+                filters.iteritems()))
+        images = self.get('/images/json', **params)
+        if quiet:
+            return [image['Id'] for image in images]
+        return images
+
+    def stats(self, container):
+        """
+        A single sample of the stats of a container, without waiting for a
+        second one to compute the cpu usage since the previous sample
+        """
+        return self.get('/containers/%s/stats' % container, stream='false',
+                        **{'one-shot': 'true'})
+
+
 class DockerCollector(diamond.collector.Collector):
 
     METRICS = {
@@ -37,15 +134,39 @@ class DockerCollector(diamond.collector.Collector):
     }
 
     def get_default_config_help(self):
-        return super(DockerCollector, self).get_default_config_help()
+        config_help = super(DockerCollector, self).get_default_config_help()
+        config_help.update({
+            'stats_threads': 'Threads fetching the stats of the containers '
+                             'in parallel from the docker API. 0 fetches '
+                             'them one after the other through docker-py',
+            'stats_timeout': 'Seconds to wait for the stats of a container '
+                             'when stats_threads is set',
+            'docker_url': 'Docker API url, unix://, tcp:// or https://, '
+                          'when stats_threads is set or stats_backend is '
+                          'cgroup',
+            'stats_backend': 'Where the stats of the containers come from, '
+                             'api for the docker API or cgroup to read them '
+                             'from the cgroups of the containers',
+            'cgroup_path': 'Mount point of the cgroups',
+        })
+        return config_help
 
     def get_default_config(self):
         config = super(DockerCollector, self).get_default_config()
         config.update({
-            'path': 'docker'
+            'path': 'docker',
+            'stats_threads': 0,
+            'stats_timeout': 5,
+            'docker_url': 'unix:///var/run/docker.sock',
+            'stats_backend': 'api',
+            'cgroup_path': '/sys/fs/cgroup',
         })
         return config
 
+    def process_config(self):
+        super(DockerCollector, self).process_config()
+        self.cgroups = None
+
     def get_value(self, path, dictionary):
         keys = path.split(".")
         cur = dictionary
@@ -57,14 +178,76 @@ class DockerCollector(diamond.collector.Collector):
                 break
         return cur
 
+    def fetch_stats(self, api, container):
+        try:
+            return api.stats(container['Id'])
+        except Exception, e:
+            self.log.warning('Failed to get the stats of container %s: %s',
+                             container['Id'], e)
+            return None
+
+    def get_stats(self, client, containers):
+        """
+        Returns the stats of the containers
+        """
+        if self.config['stats_backend'] == 'cgroup':
+            if self.cgroups is None:
+                self.cgroups = ContainerCgroups(self.config['cgroup_path'])
+            ids = [container['Id'] for container in containers]
+            stats = self.cgroups.stats(ids)
+            return [stats.get(container_id) for container_id in ids]
+
+        threads = int(self.config['stats_threads'])
+        if threads <= 0:
+            stats = []
+            for container in containers:
+                s = client.stats(container["Id"])
+                stats.append(json.loads(s.next()))
+                s.close()
+            return stats
+
+        if not containers:
+            return []
+        threads = min(threads, len(containers))
+        # stats_timeout only bounds every socket operation, so the stats of
+        # all the containers are waited for stats_timeout seconds for every
+        # container a thread fetches, in total
+        rounds = (len(containers) + threads - 1) // threads
+        deadline = time.time() + float(self.config['stats_timeout']) * rounds
+        pool = ThreadPool(threads)
+        try:
+            results = [pool.apply_async(self.fetch_stats, (client, c))
+                       for c in containers]
+            stats = []
+            for container, result in zip(containers, results):
+                try:
+                    # Waiting with a timeout, so the scheduler can still
+                    # interrupt the collector
+                    stats.append(result.get(max(deadline - time.time(), 0)))
+                except TimeoutError:
+                    self.log.warning('Timed out getting the stats of '
+                                     'container %s', container['Id'])
+                    stats.append(None)
+        finally:
+            # Rather than joined, the threads still waiting for a container
+            # are left to time out on their own
+            pool.terminate()
+        return stats
+
     def collect(self):
-        if docker is None:
+        use_api = (int(self.config['stats_threads']) > 0 or
+                   self.config['stats_backend'] == 'cgroup')
+        if docker is None and not use_api:
             self.log.error('Unable to import docker')
 
         try:
             # Collect info
             results = {}
-            client = docker.Client(version='auto')
+            if use_api:
+                client = DockerAPI(self.config['docker_url'],
+                                   float(self.config['stats_timeout']))
+            else:
+                client = docker.Client(version='auto')
 
             # Top level stats
             running_containers = client.containers()
@@ -83,16 +266,16 @@ class DockerCollector(diamond.collector.Collector):
             results['images_dangling_count'] = (dangling_images_count, 'GAUGE')
 
             # Collect memory and cpu stats
-            for container in running_containers:
+            stats = self.get_stats(client, running_containers)
+            for container, stat in zip(running_containers, stats):
+                if stat is None:
+                    continue
                 name = "containers." + "".join(container['Names'][0][1:])
-                s = client.stats(container["Id"])
-                stat = json.loads(s.next())
                 for path in self.METRICS:
                     val = self.get_value(path, stat)
                     if val is not None:
                         metric_key = ".".join([name, self.METRICS.get(path)])
                         results[metric_key] = (val, 'GAUGE')
-                s.close()
 
             for name in sorted(results.keys()):
                 (value, metric_type) = results[name]
@@ -3,10 +3,18 @@
 ##########################################################################
 import os
 import json
+import shutil
+import tempfile
+import threading
+import time
+import urlparse
+import BaseHTTPServer
+import SocketServer
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
 from test import run_only
+from mock import patch
 
 try:
     from docker import Client
@@ -58,5 +66,200 @@ class TestDockerCollector(CollectorTestCase):
             val = self.collector.get_value(path, stat)
             self.assertTrue(val is None)
 
+
+class FakeDockerServer(SocketServer.ThreadingMixIn,
+                       SocketServer.UnixStreamServer):
+    """
+    Docker API on a unix socket, taking a while to return the stats of the
+    containers
+    """
+    daemon_threads = True
+
+    def __init__(self, path, containers, stopped, delays):
+        SocketServer.UnixStreamServer.__init__(self, path,
+                                               FakeDockerHandler)
+        self.containers = containers
+        self.stopped = stopped
+        self.delays = delays
+        # The containers whose stats are written a few bytes at a time
+        self.trickle = set()
+        self.paths = []
+        self.stat = open(os.path.join(fixtures_path, 'example.stat')).read()
+
+
+class FakeDockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(url.query)
+        server = self.server
+        server.paths.append(url.path)
+        if url.path == '/containers/json':
+            containers = server.containers
+            if query['all'] == ['1']:
+                containers = containers + server.stopped
+            body = json.dumps(containers)
+        elif url.path == '/images/json':
+            images = [{'Id': 'sha256:1'}]
+            if 'filters' not in query:
+                images.append({'Id': 'sha256:2'})
+            body = json.dumps(images)
+        else:
+            self.assertStats(query)
+            container = url.path.split('/')[2]
+            time.sleep(server.delays.get(container, 0))
+            body = server.stat
+            if container in server.trickle:
+                self.send_headers()
+                for i in range(0, len(body), 100):
+                    self.wfile.write(body[i:i + 100])
+                    self.wfile.flush()
+                    time.sleep(0.2)
+                return
+
+        self.send_headers()
+        self.wfile.write(body)
+
+    def send_headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+
+    def assertStats(self, query):
+        if query['stream'] != ['false']:
+            raise AssertionError('Streamed stats requested')
+
+    def address_string(self):
+        return 'docker'
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDockerCollectorConcurrent(CollectorTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        socket_path = os.path.join(self.path, 'docker.sock')
+
+        containers = [{'Id': 'id%d' % i, 'Names': ['/web%d' % i]}
+                      for i in range(6)]
+        containers.append({'Id': 'idslow', 'Names': ['/slow']})
+        delays = dict(('id%d' % i, 0.3) for i in range(6))
+        delays['idslow'] = 3
+        self.server = FakeDockerServer(socket_path, containers,
+                                       [{'Id': 'idstopped'}], delays)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+        config = get_collector_config('DockerCollector', {
+            'interval': 10,
+            'stats_threads': 8,
+            'stats_timeout': 1,
+            'docker_url': 'unix://' + socket_path,
+        })
+        self.collector = DockerCollector(config, None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    @patch.object(Collector, 'publish')
+    def test_concurrent_stats(self, publish_mock):
+        start = time.time()
+        self.collector.collect()
+        # The containers are fetched in parallel, the slow one times out
+        self.assertTrue(time.time() - start < 1.5)
+
+        self.assertPublishedMany(publish_mock, {
+            'containers_running_count': 7,
+            'containers_stopped_count': 1,
+            'images_count': 2,
+            'images_dangling_count': 1,
+            'containers.web0.RSS_byte': 54120448,
+            'containers.web5.cpu.total': 131435455248,
+        })
+        self.assertEqual(
+            [c[0][0] for c in publish_mock.call_args_list
+             if c[0][0].startswith('containers.slow')], [])
+
+    @patch.object(Collector, 'publish')
+    def test_stats_deadline(self, publish_mock):
+        # Every read of the response is quicker than stats_timeout, the
+        # whole of it isn't
+        self.server.trickle.add('id0')
+        start = time.time()
+        self.collector.collect()
+        self.assertTrue(time.time() - start < 1.5)
+
+        self.assertPublishedMany(publish_mock, {
+            'containers_running_count': 7,
+            'containers.web1.RSS_byte': 54120448,
+        })
+        self.assertEqual(
+            [c[0][0] for c in publish_mock.call_args_list
+             if c[0][0].startswith('containers.web0')], [])
+
+
+class TestDockerCollectorCgroup(CollectorTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        socket_path = os.path.join(self.path, 'docker.sock')
+        containers = [{'Id': 'id%d' % i, 'Names': ['/web%d' % i]}
+                      for i in range(2)]
+        self.server = FakeDockerServer(socket_path, containers, [], {})
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+        cgroup_path = os.path.join(self.path, 'cgroup')
+        for i, cgroup in enumerate(['docker/id0',
+                                    'system.slice/docker-id1.scope']):
+            memory = os.path.join(cgroup_path, 'memory', cgroup)
+            cpuacct = os.path.join(cgroup_path, 'cpuacct', cgroup)
+            os.makedirs(memory)
+            os.makedirs(cpuacct)
+            self.write(memory, 'memory.stat',
+                       'total_rss %d\ntotal_cache 20\n' % (100 + i))
+            self.write(cpuacct, 'cpuacct.usage', '5000\n')
+
+        config = get_collector_config('DockerCollector', {
+            'interval': 10,
+            'stats_backend': 'cgroup',
+            'cgroup_path': cgroup_path,
+            'docker_url': 'unix://' + socket_path,
+        })
+        self.collector = DockerCollector(config, None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def write(self, directory, name, content):
+        f = open(os.path.join(directory, name), 'w')
+        f.write(content)
+        f.close()
+
+    @patch.object(Collector, 'publish')
+    def test_cgroup_stats(self, publish_mock):
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'containers_running_count': 2,
+            'containers.web0.RSS_byte': 100,
+            'containers.web0.cache_byte': 20,
+            'containers.web1.RSS_byte': 101,
+            'containers.web1.cpu.total': 5000,
+        })
+        # Only the lists of containers and images were requested
+        self.assertEqual(sorted(set(self.server.paths)),
+                         ['/containers/json', '/images/json'])
+
 if __name__ == "__main__":
     unittest.main()
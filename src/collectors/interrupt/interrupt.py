@@ -56,6 +56,11 @@ class InterruptCollector(diamond.collector.Collector):
         file = open(self.PROC, 'r')
         # Get data
         cpuCount = None
+        names = []
+        values = []
+        # Either a single counter or the name of the total of a range of per
+        # CPU counters
+        entries = []
         for line in file:
             if not cpuCount:
                 cpuCount = len(line.split())
@@ -66,10 +71,9 @@ class InterruptCollector(diamond.collector.Collector):
                 if len(data) == 2:
                     metric_name = data[0]
                     metric_value = data[1]
-                    self.publish(metric_name,
-                                 self.derivative(metric_name,
-                                                 long(metric_value),
-                                                 counter))
+                    entries.append((None, len(names)))
+                    names.append(metric_name)
+                    values.append(long(metric_value))
                 else:
                     if len(data[0]) == cpuCount + 1:
                         metric_name = data[0] + '.'
@@ -83,20 +87,30 @@ class InterruptCollector(diamond.collector.Collector):
                             '.' +
                             ((data[-1]).replace(', ', '-').replace(' ', '_')) +
                             '.' + data[0] + '.')
-                    total = 0
+                    start = len(names)
                     for index, value in enumerate(data):
                         if index == 0 or index >= cpuCount + 1:
                             continue
 
-                        metric_name_node = metric_name + 'CPU' + str(index - 1)
-                        value = int(self.derivative(metric_name_node,
-                                                    long(value), counter))
-                        total += value
-                        self.publish(metric_name_node, value)
-
-                    # Roll up value
-                    metric_name_node = metric_name + 'total'
-                    self.publish(metric_name_node, total)
+                        names.append(metric_name + 'CPU' + str(index - 1))
+                        values.append(long(value))
+                    entries.append((metric_name + 'total', start))
 
         # Close file
         file.close()
+
+        rates = self.derivatives(names, values, counter)
+        ends = [entry[1] for entry in entries[1:]] + [len(names)]
+        for (total_name, start), end in zip(entries, ends):
+            if total_name is None:
+                self.publish(names[start], rates[start])
+                continue
+
+            total = 0
+            for index in xrange(start, end):
+                value = int(rates[index])
+                total += value
+                self.publish(names[index], value)
+
+            # Roll up value
+            self.publish(total_name, total)
@@ -46,6 +46,14 @@ an mbean.
     "-v\d+\.\d+\.\d+" = "-AllVersions"
     ".*GetS2Activities.*" = ""
 ```
+
+#### Bulk requests
+
+With ```bulk``` set to True, the domains are read with bulk POST requests,
+```bulk_size``` domains in every request, rather than a GET request per
+domain. The connection to Jolokia is kept alive between the runs of the
+collector. The listing of the domains is refreshed every
+```domains_refresh``` seconds, either way.
 Netuitive Change History
     2016/10/25 DVG - Updated the clean_up() function to provide a cleaner default
                      way of formatting the metric names. See comments inline for 
@@ -53,10 +61,17 @@ Netuitive Change History
 """
 
 import diamond.collector
+from diamond.collector import str_to_bool
+from diamond.handler.httptransport import HttpError
+from diamond.handler.httptransport import HttpTransport
 import base64
 from contextlib import closing
+import httplib
+from itertools import izip
 import json
 import re
+import socket
+import time
 import urllib
 import urllib2
 import string
@@ -102,6 +117,13 @@ class JolokiaCollector(diamond.collector.Collector):
                                    ' Default is "True',
             'jolokia_path': 'Path to jolokia.  typically "jmx" or "jolokia".'
                             ' Defaults to the value of "path" variable.',
+            'bulk': 'Read the domains with bulk POST requests over a'
+                    ' connection kept alive, rather than with a GET request'
+                    ' per domain',
+            'bulk_size': 'Most domains read by a bulk request, 0 reads all'
+                         ' of them at once',
+            'domains_refresh': 'Seconds before the listing of the domains is'
+                               ' refreshed, 0 lists them once',
         })
         return config_help
 
@@ -118,6 +140,9 @@ class JolokiaCollector(diamond.collector.Collector):
             'host': 'localhost',
             'port': 8778,
             'use_canonical_names': True,
+            'bulk': False,
+            'bulk_size': 20,
+            'domains_refresh': 600,
         })
         return config
 
@@ -149,24 +174,39 @@ class JolokiaCollector(diamond.collector.Collector):
             elif isinstance(self.config['domains'], list):
                 self.domains = self.config['domains']
 
+        # The domains are listed unless configured, and when last listed
+        self.list_domains = not self.domains
+        self.domains_listed = None
+
         if self.config['jolokia_path'] is not None:
             self.jolokia_path = self.config['jolokia_path']
         else:
             self.jolokia_path = self.config['path']
 
+        # Keeps the connection to Jolokia alive in bulk mode
+        self.transport = None
+
     def _get_domains(self):
         # if not set it __init__
-        if not self.domains:
-            listing = self._list_request()
-            try:
-                if listing['status'] == 200:
-                    self.domains = listing['value'].keys()
-                else:
-                    self.log.error('Jolokia status %s while retrieving MBean '
-                                   'listing.', listing['status'])
-            except KeyError:
-                # The reponse was totally empty, or not an expected format
-                self.log.error('Unable to retrieve MBean listing.')
+        if not self.list_domains:
+            return
+        refresh = float(self.config['domains_refresh'])
+        if self.domains_listed is not None and (
+                refresh <= 0 or time.time() - self.domains_listed < refresh):
+            return
+
+        # The domains last listed are kept when the listing fails
+        listing = self._list_request()
+        try:
+            if listing['status'] == 200:
+                self.domains = listing['value'].keys()
+                self.domains_listed = time.time()
+            else:
+                self.log.error('Jolokia status %s while retrieving MBean '
+                               'listing.', listing['status'])
+        except KeyError:
+            # The reponse was totally empty, or not an expected format
+            self.log.error('Unable to retrieve MBean listing.')
 
     def _check_mbean(self, mbean):
         if not self.mbeans:
@@ -184,25 +224,33 @@ class JolokiaCollector(diamond.collector.Collector):
                 return True
 
     def collect(self):
-        if not self.domains:
-            self._get_domains()
+        self._get_domains()
+        domains = []
         for domain in self.domains:
             if domain not in self.IGNORE_DOMAINS:
-                obj = self._read_request(domain)
-                try:
-                    mbeans = obj['value'] if obj['status'] == 200 else {}
-                except KeyError:
-                    # The reponse was totally empty, or not an expected format
-                    self.log.error('Unable to retrieve MBeans for domain %s.', domain)
-                    continue
-                for k, v in mbeans.iteritems():
-                    if self._check_mbean(k):
-                        self.collect_bean(k, v)
-                    else:
-                        self.log.debug('Not collecting from MBean ' + k)
+                domains.append(domain)
             else:
                 self.log.debug('Ignoring domain ' + domain)
 
+        if str_to_bool(self.config['bulk']):
+            responses = self._bulk_read_request(domains)
+        else:
+            responses = (self._read_request(domain) for domain in domains)
+
+        for domain, obj in izip(domains, responses):
+            try:
+                mbeans = obj['value'] if obj['status'] == 200 else {}
+            except KeyError:
+                # The reponse was totally empty, or not an expected format
+                self.log.error('Unable to retrieve MBeans for domain %s.',
+                               domain)
+                continue
+            for k, v in mbeans.iteritems():
+                if self._check_mbean(k):
+                    self.collect_bean(k, v)
+                else:
+                    self.log.debug('Not collecting from MBean ' + k)
+
     def _read_json(self, request):
         json_str = request.read()
         return json.loads(json_str)
@@ -224,13 +272,15 @@ class JolokiaCollector(diamond.collector.Collector):
                 self.config['port'],
                 self.jolokia_path,
                 self.LIST_URL)
-            # need some time to process the downloaded metrics, so that's why
-            # timeout is lower than the interval.
-            timeout = max(2, float(self.config['interval']) * 2 / 3)
+            if str_to_bool(self.config['bulk']):
+                response = self._get_transport().request(
+                    'GET', url, headers=self._auth_headers())
+                return json.loads(response.body)
             with closing(urllib2.urlopen(self._create_request(url),
-                                         timeout=timeout)) as response:
+                                         timeout=self._timeout())) as response:
                 return self._read_json(response)
-        except (urllib2.HTTPError, ValueError) as e:
+        except (urllib2.HTTPError, HttpError, socket.error,
+                httplib.HTTPException, ValueError) as e:
             self.log.error('Unable to read JSON response: %s', str(e))
             return {}
 
@@ -247,16 +297,66 @@ class JolokiaCollector(diamond.collector.Collector):
                                          self.config['port'],
                                          self.jolokia_path,
                                          url_path)
-            # need some time to process the downloaded metrics, so that's why
-            # timeout is lower than the interval.
-            timeout = max(2, float(self.config['interval']) * 2 / 3)
             with closing(urllib2.urlopen(self._create_request(url),
-                                         timeout=timeout)) as response:
+                                         timeout=self._timeout())) as response:
                 return self._read_json(response)
         except (urllib2.HTTPError, ValueError):
             self.log.error('Unable to read JSON response.')
             return {}
 
+    def _bulk_read_request(self, domains):
+        """
+        Read the MBeans of the domains with bulk requests, bulk_size domains
+        at a time. Returns the response for every domain, in their order,
+        an empty one when its request failed
+        """
+        url = "http://%s:%s/%s/" % (self.config['host'],
+                                    self.config['port'],
+                                    self.jolokia_path)
+        headers = self._auth_headers()
+        headers['Content-Type'] = 'application/json'
+        config = {
+            'maxCollectionSize': 0,
+            'ignoreErrors': True,
+            'canonicalNaming': str_to_bool(self.config['use_canonical_names']),
+        }
+        size = int(self.config['bulk_size']) or len(domains)
+
+        responses = []
+        for i in range(0, len(domains), size):
+            chunk = domains[i:i + size]
+            body = json.dumps([{'type': 'read',
+                                'mbean': '%s:*' % domain,
+                                'config': config} for domain in chunk])
+            try:
+                response = self._get_transport().post(url, body, headers)
+                results = json.loads(response.body)
+            except (HttpError, socket.error, httplib.HTTPException,
+                    ValueError) as e:
+                self.log.error('Unable to read JSON response: %s', str(e))
+                results = None
+
+            # The response to a bulk request is a list with the response of
+            # every read, anything else is an error about the whole request
+            if not isinstance(results, list) or len(results) != len(chunk):
+                if results is not None:
+                    self.log.error('Unexpected response to a bulk read '
+                                   'request: %s', str(results)[:200])
+                results = [{}] * len(chunk)
+            responses.extend(results)
+        return responses
+
+    def _get_transport(self):
+        if self.transport is None:
+            self.transport = HttpTransport(timeout=self._timeout(),
+                                           retries=0, log=self.log)
+        return self.transport
+
+    def _timeout(self):
+        # need some time to process the downloaded metrics, so that's why
+        # timeout is lower than the interval.
+        return max(2, float(self.config['interval']) * 2 / 3)
+
     # escape JMX domain per https://jolokia.org/reference/html/protocol.html
     # the Jolokia documentation suggests that when using the p query parameter,
     # simply urlencoding should be sufficient, but in practice, the '!' appears
@@ -270,13 +370,19 @@ class JolokiaCollector(diamond.collector.Collector):
 
     def _create_request(self, url):
         req = urllib2.Request(url)
+        for name, value in self._auth_headers().items():
+            req.add_header(name, value)
+        return req
+
+    def _auth_headers(self):
+        headers = {}
         username = self.config["username"]
         password = self.config["password"]
         if username is not None and password is not None:
             base64string = base64.encodestring('%s:%s' % (
                 username, password)).replace('\n', '')
-            req.add_header("Authorization", "Basic %s" % base64string)
-        return req
+            headers["Authorization"] = "Basic %s" % base64string
+        return headers
 
     #####################################################################
     #
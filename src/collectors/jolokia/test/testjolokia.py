@@ -7,7 +7,13 @@ from test import get_collector_config
 from test import unittest
 from mock import Mock
 from mock import patch
+import BaseHTTPServer
+import json
+import os
 import re
+import SocketServer
+import threading
+import urlparse
 
 from diamond.collector import Collector
 
@@ -165,6 +171,178 @@ class TestJolokiaCollector(CollectorTestCase):
             prefix + '.memUsedBeforeGc.Par_Survivor_Space.used': 414088
         }
 
+
+class FakeJolokia(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Answers list, read and bulk read requests like the Jolokia agent, from
+    a listing and the MBeans of every domain
+    """
+    daemon_threads = True
+
+    def __init__(self, listing, domains):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           FakeJolokiaHandler)
+        self.listing = listing
+        self.domains = domains
+        self.requests = []
+        self.connections = set()
+        # Answers every bulk request with this error when set
+        self.error = None
+
+    def process_request(self, request, client_address):
+        self.connections.add(client_address)
+        SocketServer.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+    def read(self, mbean):
+        domain = mbean.split(':')[0]
+        if domain not in self.domains:
+            return {'status': 404, 'error_type': 'InstanceNotFoundException',
+                    'request': {'type': 'read', 'mbean': mbean}}
+        return self.domains[domain]
+
+
+class FakeJolokiaHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(url.query)
+        self.server.requests.append(('GET', url.path, query))
+        if url.path == '/jolokia/list':
+            self.respond(self.server.listing)
+        else:
+            self.respond(self.server.read(query['p'][0][len('read/'):-2]))
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))
+        self.server.requests.append(('POST', self.path, body))
+        if self.server.error:
+            self.respond(self.server.error)
+            return
+        self.respond([self.server.read(request['mbean'])
+                      for request in body])
+
+    def respond(self, obj):
+        data = json.dumps(obj)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestJolokiaCollectorBulk(CollectorTestCase):
+
+    def setUp(self):
+        stats = json.loads(self.getFixture('stats').getvalue())
+        listing = json.loads(self.getFixture('listing').getvalue())
+        # More domains to read, and one the agent doesn't know about
+        for domain in ('java.nio', 'com.example', 'org.example'):
+            listing['value'][domain] = {}
+        listing['value']['jolokia'] = {}
+        self.server = FakeJolokia(listing, {
+            'java.lang': stats,
+            'java.nio': {'status': 200, 'value': {
+                'java.nio:name=direct,type=BufferPool': {'Count': 3}}},
+            'com.example': {'status': 200, 'value': {
+                'com.example:type=Queue': {'Size': 7}}},
+        })
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        # Don't go through a proxy set in the environment
+        self.environ = patch.dict(os.environ, {'no_proxy': '127.0.0.1'})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_collector(self, **config):
+        config['host'] = '127.0.0.1'
+        config['port'] = self.server.server_address[1]
+        collector = JolokiaCollector(
+            get_collector_config('JolokiaCollector', config), None)
+        collector.publish = Mock()
+        return collector
+
+    def published(self, collector):
+        return dict(c[0][:2] for c in collector.publish.call_args_list)
+
+    def test_bulk_read(self):
+        collector = self.create_collector()
+        collector.collect()
+        expected = self.published(collector)
+        self.assertEqual(expected['java.nio.BufferPool.directCount'], 3)
+        self.assertEqual(expected['com.example.QueueSize'], 7)
+        del self.server.requests[:]
+
+        collector = self.create_collector(bulk=True, bulk_size=2)
+        collector.collect()
+        self.assertEqual(self.published(collector), expected)
+
+        requests = self.server.requests
+        self.assertEqual([r[:2] for r in requests], [
+            ('GET', '/jolokia/list'),
+            ('POST', '/jolokia/'),
+            ('POST', '/jolokia/'),
+        ])
+        self.assertEqual(sorted(read['mbean'] for r in requests[1:]
+                                for read in r[2]),
+                         ['com.example:*', 'java.lang:*', 'java.nio:*',
+                          'org.example:*'])
+        self.assertEqual(requests[1][2][0]['config']['ignoreErrors'], True)
+
+    def test_keep_alive(self):
+        collector = self.create_collector(bulk=True)
+        connections = len(self.server.connections)
+        for i in range(3):
+            collector.collect()
+        self.assertEqual(len([r for r in self.server.requests
+                              if r[0] == 'POST']), 3)
+        self.assertEqual(len(self.server.connections) - connections, 1)
+
+    def test_domains_refresh(self):
+        collector = self.create_collector(bulk=True, domains_refresh=600)
+        collector.collect()
+        collector.collect()
+        self.assertEqual(len([r for r in self.server.requests
+                              if r[1] == '/jolokia/list']), 1)
+
+        # Listed again once the refresh period is over
+        self.server.listing['value']['org.example.new'] = {}
+        collector.domains_listed -= 600
+        collector.collect()
+        self.assertEqual(len([r for r in self.server.requests
+                              if r[1] == '/jolokia/list']), 2)
+        self.assertTrue('org.example.new' in collector.domains)
+
+    def test_configured_domains(self):
+        collector = self.create_collector(bulk=True, domains='java.nio')
+        collector.collect()
+        self.assertEqual([r[:2] for r in self.server.requests],
+                         [('POST', '/jolokia/')])
+        self.assertEqual(self.published(collector),
+                         {'java.nio.BufferPool.directCount': 3})
+
+    def test_bulk_request_error(self):
+        collector = self.create_collector(bulk=True)
+        collector.collect()
+        collector.log = Mock()
+        collector.publish.reset_mock()
+        # A whole request failing, with a single error
+        self.server.error = {'status': 403, 'error': 'POST not allowed'}
+        collector.collect()
+        self.assertFalse(collector.publish.called)
+        self.assertTrue(collector.log.error.called)
+
 ##########################################################################
 if __name__ == "__main__":
     unittest.main()
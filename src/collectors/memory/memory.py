@@ -46,6 +46,7 @@ _KEY_MAPPING = [
 class MemoryCollector(diamond.collector.Collector):
 
     PROC = '/proc/meminfo'
+    SHAREABLE = True
 
     def get_default_config_help(self):
         config_help = super(MemoryCollector, self).get_default_config_help()
@@ -22,6 +22,9 @@ swap  - # of bytes of swap usage
 
 Metrics with total_ prefixes - summarized data from children CGroups.
 
+On hosts with the v2 unified hierarchy only, the memory_path defaults to its
+mount point and the anon and file stats are published as rss and cache.
+
 #### Dependencies
 
 /sys/fs/cgroup/memory/memory.stat
@@ -30,7 +33,8 @@ Metrics with total_ prefixes - summarized data from children CGroups.
 import diamond.collector
 import diamond.convertor
 import os
-import re
+from diamond.utils.cgroups import CGROUP_ROOT
+from diamond.utils.filters import MetricFilter
 
 _KEY_MAPPING = [
     'cache',
@@ -41,22 +45,29 @@ _KEY_MAPPING = [
     'total_swap',
 ]
 
+# The names of the stats in the memory.stat of cgroup v2
+_V2_KEY_MAPPING = {
+    'anon': 'rss',
+    'file': 'cache',
+}
+
 
 class MemoryCgroupCollector(diamond.collector.Collector):
 
     def process_config(self):
         super(MemoryCgroupCollector, self).process_config()
         self.memory_path = self.config['memory_path']
+        if (not os.path.isdir(self.memory_path) and
+                os.path.exists(os.path.join(CGROUP_ROOT,
+                                            'cgroup.controllers'))):
+            self.memory_path = CGROUP_ROOT + '/'
         self.skip = self.config['skip']
         if not isinstance(self.skip, list):
             self.skip = [self.skip]
-        self.skip = [re.compile(e) for e in self.skip]
+        self.skip_filter = MetricFilter(self.skip, anchored=False)
 
     def should_skip(self, path):
-        for skip_re in self.skip:
-            if skip_re.search(path):
-                return True
-        return False
+        return self.skip_filter.matches(path)
 
     def get_default_config_help(self):
         config_help = super(
@@ -102,6 +113,7 @@ class MemoryCgroupCollector(diamond.collector.Collector):
 
             for el in elements:
                 name, value = el
+                name = _V2_KEY_MAPPING.get(name, name)
                 if name not in _KEY_MAPPING:
                     continue
                 for unit in self.config['byte_unit']:
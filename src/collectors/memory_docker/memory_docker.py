@@ -40,5 +40,9 @@ class MemoryDockerCollector(MemoryCgroupCollector):
             metric_name = metric_name.replace(
                 'docker.' + container_id + '.',
                 'docker.' + container_name + '.')
+            # The cgroups of the systemd cgroup driver
+            metric_name = metric_name.replace(
+                'docker-' + container_id + '.scope.',
+                'docker.' + container_name + '.')
         return super(MemoryDockerCollector, self).publish(
             metric_name, value, metric_type)
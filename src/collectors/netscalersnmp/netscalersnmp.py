@@ -203,11 +203,16 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
         # Set timestamp
         timestamp = time.time()
 
+        # Get the Netscaler System OIDs in one go
+        systemData = self.get_many(
+            self.NETSCALER_SYSTEM_GUAGES.values() +
+            self.NETSCALER_SYSTEM_COUNTERS.values(), host, port, community)
+
         # Collect Netscaler System OIDs
         for k, v in self.NETSCALER_SYSTEM_GUAGES.items():
             # Get Metric Name and Value
             metricName = '.'.join([k])
-            metricValue = int(self.get(v, host, port, community)[v])
+            metricValue = int(systemData[v])
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Create Metric
@@ -222,8 +227,8 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Get Metric Value
-            metricValue = self.derivative(metricPath, long(
-                self.get(v, host, port, community)[v]), self.MAX_VALUE)
+            metricValue = self.derivative(metricPath, long(systemData[v]),
+                                          self.MAX_VALUE)
             # Create Metric
             metric = Metric(metricPath, metricValue, timestamp, 0)
             # Publish Metric
@@ -237,13 +242,20 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
             # Get Service Name in OID form
             serviceNameOid = self.get_string_index_oid(serviceName)
 
-            # Get Service Type
+            # Get the Service Type, State and Gauges in one go
             serviceTypeOid = ".".join([self.NETSCALER_SERVICE_TYPE,
                                        self._convert_from_oid(serviceNameOid)])
-            serviceType = int(self.get(serviceTypeOid,
-                                       host,
-                                       port,
-                                       community)[serviceTypeOid].strip("\'"))
+            serviceStateOid = ".".join([self.NETSCALER_SERVICE_STATE,
+                                        self._convert_from_oid(serviceNameOid)])
+            serviceGuageOids = dict(
+                (k, ".".join([v, self._convert_from_oid(serviceNameOid)]))
+                for k, v in self.NETSCALER_SERVICE_GUAGES.items())
+            serviceData = self.get_many(
+                [serviceTypeOid, serviceStateOid] + serviceGuageOids.values(),
+                host, port, community)
+
+            # Get Service Type
+            serviceType = int(serviceData[serviceTypeOid].strip("\'"))
 
             # Filter excluded service types
             if serviceType in map(lambda v: int(v),
@@ -251,29 +263,18 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
                 continue
 
             # Get Service State
-            serviceStateOid = ".".join([self.NETSCALER_SERVICE_STATE,
-                                        self._convert_from_oid(serviceNameOid)])
-            serviceState = int(self.get(serviceStateOid,
-                                        host,
-                                        port,
-                                        community)[serviceStateOid].strip("\'"))
+            serviceState = int(serviceData[serviceStateOid].strip("\'"))
 
             # Filter excluded service states
             if serviceState in map(lambda v: int(v),
                                    self.config.get('exclude_service_state')):
                 continue
 
-            for k, v in self.NETSCALER_SERVICE_GUAGES.items():
-                serviceGuageOid = ".".join(
-                    [v, self._convert_from_oid(serviceNameOid)])
+            for k, oid in serviceGuageOids.items():
                 # Get Metric Name
                 metricName = '.'.join([re.sub(r'\.|\\', '_', serviceName), k])
                 # Get Metric Value
-                metricValue = int(self.get(serviceGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[serviceGuageOid].strip("\'"))
+                metricValue = int(serviceData[oid].strip("\'"))
                 # Get Metric Path
                 metricPath = '.'.join(['devices',
                                        device,
@@ -292,43 +293,39 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
             # Get Vserver Name in OID form
             vserverNameOid = self.get_string_index_oid(vserverName)
 
-            # Get Vserver Type
+            # Get the Vserver Type, State and Gauges in one go
             vserverTypeOid = ".".join([self.NETSCALER_VSERVER_TYPE,
                                        self._convert_from_oid(vserverNameOid)])
-            vserverType = int(self.get(vserverTypeOid,
-                                       host,
-                                       port,
-                                       community)[vserverTypeOid].strip("\'"))
+            vserverStateOid = ".".join([self.NETSCALER_VSERVER_STATE,
+                                        self._convert_from_oid(vserverNameOid)])
+            vserverGuageOids = dict(
+                (k, ".".join([v, self._convert_from_oid(vserverNameOid)]))
+                for k, v in self.NETSCALER_VSERVER_GUAGES.items())
+            vserverData = self.get_many(
+                [vserverTypeOid, vserverStateOid] + vserverGuageOids.values(),
+                host, port, community)
+
+            # Get Vserver Type
+            vserverType = int(vserverData[vserverTypeOid].strip("\'"))
 
             # filter excluded vserver types
             if vserverType in map(lambda v: int(v),
                                   self.config.get('exclude_vserver_type')):
                 continue
 
-            # Get Service State
-            vserverStateOid = ".".join([self.NETSCALER_VSERVER_STATE,
-                                        self._convert_from_oid(vserverNameOid)])
-            vserverState = int(self.get(vserverStateOid,
-                                        host,
-                                        port,
-                                        community)[vserverStateOid].strip("\'"))
+            # Get Vserver State
+            vserverState = int(vserverData[vserverStateOid].strip("\'"))
 
             # Filter excluded vserver state
             if vserverState in map(lambda v: int(v),
                                    self.config.get('exclude_vserver_state')):
                 continue
 
-            for k, v in self.NETSCALER_VSERVER_GUAGES.items():
-                vserverGuageOid = ".".join(
-                    [v, self._convert_from_oid(vserverNameOid)])
+            for k, oid in vserverGuageOids.items():
                 # Get Metric Name
                 metricName = '.'.join([re.sub(r'\.|\\', '_', vserverName), k])
                 # Get Metric Value
-                metricValue = int(self.get(vserverGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[vserverGuageOid].strip("\'"))
+                metricValue = int(vserverData[oid].strip("\'"))
                 # Get Metric Path
                 metricPath = '.'.join(['devices',
                                        device,
@@ -10,6 +10,7 @@ try:
 except ImportError:
     import simplejson as json
 from diamond.collector import str_to_bool
+from diamond.utils.cgroups import ContainerCgroups
 from datetime import datetime
 
 
@@ -20,6 +21,10 @@ class NetuitiveDockerCollector(diamond.collector.Collector):
             NetuitiveDockerCollector, self).get_default_config_help()
         config_help.update({
             'simple': 'Only collect total metrics for CPU, Memory',
+            'stats_backend': 'Where the stats of the containers come from, '
+                             'api for the docker API or cgroup to read them '
+                             'from the cgroups of the containers',
+            'cgroup_path': 'Mount point of the cgroups',
         })
         return config_help
 
@@ -35,10 +40,18 @@ class NetuitiveDockerCollector(diamond.collector.Collector):
             # Minimal mode locally computes and publishes only `container_memory_percent` and `container_cpu_percent`
             # Minimal mode overrides simple mode
             'minimal':   'False',
-            'uptime':   'False'
+            'uptime':   'False',
+            # The cgroup backend reads the stats from the cgroups of the
+            # containers rather than with a request per container
+            'stats_backend': 'api',
+            'cgroup_path': '/sys/fs/cgroup',
         })
         return config
 
+    def process_config(self):
+        super(NetuitiveDockerCollector, self).process_config()
+        self.cgroups = None
+
     def flatten_dict(self, d):
         def items():
             for key, value in d.items():
@@ -60,9 +73,7 @@ class NetuitiveDockerCollector(diamond.collector.Collector):
                         return False
             return True
 
-        def print_metric(cc, name):
-            data = cc.stats(name)
-            metrics = json.loads(data.next())
+        def print_metric(name, metrics):
             # memory metrics
             self.memory = self.flatten_dict(metrics['memory_stats'])
             for key, value in self.memory.items():
@@ -110,9 +121,7 @@ class NetuitiveDockerCollector(diamond.collector.Collector):
                     metric_name = name + ".blkio." + key
                     self.publish_counter(metric_name, value)
 
-        def print_minimal_metric(cc, name):
-            data = cc.stats(name)
-            metrics = json.loads(data.next())
+        def print_minimal_metric(name, metrics):
             # memory metrics
             self.memory = self.flatten_dict(metrics['memory_stats'])
 
@@ -154,12 +163,24 @@ class NetuitiveDockerCollector(diamond.collector.Collector):
         self.publish('counts.images', image_count)
         self.publish('counts.dangling_images', dangling_image_count)
 
+        stats = None
+        if self.config['stats_backend'] == 'cgroup':
+            if self.cgroups is None:
+                self.cgroups = ContainerCgroups(self.config['cgroup_path'])
+            stats = self.cgroups.stats([did for dname, did in dockernames])
+
         for dname, did in dockernames:
             name = next(n for n in dname if n.count('/') == 1)
             try:
                 if str_to_bool(self.config['uptime']):
                     collect_uptime(name[1:], cc.inspect_container(did)['State']['StartedAt'])
-                print_minimal_metric(cc, name[1:]) if str_to_bool(self.config['minimal']) else print_metric(cc, name[1:])
+                if stats is None:
+                    metrics = json.loads(cc.stats(name[1:]).next())
+                elif did in stats:
+                    metrics = stats[did]
+                else:
+                    continue
+                print_minimal_metric(name[1:], metrics) if str_to_bool(self.config['minimal']) else print_metric(name[1:], metrics)
             except Exception as e:
                 self.log.error('Unable to collect for container ' +
                                name[1:] + ': ' + traceback.format_exc())
@@ -25,6 +25,7 @@ except ImportError:
 class NetworkCollector(diamond.collector.Collector):
 
     PROC = '/proc/net/dev'
+    SHAREABLE = True
 
     def get_default_config_help(self):
         config_help = super(NetworkCollector, self).get_default_config_help()
@@ -117,27 +118,31 @@ class NetworkCollector(diamond.collector.Collector):
                     results[device]['rx_packets'] = network_stat.packets_recv
                     results[device]['tx_packets'] = network_stat.packets_sent
 
+        names = []
+        values = []
         for device in results:
             stats = results[device]
             for s, v in stats.items():
                 # Get Metric Name
-                metric_name = '.'.join([device, s])
-                # Get Metric Value
-                metric_value = self.derivative(metric_name,
-                                               long(v),
-                                               diamond.collector.MAX_COUNTER)
-
-                # Convert rx_bytes and tx_bytes
-                if s == 'rx_bytes' or s == 'tx_bytes':
-                    convertor = diamond.convertor.binary(value=metric_value,
-                                                         unit='byte')
-
-                    for u in self.config['byte_unit']:
-                        # Public Converted Metric
-                        self.publish(metric_name.replace('bytes', u),
-                                     convertor.get(unit=u), 2)
-                else:
-                    # Publish Metric Derivative
-                    self.publish(metric_name, metric_value)
+                names.append('.'.join([device, s]))
+                values.append(long(v))
+
+        # Get Metric Values
+        rates = self.derivatives(names, values, diamond.collector.MAX_COUNTER)
+
+        for metric_name, metric_value in zip(names, rates):
+            s = metric_name.rsplit('.', 1)[1]
+            # Convert rx_bytes and tx_bytes
+            if s == 'rx_bytes' or s == 'tx_bytes':
+                convertor = diamond.convertor.binary(value=metric_value,
+                                                     unit='byte')
+
+                for u in self.config['byte_unit']:
+                    # Public Converted Metric
+                    self.publish(metric_name.replace('bytes', u),
+                                 convertor.get(unit=u), 2)
+            else:
+                # Publish Metric Derivative
+                self.publish(metric_name, metric_value)
 
         return None
@@ -47,6 +47,23 @@ you need modify your graphite data retentions to handle this properly.
 Note: If you modify the SNMPRawCollector configuration, you will need to
 restart diamond.
 
+#### Polling many devices
+
+The devices are polled one after the other by default, so a device that
+doesn't answer delays all the devices after it by its timeout. Set *threads*
+to poll that many devices at the same time. Once a device times out, the
+rest of its requests are skipped until the next run. Devices still being
+polled once the interval is over skip the rest of their requests.
+
+The OIDs of a device are asked for together, *oids_per_request* of them in
+every GET request, and walks use GETBULK requests returning
+*max_repetitions* rows at a time. Set max_repetitions to 0 for SNMPv1 devices
+which don't support GETBULK.
+
+With *measure_devices* enabled, the time taken to poll every device and the
+number of requests, timeouts and errors are published under
+devices.<device>.poll.
+
 #### Dependencies
 
  * pysmnp (which depends on pyasn1 0.1.7 and pycrypto)
@@ -55,9 +72,13 @@ restart diamond.
 
 import re
 import socket
+import threading
+import time
 import warnings
 import traceback
 import logging
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
 # pysnmp packages on debian 6.0 use sha and md5 which are deprecated
 # packages. there is nothing to be done about it until pysnmp
@@ -83,15 +104,31 @@ if logging.getLogger().isEnabledFor(logging.DEBUG):
 warnings.showwarning = old_showwarning
 
 import diamond.collector
+from diamond.collector import str_to_bool
 
 
 class SNMPCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(SNMPCollector, self).__init__(*args, **kwargs)
+        # The command generator and the stats of the device polled by each
+        # thread
+        self._local = threading.local()
+        # Guards the counters and the handlers when devices are polled
+        # concurrently
+        self._publish_lock = threading.RLock()
+
     def get_default_config_help(self):
         config_help = super(SNMPCollector, self).get_default_config_help()
         config_help.update({
             'timeout': 'Seconds before timing out the snmp connection',
             'retries': 'Number of times to retry before bailing',
+            'threads': 'Number of devices polled at the same time',
+            'oids_per_request': 'Most OIDs asked for in a single GET request',
+            'max_repetitions': 'Rows asked for by every GETBULK request of a'
+                               ' walk, 0 walks with GETNEXT requests',
+            'measure_devices': 'Publish the poll time, requests, timeouts '
+                               'and errors of every device',
         })
         return config_help
 
@@ -102,10 +139,29 @@ class SNMPCollector(diamond.collector.Collector):
             'path': 'snmp',
             'timeout': 5,
             'retries': 3,
+            'threads': 1,
+            'oids_per_request': 20,
+            'max_repetitions': 25,
+            'measure_devices': False,
             'devices': {},
         })
         return default_config
 
+    @property
+    def cmdgen(self):
+        """
+        The pysnmp command generator of the current thread, as its engine
+        can't be shared between threads
+        """
+        generator = getattr(self._local, 'cmdgen', None)
+        if generator is None:
+            generator = self._local.cmdgen = cmdgen.CommandGenerator()
+        return generator
+
+    @cmdgen.setter
+    def cmdgen(self, generator):
+        self._local.cmdgen = generator
+
     def _to_oid_tuple(self, s):
         """
         Convert an OID string into a tuple of integers
@@ -192,6 +248,14 @@ class SNMPCollector(diamond.collector.Collector):
 
         self.publish_gauge(path, value)
 
+    def publish_metric(self, metric):
+        with self._publish_lock:
+            super(SNMPCollector, self).publish_metric(metric)
+
+    def derivative(self, *args, **kwargs):
+        with self._publish_lock:
+            return super(SNMPCollector, self).derivative(*args, **kwargs)
+
     def get(self, oid, host, port, community):
         """
         Backwards compatible snmp_get
@@ -201,6 +265,24 @@ class SNMPCollector(diamond.collector.Collector):
         rows = self.snmp_get(oid, auth, transport)
         return dict((k.prettyPrint(), v.prettyPrint()) for k, v in rows)
 
+    def get_many(self, oids, host, port, community):
+        """
+        Backwards compatible snmp_get of many OIDs at once. Returns the values
+        by OID, None for the OIDs the device has no instance of, leaving out
+        the OIDs whose request failed
+        """
+        auth = self.create_auth(community)
+        transport = self.create_transport(host, port)
+        values = {}
+        for oid, row in zip(oids, self.snmp_get_many(oids, auth, transport)):
+            if row is None:
+                continue
+            value = row[1].prettyPrint()
+            if value.startswith('No Such'):
+                value = None
+            values[oid] = value
+        return values
+
     def walk(self, oid, host, port, community):
         """
         Backwards compatible snmp_walk
@@ -210,6 +292,30 @@ class SNMPCollector(diamond.collector.Collector):
         rows = self.snmp_walk(oid, auth, transport)
         return dict((k.prettyPrint(), v.prettyPrint()) for k, v in rows)
 
+    def _request(self, command, auth, transport, *args):
+        """
+        Run a command of the pysnmp command generator, counting the request
+        in the stats of the device polled. The requests to a device that
+        timed out are skipped until the next run, rather than each of them
+        waiting for the timeout again
+        """
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            return getattr(self.cmdgen, command)(auth, transport, *args)
+
+        if stats['timeouts']:
+            return ('Skipped, the device timed out', 0, 0, [])
+        if stats['interrupted'].is_set():
+            return ('Skipped, the collector was interrupted', 0, 0, [])
+        stats['requests'] += 1
+        result = getattr(self.cmdgen, command)(auth, transport, *args)
+        if result[0]:
+            if 'timeout' in str(result[0]).lower():
+                stats['timeouts'] += 1
+            else:
+                stats['errors'] += 1
+        return result
+
     def snmp_get(self, oid, auth, transport):
         """
         Perform SNMP get for a given OID
@@ -220,8 +326,8 @@ class SNMPCollector(diamond.collector.Collector):
         :returns: list of SNMP (name, value) tuples
         """
         # Run the SNMP GET query
-        result = self.cmdgen.getCmd(
-            auth, transport, self._to_oid_tuple(oid))
+        result = self._request('getCmd', auth, transport,
+                               self._to_oid_tuple(oid))
 
         if result[0]:
             self.log.error(result[0])
@@ -237,32 +343,80 @@ class SNMPCollector(diamond.collector.Collector):
             )
         return []
 
+    def snmp_get_many(self, oids, auth, transport):
+        """
+        Perform SNMP gets for many OIDs, packing up to oids_per_request of
+        them in every GET request
+
+        :param oids: a list of OID strings or tuples to query
+        :param auth: a CommunityData instance for authentication
+        :param transport: an SNMP transport target (UdpTransportTarget)
+        :returns: the SNMP (name, value) tuple of every OID, in the order of
+                  the OIDs, None for the OIDs whose request failed
+        """
+        size = max(int(self.config['oids_per_request']), 1)
+        rows = []
+        for i in xrange(0, len(oids), size):
+            chunk = oids[i:i + size]
+            result = self._request('getCmd', auth, transport,
+                                   *map(self._to_oid_tuple, chunk))
+
+            if result[0]:
+                self.log.error(result[0])
+                rows.extend([None] * len(chunk))
+                continue
+
+            # The response holds a value for every OID, in the order they
+            # were asked for
+            varbinds = list(result[3] or [])
+            if len(varbinds) != len(chunk):
+                self.log.debug(
+                    "SNMP GET of {0} OIDs on host '{1}' returned {2}".format(
+                        len(chunk), transport.transportAddr[0],
+                        len(varbinds)))
+                varbinds = (varbinds + [None] * len(chunk))[:len(chunk)]
+            rows.extend(varbinds)
+        return rows
+
     def snmp_walk(self, oid, auth, transport):
         """
-        Perform an SNMP walk on a given OID
+        Perform an SNMP walk on a given OID, with GETBULK requests unless
+        max_repetitions is 0
 
         :param oid: An OID string or tuple to query
         :param auth: a CommunityData instance for authentication
         :param transport: an SNMP transport target (UdpTransportTarget)
         :returns: list of SNMP (name, value) tuples
         """
+        repetitions = int(self.config['max_repetitions'])
         # Run the SNMP WALK query
-        result = self.cmdgen.nextCmd(
-            auth, transport, self._to_oid_tuple(oid))
+        if repetitions > 0:
+            result = self._request('bulkCmd', auth, transport, 0,
+                                   repetitions, self._to_oid_tuple(oid))
+        else:
+            result = self._request('nextCmd', auth, transport,
+                                   self._to_oid_tuple(oid))
 
         if result[0]:
             self.log.error(result[0])
             return []
 
         try:
-            return [item[0] for item in result[3]]
+            rows = [item[0] for item in result[3]]
         except IndexError:
             self.log.warning(
                 "SNMP WALK '{0}' on host '{1}' returned no data".format(
                     oid, transport.transportAddr[0]
                 )
             )
-        return []
+            return []
+
+        if repetitions > 0:
+            # The last response of a bulk walk can run past the subtree
+            prefix = self._from_oid_tuple(oid) + '.'
+            rows = [row for row in rows
+                    if row[0].prettyPrint().startswith(prefix)]
+        return rows
 
     def create_transport(self, host, port):
         """
@@ -322,20 +476,54 @@ class SNMPCollector(diamond.collector.Collector):
         auth = self.create_auth(community)
         transport = self.create_transport(host, port)
         oids = self.config['devices'][device]['oids']
+        device = device.replace('.', '_')
 
+        gets = []
         for oid, basename in oids.items():
             if oid.endswith('.*'):  # Walk
                 oid = oid[:-2]
-                fn = self.snmp_walk
+                for metric_name, metric_value in self.snmp_walk(oid, auth,
+                                                                transport):
+                    self._publish(device, oid, basename, metric_name,
+                                  metric_value)
             else:
-                fn = self.snmp_get
+                gets.append((oid, basename))
+
+        # The OIDs to get are packed in as few requests as possible
+        rows = self.snmp_get_many([get[0] for get in gets], auth, transport)
+        for (oid, basename), row in zip(gets, rows):
+            if row is not None:
+                self._publish(device, oid, basename, row[0], row[1])
 
-            for metric_name, metric_value in fn(oid, auth, transport):
-                self._publish(device.replace('.', '_'),
-                              oid,
-                              basename,
-                              metric_name,
-                              metric_value)
+    def poll_device(self, device, config, interrupted=None):
+        """
+        Collect the data of a device, returning how long it took and how many
+        requests, timeouts and errors there were. Once the interrupted event
+        is set, the remaining requests to the device are skipped
+        """
+        stats = self._local.stats = {
+            'requests': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'interrupted': interrupted or threading.Event(),
+        }
+        start_time = time.time()
+        try:
+            host = config['host']
+            port = int(config.get('port', 161))
+            community = config.get('community', 'public')
+            self.collect_snmp(device, host, port, community)
+        except Exception:
+            stats['errors'] += 1
+            self.log.error("Failed to collect SNMP data from device "
+                           "'{0}': {1}".format(device,
+                                               traceback.format_exc()))
+        finally:
+            self._local.stats = None
+        stats['time_ms'] = int((time.time() - start_time) * 1000)
+        if stats['timeouts']:
+            self.log.warning("SNMP device '{0}' timed out".format(device))
+        return stats
 
     def collect(self):
         """
@@ -352,12 +540,40 @@ class SNMPCollector(diamond.collector.Collector):
             self.log.error('No devices configured for this collector')
             return
 
-        # Initialize SNMP Command Generator
-        self.cmdgen = cmdgen.CommandGenerator()
-
-        # Collect SNMP data from each device
-        for device, config in self.config['devices'].items():
-            host = config['host']
-            port = int(config.get('port', 161))
-            community = config.get('community', 'public')
-            self.collect_snmp(device, host, port, community)
+        # Collect SNMP data from each device, up to threads at a time
+        devices = self.config['devices'].items()
+        threads = min(int(self.config.get('threads', 1)), len(devices))
+        if threads > 1:
+            interrupted = threading.Event()
+            pool = ThreadPool(threads)
+            try:
+                # One device at a time so a slow device doesn't hold up the
+                # devices queued after it in the same worker. Waiting with a
+                # timeout, so the scheduler can still interrupt the collector
+                results = pool.map_async(
+                    lambda item: self.poll_device(item[0], item[1],
+                                                  interrupted),
+                    devices, 1).get(float(self.config['interval']))
+            except BaseException, e:
+                # The devices being polled skip the rest of their requests,
+                # and the workers are left to finish the request they are
+                # waiting for rather than waited for
+                interrupted.set()
+                pool.terminate()
+                if not isinstance(e, TimeoutError):
+                    raise
+                self.log.error('Polling the SNMP devices took longer than '
+                               'the interval')
+                return
+            pool.close()
+            pool.join()
+        else:
+            results = [self.poll_device(device, config)
+                       for device, config in devices]
+
+        if str_to_bool(self.config.get('measure_devices', False)):
+            for (device, _), stats in zip(devices, results):
+                prefix = '.'.join(['devices', device.replace('.', '_'),
+                                   'poll'])
+                for name in ('time_ms', 'requests', 'timeouts', 'errors'):
+                    self.publish_gauge('.'.join([prefix, name]), stats[name])
@@ -1,8 +1,9 @@
 #!/usr/bin/python
 # coding=utf-8
 import socket
+import time
 
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 
 from snmp import SNMPCollector
 from test import CollectorTestCase, get_collector_config
@@ -145,13 +146,22 @@ class TestSNMPCollector(CollectorTestCase):
         expected = [x[0] for x in metrics[3]]
 
         self.collector.cmdgen = Mock()
-        self.collector.cmdgen.nextCmd.return_value = metrics
+        self.collector.cmdgen.bulkCmd.return_value = metrics
 
         auth = Mock()
         transport = Mock(transportAddr=('localhost', 161))
 
         ret_metrics = list(self.collector.snmp_walk('1.2', auth, transport))
         self.assertEqual(expected, ret_metrics)
+        self.assertEqual(self.collector.cmdgen.bulkCmd.call_args[0][2:],
+                         (0, 25, (1, 2)))
+
+        # Without GETBULK
+        self.collector.config['max_repetitions'] = 0
+        self.collector.cmdgen.nextCmd.return_value = metrics
+        ret_metrics = list(self.collector.snmp_walk('1.2', auth, transport))
+        self.assertEqual(expected, ret_metrics)
+        self.assertTrue(self.collector.cmdgen.nextCmd.called)
 
     @patch('snmp.IntegerType', Mock)
     @patch('snmp.cmdgen', Mock())
@@ -172,33 +182,30 @@ class TestSNMPCollector(CollectorTestCase):
         metrics = [
             (Mock(prettyPrint=lambda: '1.2.3'),
              Mock(prettyPrint=lambda: '42')),
-            (Mock(prettyPrint=lambda: '1.2.3.4'),
-             Mock(prettyPrint=lambda: '43')),
         ]
 
         with patch.multiple(self.collector,
-                            snmp_get=Mock(),
+                            snmp_get_many=Mock(),
                             snmp_walk=Mock(),
                             publish_metric=Mock()):
-            self.collector.snmp_get.return_value = metrics
+            self.collector.snmp_get_many.return_value = metrics
 
             self.collector.collect_snmp(device, 'localhost', 161, 'public')
 
             # Are we calling the correct method
             self.assertFalse(self.collector.snmp_walk.called)
-            self.assertTrue(self.collector.snmp_get.called)
+            self.collector.snmp_get_many.assert_called_with(
+                ['1.2.3'], ANY, ANY)
 
             calls = self.collector.publish_metric.call_args_list
 
             # Do we publish metrics?
-            self.assertEqual(len(calls), 2)
+            self.assertEqual(len(calls), 1)
             prefix = 'servers.{0}.snmp'.format(socket.gethostname())
 
             # Were metrics properly namespaced
             self.assertEqual(calls[0][0][0].path,
                              '{0}.devices.mydevice.foo.bar'.format(prefix))
-            self.assertEqual(calls[1][0][0].path,
-                             '{0}.devices.mydevice.foo.bar.4'.format(prefix))
 
     @patch('snmp.IntegerType', Mock)
     @patch('snmp.cmdgen', Mock())
@@ -329,3 +336,217 @@ class TestSNMPCollector(CollectorTestCase):
             collect_snmp.assert_called_with(
                 'mydevice', 'localhost', 161, 'public'
             )
+
+
+class OID(str):
+
+    def prettyPrint(self):
+        return str(self)
+
+
+class Integer(int):
+
+    def prettyPrint(self):
+        return str(int(self))
+
+
+class NoSuchInstance(str):
+
+    def prettyPrint(self):
+        return 'No Such Instance currently exists at this OID'
+
+
+def oid_key(oid):
+    return tuple(map(int, oid.split('.')))
+
+
+class FakeCommandGenerator(object):
+    """
+    Answers the requests of the collector for simulated devices, by host:
+    the OIDs and values of each, how long it takes to answer and whether it
+    doesn't answer at all
+    """
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.requests = []
+
+    def _device(self, transport, command, oids):
+        host = transport.transportAddr[0]
+        self.requests.append((host, command, oids))
+        device = self.devices[host]
+        time.sleep(device.get('delay', 0))
+        return device
+
+    def getCmd(self, auth, transport, *oids):
+        oids = ['.'.join(map(str, oid)) for oid in oids]
+        device = self._device(transport, 'get', oids)
+        if device.get('dead'):
+            return ('No SNMP response received before timeout', 0, 0, [])
+        values = device['oids']
+        return (None, 0, 0, [
+            (OID(oid), Integer(values[oid]) if oid in values else
+             NoSuchInstance()) for oid in oids])
+
+    def bulkCmd(self, auth, transport, non_repeaters, max_repetitions, oid):
+        oid = '.'.join(map(str, oid))
+        device = self._device(transport, 'bulk', [oid])
+        if device.get('dead'):
+            return ('No SNMP response received before timeout', 0, 0, [])
+        # Like a device, the rows following the OID whether or not they are
+        # in its subtree
+        values = device['oids']
+        names = sorted((name for name in values
+                        if oid_key(name) > oid_key(oid)), key=oid_key)
+        return (None, 0, 0, [[(OID(name), Integer(values[name]))]
+                             for name in names[:max_repetitions]])
+
+
+class TestSNMPCollectorPolling(CollectorTestCase):
+
+    def setUp(self):
+        self.devices = {
+            '127.0.0.1': {
+                'oids': {
+                    '1.2.1': 1,
+                    '1.2.2': 2,
+                    '1.2.3': 3,
+                    '1.3.1.1': 11,
+                    '1.3.1.2': 12,
+                    '1.4': 4,
+                },
+            },
+        }
+        self.generator = FakeCommandGenerator(self.devices)
+        self.cmdgen = Mock()
+        self.cmdgen.CommandGenerator.return_value = self.generator
+        self.cmdgen.UdpTransportTarget.side_effect = (
+            lambda address, timeout, retries: Mock(transportAddr=address))
+        self.patches = [patch('snmp.cmdgen', self.cmdgen),
+                        patch('snmp.IntegerType', Integer)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def create_collector(self, devices, **config):
+        config['devices'] = devices
+        collector = SNMPCollector(
+            get_collector_config('SNMPCollector', config), None)
+        collector.publish_gauge = Mock()
+        return collector
+
+    def published(self, collector):
+        return dict(c[0] for c in collector.publish_gauge.call_args_list)
+
+    def test_packs_gets(self):
+        collector = self.create_collector({
+            'router': {
+                'host': '127.0.0.1',
+                'oids': {
+                    '1.2.1': 'a',
+                    '1.2.2': 'b',
+                    '1.2.3': 'c',
+                    '1.2.4': 'missing',
+                    '1.3.*': 'table',
+                },
+            },
+        }, oids_per_request=3, measure_devices=True)
+        collector.collect()
+
+        requests = self.generator.requests
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(sorted(len(r[2]) for r in requests
+                                if r[1] == 'get'), [1, 3])
+        self.assertEqual([r[2] for r in requests if r[1] == 'bulk'],
+                         [['1.3']])
+
+        published = self.published(collector)
+        self.assertEqual(published['devices.router.a'], '1')
+        self.assertEqual(published['devices.router.c'], '3')
+        self.assertFalse('devices.router.missing' in published)
+        # The walk stops at the end of the subtree
+        self.assertEqual(published['devices.router.table.1.1'], '11')
+        self.assertEqual(published['devices.router.table.1.2'], '12')
+        self.assertFalse('devices.router.table' in published)
+        self.assertEqual(published['devices.router.poll.requests'], 3)
+        self.assertEqual(published['devices.router.poll.timeouts'], 0)
+
+    def test_polls_devices_in_parallel(self):
+        devices = {}
+        for i in range(2, 6):
+            host = '127.0.0.%d' % i
+            self.devices[host] = {'delay': 0.3, 'oids': {'1.2.1': i}}
+            devices['device%d' % i] = {'host': host,
+                                       'oids': {'1.2.1': 'value'}}
+        collector = self.create_collector(devices, threads=4)
+
+        start = time.time()
+        collector.collect()
+        # Sequentially the devices would take 1.2s
+        self.assertTrue(time.time() - start < 0.9)
+
+        published = self.published(collector)
+        for i in range(2, 6):
+            self.assertEqual(published['devices.device%d.value' % i], str(i))
+
+    def test_skips_device_after_timeout(self):
+        self.devices['127.0.0.2'] = {'dead': True, 'oids': {}}
+        collector = self.create_collector({
+            'dead': {
+                'host': '127.0.0.2',
+                'oids': {'1.2.*': 'a', '1.3.*': 'b', '1.4': 'c'},
+            },
+            'alive': {
+                'host': '127.0.0.1',
+                'oids': {'1.4': 'c'},
+            },
+        }, threads=2, measure_devices=True)
+        with patch.object(collector, 'log'):
+            collector.collect()
+
+        self.assertEqual(len([r for r in self.generator.requests
+                              if r[0] == '127.0.0.2']), 1)
+        published = self.published(collector)
+        self.assertEqual(published['devices.dead.poll.requests'], 1)
+        self.assertEqual(published['devices.dead.poll.timeouts'], 1)
+        self.assertEqual(published['devices.alive.c'], '4')
+        self.assertEqual(published['devices.alive.poll.timeouts'], 0)
+
+    def test_gives_up_after_interval(self):
+        self.devices['127.0.0.2'] = {
+            'delay': 0.6,
+            'oids': {'1.2.1': 1, '1.2.2': 2, '1.2.3': 3, '1.2.4': 4},
+        }
+        collector = self.create_collector({
+            'slow': {
+                'host': '127.0.0.2',
+                'oids': {'1.2.1': 'a', '1.2.2': 'b', '1.2.3': 'c',
+                         '1.2.4': 'd'},
+            },
+            'alive': {
+                'host': '127.0.0.1',
+                'oids': {'1.4': 'c'},
+            },
+        }, threads=2, interval=1, oids_per_request=1)
+
+        start = time.time()
+        with patch.object(collector, 'log'):
+            collector.collect()
+            self.assertTrue(time.time() - start < 1.5)
+            collector.log.error.assert_called_with(
+                'Polling the SNMP devices took longer than the interval')
+
+        # The request in flight is answered, the rest are skipped
+        time.sleep(1)
+        self.assertEqual(len([r for r in self.generator.requests
+                              if r[0] == '127.0.0.2']), 2)
+
+    def test_get_many(self):
+        collector = self.create_collector({})
+        self.assertEqual(
+            collector.get_many(['1.2.1', '1.4', '1.5'], '127.0.0.1', 161,
+                               'public'),
+            {'1.2.1': '1', '1.4': '4', '1.5': None})
@@ -164,22 +164,28 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
         ifIndexData = self.walk(ifIndexOid, host, port, community)
         ifIndexes = [v for v in ifIndexData.values()]
 
-        for ifIndex in ifIndexes:
-            # Get Interface Type
-            ifTypeOid = '.'.join([self.IF_MIB_TYPE_OID, ifIndex])
-            ifTypeData = self.get(ifTypeOid, host, port, community)
-            try:
-                if ifTypeData[ifTypeOid] not in self.IF_TYPES:
-                    # Skip Interface
-                    continue
-
-            except KeyError:
+        # Get the Interface Types of all the interfaces at once
+        ifTypeOids = ['.'.join([self.IF_MIB_TYPE_OID, ifIndex])
+                      for ifIndex in ifIndexes]
+        ifTypeData = self.get_many(ifTypeOids, host, port, community)
+
+        for ifIndex, ifTypeOid in zip(ifIndexes, ifTypeOids):
+            if ifTypeData.get(ifTypeOid) not in self.IF_TYPES:
+                # Skip Interface
                 continue
 
-            # Get Interface Name
+            # Get the Interface Name, Gauges and Counters in one go
             ifNameOid = '.'.join([self.IF_MIB_NAME_OID, ifIndex])
-            ifNameData = self.get(ifNameOid, host, port, community)
-            ifName = ifNameData[ifNameOid]
+            ifOids = [ifNameOid]
+            ifOids.extend('.'.join([oid, ifIndex]) for oid in
+                          self.IF_MIB_GAUGE_OID_TABLE.values())
+            ifOids.extend('.'.join([oid, ifIndex]) for oid in
+                          self.IF_MIB_COUNTER_OID_TABLE.values())
+            ifData = self.get_many(ifOids, host, port, community)
+
+            ifName = ifData.get(ifNameOid)
+            if ifName is None:
+                continue
             # Remove quotes from string
             ifName = re.sub(r'(\"|\')', '', ifName)
 
@@ -187,8 +193,7 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
             for gaugeName, gaugeOid in self.IF_MIB_GAUGE_OID_TABLE.items():
                 ifGaugeOid = '.'.join([self.IF_MIB_GAUGE_OID_TABLE[gaugeName],
                                        ifIndex])
-                ifGaugeData = self.get(ifGaugeOid, host, port, community)
-                ifGaugeValue = ifGaugeData[ifGaugeOid]
+                ifGaugeValue = ifData.get(ifGaugeOid)
                 if not ifGaugeValue:
                     continue
 
@@ -209,8 +214,7 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
             for counterName, counterOid in counterItems:
                 ifCounterOid = '.'.join(
                     [self.IF_MIB_COUNTER_OID_TABLE[counterName], ifIndex])
-                ifCounterData = self.get(ifCounterOid, host, port, community)
-                ifCounterValue = ifCounterData[ifCounterOid]
+                ifCounterValue = ifData.get(ifCounterOid)
                 if not ifCounterValue:
                     continue
 
@@ -2,6 +2,9 @@
 # coding=utf-8
 ##########################################################################
 
+from mock import Mock
+from mock import patch
+
 from test import CollectorTestCase
 from test import get_collector_config
 
@@ -19,3 +22,33 @@ class TestSNMPInterfaceCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPInterfaceCollector)
+
+    def test_collect_snmp(self):
+        values = {
+            '1.3.6.1.2.1.2.2.1.3.1': '24',
+            '1.3.6.1.2.1.2.2.1.3.2': '6',
+            '1.3.6.1.2.1.31.1.1.1.1.2': "'eth0'",
+            '1.3.6.1.2.1.2.2.1.14.2': '3',
+            '1.3.6.1.2.1.31.1.1.1.6.2': '1000',
+        }
+
+        def get_many(oids, host, port, community):
+            return dict((oid, values.get(oid)) for oid in oids)
+
+        with patch.multiple(self.collector,
+                            walk=Mock(return_value={'a': '1', 'b': '2'}),
+                            get_many=Mock(side_effect=get_many),
+                            publish_gauge=Mock(),
+                            publish_counter=Mock()):
+            self.collector.collect_snmp('router', 'localhost', 161, 'public')
+
+            # The types, then everything about the ethernet interface
+            self.assertEqual(self.collector.get_many.call_count, 2)
+            self.collector.publish_gauge.assert_called_once_with(
+                'devices.router.interface.eth0.ifInErrors', 3)
+            counters = dict(c[0][:2] for c in
+                            self.collector.publish_counter.call_args_list)
+            self.assertEqual(counters, {
+                'devices.router.interface.eth0.ifHCInbit': 8000.0,
+                'devices.router.interface.eth0.ifHCInbyte': 1000.0,
+            })
@@ -3,12 +3,16 @@
 ##########################################################################
 
 import os
+import shutil
 import sys
+import tempfile
+import time
 
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
 from test import run_only
+from mock import Mock
 from mock import patch
 
 from diamond.collector import Collector
@@ -65,6 +69,147 @@ class TestUserScriptsCollector(CollectorTestCase):
         # be due to raising an exception. Meh.
         assert publish_mock.call_args_list
 
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    # Killed but left for init to reap
+    try:
+        stat = open('/proc/%d/stat' % pid).read()
+        return stat.rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return True
+
+
+class TestUserScriptsCollectorRun(CollectorTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_script(self, name, content):
+        path = os.path.join(self.path, name)
+        f = open(path, 'w')
+        f.write('#!/bin/sh\n' + content)
+        f.close()
+        os.chmod(path, 0755)
+
+    def create_collector(self, **config):
+        config.setdefault('interval', 10)
+        config['scripts_path'] = self.path
+        collector = UserScriptsCollector(
+            get_collector_config('UserScriptsCollector', config), None)
+        collector.publish = Mock()
+        collector.log = Mock()
+        return collector
+
+    def published(self, collector):
+        return dict(c[0][:2] for c in collector.publish.call_args_list)
+
+    def test_timeout_kills_process_group(self):
+        pidfile = os.path.join(self.path, 'pid')
+        self.write_script('hung.sh', 'echo hung.before 1\n'
+                                     'sleep 30 &\n'
+                                     'echo $! > %s\n'
+                                     'sleep 30\n' % pidfile)
+        self.write_script('quick.sh', 'echo quick.value 2\n')
+        collector = self.create_collector(timeout=1, threads=2,
+                                          measure_scripts=True)
+
+        start = time.time()
+        collector.collect()
+        self.assertTrue(time.time() - start < 10)
+
+        published = self.published(collector)
+        self.assertEqual(published['hung.before'], '1')
+        self.assertEqual(published['quick.value'], '2')
+        self.assertEqual(published['scripts.hung_sh.timed_out'], 1)
+        self.assertEqual(published['scripts.hung_sh.exit_status'], -9)
+        self.assertEqual(published['scripts.quick_sh.timed_out'], 0)
+        self.assertEqual(published['scripts.quick_sh.exit_status'], 0)
+
+        # The process started by the script was killed with it
+        pid = int(open(pidfile).read())
+        for i in range(50):
+            if not is_running(pid):
+                break
+            time.sleep(0.1)
+        else:
+            self.fail('Process %d still running' % pid)
+
+    def test_deadline_of_sequential_run(self):
+        self.write_script('a_hung.sh', 'echo hung.before 1\n'
+                                       'sleep 30\n')
+        self.write_script('b_quick.sh', 'echo quick.value 2\n')
+        collector = self.create_collector(interval=2, timeout=5, threads=1,
+                                          measure_scripts=True)
+
+        start = time.time()
+        collector.collect()
+        # Killed once 90% of the interval is over rather than after the
+        # timeout
+        self.assertTrue(time.time() - start < 2)
+
+        published = self.published(collector)
+        self.assertEqual(published['hung.before'], '1')
+        self.assertEqual(published['scripts.a_hung_sh.timed_out'], 1)
+        # Not run, the collector is out of time
+        self.assertFalse('quick.value' in published)
+        self.assertFalse('scripts.b_quick_sh.timed_out' in published)
+        collector.log.error.assert_called_with(
+            '%s not run, the collector is out of time' %
+            os.path.join(self.path, 'b_quick.sh'))
+
+    def test_runs_scripts_concurrently(self):
+        for i in range(3):
+            self.write_script('script%d.sh' % i,
+                              'sleep 1\necho value.%d %d\n' % (i, i))
+        collector = self.create_collector(threads=3)
+
+        start = time.time()
+        collector.collect()
+        # One after another the scripts take 3 seconds
+        self.assertTrue(time.time() - start < 2.5)
+        self.assertEqual(self.published(collector), {
+            'value.0': '0',
+            'value.1': '1',
+            'value.2': '2',
+        })
+
+    def test_exit_status(self):
+        self.write_script('failing.sh', 'echo value 1\n'
+                                        'echo oops >&2\n'
+                                        'exit 3\n')
+        collector = self.create_collector(measure_scripts=True)
+        collector.collect()
+
+        published = self.published(collector)
+        self.assertEqual(published['value'], '1')
+        self.assertEqual(published['scripts.failing_sh.exit_status'], 3)
+        self.assertTrue(published['scripts.failing_sh.runtime_ms'] >= 0)
+        collector.log.warning.assert_called_with(
+            '%s return error output: oops\n' %
+            os.path.join(self.path, 'failing.sh'))
+
+    def test_large_output(self):
+        self.write_script('large.sh', 'i=0\n'
+                                      'while [ $i -lt 5000 ]; do\n'
+                                      '    echo "metric.$i $i.5"\n'
+                                      '    i=$((i+1))\n'
+                                      'done\n'
+                                      'echo invalid line here\n')
+        collector = self.create_collector()
+        collector.collect()
+
+        published = self.published(collector)
+        self.assertEqual(len(published), 5000)
+        self.assertEqual(published['metric.4999'], '4999.5')
+        self.assertEqual(collector.log.error.call_count, 1)
+
 ##########################################################################
 if __name__ == "__main__":
     unittest.main()
@@ -14,6 +14,15 @@ metric.path.c 3
 They are not passed any arguments and if they return an error code,
 no metrics are collected.
 
+The output of a script is published line by line as the script writes it.
+A script still running after *timeout* seconds is killed together with the
+processes it started. Whatever the timeout, the scripts are all killed once
+90% of the interval since the collector started is over, and the scripts not
+started by then are skipped, so the collector isn't killed for running past
+its interval. Set *threads* to run that many scripts at the same time.
+With *measure_scripts* enabled, the run time, the exit status and whether it
+timed out are published for every script under scripts.<script>.
+
 #### Dependencies
 
  * [subprocess](http://docs.python.org/library/subprocess.html)
@@ -22,17 +31,41 @@ no metrics are collected.
 
 import diamond.collector
 import diamond.convertor
+from diamond.collector import str_to_bool
 import os
+import re
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+# Most error output of a script logged
+MAX_ERROR_OUTPUT = 4096
 
 
 class UserScriptsCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(UserScriptsCollector, self).__init__(*args, **kwargs)
+        # The processes of the scripts running
+        self.running = set()
+        # When the scripts of the current run are all killed
+        self.deadline = None
+        # Guards the handlers when scripts are run concurrently
+        self._publish_lock = threading.Lock()
+
     def get_default_config_help(self):
         config_help = super(UserScriptsCollector,
                             self).get_default_config_help()
         config_help.update({
             'scripts_path': "Path to find the scripts to run",
+            'threads': "Number of scripts run at the same time",
+            'timeout': "Seconds before a script is killed, 0 kills it once"
+                       " 90% of the interval is over",
+            'measure_scripts': "Publish the run time and exit status of"
+                               " every script",
         })
         return config_help
 
@@ -45,14 +78,22 @@ class UserScriptsCollector(diamond.collector.Collector):
             'path':         '.',
             'scripts_path': '/etc/diamond/user_scripts/',
             'floatprecision': 4,
+            'threads': 1,
+            'timeout': 0,
+            'measure_scripts': False,
         })
         return config
 
-    def collect(self):
-        scripts_path = self.config['scripts_path']
-        if not os.access(scripts_path, os.R_OK):
-            return None
-        for script in os.listdir(scripts_path):
+    def publish_metric(self, metric):
+        with self._publish_lock:
+            super(UserScriptsCollector, self).publish_metric(metric)
+
+    def get_scripts(self, scripts_path):
+        """
+        Returns the paths of the executables in the scripts path
+        """
+        scripts = []
+        for script in sorted(os.listdir(scripts_path)):
             absolutescriptpath = os.path.join(scripts_path, script)
             executable = os.access(absolutescriptpath, os.X_OK)
             is_file = os.path.isfile(absolutescriptpath)
@@ -64,39 +105,179 @@ class UserScriptsCollector(diamond.collector.Collector):
                 # Don't bother logging skipped non-file files (typically
                 # directories)
                 continue
-            out = None
-            self.log.debug("Executing %s" % absolutescriptpath)
+            scripts.append(absolutescriptpath)
+        return scripts
+
+    def start_deadline(self):
+        # Before the collector is killed for running past its interval
+        self.deadline = time.time() + float(self.config['interval']) * 0.9
+
+    def get_remaining(self):
+        """
+        Returns the seconds left until the deadline of the run
+        """
+        if self.deadline is None:
+            self.start_deadline()
+        return self.deadline - time.time()
+
+    def get_timeout(self):
+        """
+        Returns the seconds a script started now may run for, the timeout but
+        no later than the deadline of the run
+        """
+        remaining = self.get_remaining()
+        timeout = float(self.config['timeout'])
+        if timeout <= 0:
+            return remaining
+        return min(timeout, remaining)
+
+    def kill(self, proc):
+        """
+        Kill a script and the processes it started
+        """
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            # Gone already
+            pass
+
+    def _timed_out(self, proc):
+        proc.timed_out = True
+        self.kill(proc)
+
+    def run_script(self, absolutescriptpath):
+        """
+        Run a script, publishing its output as it is written. Returns how long
+        it ran, its exit status and whether it timed out, None when it
+        couldn't be started
+        """
+        timeout = self.get_timeout()
+        if timeout <= 0:
+            self.log.error("%s not run, the collector is out of time" %
+                           absolutescriptpath)
+            return None
+
+        self.log.debug("Executing %s" % absolutescriptpath)
+        start_time = time.time()
+        # The error output goes to a file so a script writing a lot of it
+        # doesn't block while its output is read
+        err = tempfile.TemporaryFile()
+        try:
             try:
+                # In a session of its own, so the processes the script starts
+                # are killed with it
                 proc = subprocess.Popen([absolutescriptpath],
                                         stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-                (out, err) = proc.communicate()
-            except subprocess.CalledProcessError, e:
+                                        stderr=err,
+                                        close_fds=True,
+                                        preexec_fn=os.setsid)
+            except OSError, e:
                 self.log.error("%s error launching: %s; skipping" %
                                (absolutescriptpath, e))
-                continue
-            if proc.returncode:
+                return None
+
+            proc.timed_out = False
+            self.running.add(proc)
+            timer = threading.Timer(timeout, self._timed_out, (proc,))
+            timer.daemon = True
+            timer.start()
+            try:
+                lines = self.publish_output(absolutescriptpath, proc.stdout)
+                proc.wait()
+            finally:
+                timer.cancel()
+                self.running.discard(proc)
+                proc.stdout.close()
+                if proc.returncode is None:
+                    # Interrupted, like by the scheduler killing the collector
+                    self.kill(proc)
+
+            if proc.timed_out:
+                self.log.error("%s took longer than %s seconds; killed" %
+                               (absolutescriptpath, round(timeout, 1)))
+            elif proc.returncode:
                 self.log.error("%s return exit value %s" %
                                (absolutescriptpath, proc.returncode))
-            if err:
+            err.seek(0)
+            error_output = err.read(MAX_ERROR_OUTPUT)
+            if error_output:
                 self.log.warning("%s return error output: %s" %
-                                 (absolutescriptpath, err))
-            if not out:
+                                 (absolutescriptpath, error_output))
+            if not lines:
                 self.log.error("%s returned no output; skipping" %
                                absolutescriptpath)
+        finally:
+            err.close()
+
+        return {
+            'runtime_ms': int((time.time() - start_time) * 1000),
+            'exit_status': proc.returncode,
+            'timed_out': int(proc.timed_out),
+        }
+
+    def publish_output(self, absolutescriptpath, output):
+        """
+        Publish the metrics of the output of a script, line by line. Returns
+        the number of lines
+        """
+        lines = 0
+        for line in iter(output.readline, ''):
+            # Skip empty lines of output
+            line = line.strip()
+            if not line:
                 continue
-            # Use filter to remove empty lines of output
-            for line in filter(None, out.split('\n')):
-                # Ignore invalid lines
-                try:
-                    name, value = line.split()
-                    float(value)
-                except ValueError:
-                    self.log.error("%s returned error output: %s" %
-                                   (absolutescriptpath, line))
-                    continue
+            lines += 1
+            # Ignore invalid lines
+            try:
                 name, value = line.split()
-                floatprecision = 0
-                if "." in value:
-                    floatprecision = self.config['floatprecision']
-                self.publish(name, value, precision=floatprecision)
+                float(value)
+            except ValueError:
+                self.log.error("%s returned error output: %s" %
+                               (absolutescriptpath, line))
+                continue
+            floatprecision = 0
+            if "." in value:
+                floatprecision = self.config['floatprecision']
+            self.publish(name, value, precision=floatprecision)
+        return lines
+
+    def run_scripts(self, scripts):
+        """
+        Run the scripts, threads at a time. Returns what run_script returned
+        for every script
+        """
+        threads = min(int(self.config['threads']), len(scripts))
+        if threads <= 1:
+            return map(self.run_script, scripts)
+
+        pool = ThreadPool(threads)
+        try:
+            # Waiting with a timeout, so the scheduler can still interrupt
+            # the collector. The scripts are all killed by the deadline, the
+            # workers only have to collect them
+            return pool.map_async(self.run_script, scripts, 1).get(
+                max(self.get_remaining(), 0) + 5)
+        finally:
+            # The scripts still running when the collector is interrupted
+            for proc in list(self.running):
+                self.kill(proc)
+            pool.close()
+            pool.join()
+
+    def collect(self):
+        scripts_path = self.config['scripts_path']
+        if not os.access(scripts_path, os.R_OK):
+            return None
+        self.start_deadline()
+        scripts = self.get_scripts(scripts_path)
+        results = self.run_scripts(scripts)
+
+        if str_to_bool(self.config['measure_scripts']):
+            for script, stats in zip(scripts, results):
+                if stats is None:
+                    continue
+                name = re.sub(r'[^a-zA-Z0-9_-]', '_',
+                              os.path.basename(script))
+                for key in ('runtime_ms', 'exit_status', 'timed_out'):
+                    self.publish('.'.join(['scripts', name, key]),
+                                 stats[key])
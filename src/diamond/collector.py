@@ -15,13 +15,18 @@ import platform
 import logging
 import configobj
 import time
-import re
 import subprocess
 
-from copy import deepcopy
 from diamond.metric import Metric
 from diamond.util import get_diamond_version
+from diamond.utils.cache import LRUCache
+from diamond.utils.config import copy_section
 from diamond.utils.config import load_config
+from diamond.utils.filters import MetricFilter
+from diamond.utils.profiler import RunProfiler
+from diamond.utils.selfmetrics import get_rss_kb
+from diamond.utils.state import CounterStore
+from diamond.utils.state import StateError
 from error import DiamondException
 
 # Detect the architecture of the system and set the counters for MAX_VALUES
@@ -33,6 +38,9 @@ if platform.architecture()[0] == '64bit':
 else:
     MAX_COUNTER = (2 ** 32) - 1
 
+# Maximum number of metric paths remembered per collector
+METRIC_PATH_CACHE_SIZE = 10000
+
 
 def get_hostname(config, method=None):
     """
@@ -167,6 +175,11 @@ class Collector(object):
     The Collector class is a base class for all metric collectors.
     """
 
+    # Whether the collector can run in the shared collector process. Only
+    # collectors that are quick, never block and keep no process wide state
+    # should set this.
+    SHAREABLE = False
+
     def __init__(self, config=None, handlers=[], name=None, configfile=None):
         """
         Create a new instance of the Collector class
@@ -180,11 +193,22 @@ class Collector(object):
             self.name = name
 
         self.handlers = handlers
-        self.last_values = {}
+        self.last_values = None
+        self._counter_state_saved = None
+
+        # Counters reporting on the collector itself, if enabled
+        self._self_metrics = None
+        self._metrics_published = 0
+        self._dropped_reported = 0
+
+        self.profiler = None
+        self._profile = False
 
         self.configfile = None
         self.load_config(configfile, config)
 
+        self.load_counter_state()
+
     def load_config(self, configfile=None, override_config=None):
         """
         Process a configfile, or reload if previously given one.
@@ -200,7 +224,9 @@ class Collector(object):
             self.configfile = os.path.abspath(configfile)
 
         if self.configfile is not None:
-            config = load_config(self.configfile)
+            # The parsed config is shared by all collectors, only copies of
+            # its sections are merged
+            config = load_config(self.configfile, copy=False)
 
             if 'handlers' in config:
                 if 'NetuitiveHandler' in config['handlers']:
@@ -208,10 +234,12 @@ class Collector(object):
 
             if 'collectors' in config:
                 if 'default' in config['collectors']:
-                    self.config.merge(config['collectors']['default'])
+                    self.config.merge(
+                        copy_section(config['collectors']['default']))
 
                 if self.name in config['collectors']:
-                    self.config.merge(config['collectors'][self.name])
+                    self.config.merge(
+                        copy_section(config['collectors'][self.name]))
 
         if override_config is not None:
             if 'collectors' in override_config:
@@ -228,6 +256,35 @@ class Collector(object):
         Intended to put any code that should be run after any config reload
         event
         """
+        # The cached metric paths and TTL depend on the config
+        self._path_parts = None
+        self._path_cache = LRUCache(METRIC_PATH_CACHE_SIZE)
+        self._derivative_paths = {}
+        self._ttl = None
+
+        # Last values of the counters, kept across config reloads unless
+        # the storage changes
+        counter_ttl = int(self.config.get('counter_ttl', 10))
+        typecode = None
+        if self.config.get('counter_storage', 'dict') == 'array':
+            typecode = 'd'
+        if self.last_values is None or self.last_values.typecode != typecode:
+            self.last_values = CounterStore(counter_ttl, typecode)
+        self.last_values.ttl = counter_ttl
+
+        # Profiling of the next runs, kept across config reloads
+        if self.profiler is None:
+            self.profiler = RunProfiler(self.name, log=self.log)
+        self.profiler.runs = int(self.config.get('profile_runs', 5))
+        self.profiler.directory = (self.config.get('profile_dir') or
+                                   self.profiler.directory)
+        self.profiler.top = int(self.config.get('profile_top', 20))
+        # Start profiling when the option is turned on
+        profile = str_to_bool(self.config.get('profile', False))
+        if profile and not self._profile:
+            self.profiler.start()
+        self._profile = profile
+
         if 'byte_unit' in self.config:
             if isinstance(self.config['byte_unit'], basestring):
                 self.config['byte_unit'] = self.config['byte_unit'].split()
@@ -239,6 +296,14 @@ class Collector(object):
             self.config['measure_collector_time'] = str_to_bool(
                 self.config['measure_collector_time'])
 
+        if 'measure_scheduler' in self.config:
+            self.config['measure_scheduler'] = str_to_bool(
+                self.config['measure_scheduler'])
+
+        if 'measure_counter_state' in self.config:
+            self.config['measure_counter_state'] = str_to_bool(
+                self.config['measure_counter_state'])
+
         # Raise an error if both whitelist and blacklist are specified
         if ((self.config.get('metrics_whitelist', None) and
              self.config.get('metrics_blacklist', None))):
@@ -247,10 +312,10 @@ class Collector(object):
                 'in file %s' % self.configfile)
 
         if self.config.get('metrics_whitelist', None):
-            self.config['metrics_whitelist'] = re.compile(
+            self.config['metrics_whitelist'] = MetricFilter(
                 self.config['metrics_whitelist'])
         elif self.config.get('metrics_blacklist', None):
-            self.config['metrics_blacklist'] = re.compile(
+            self.config['metrics_blacklist'] = MetricFilter(
                 self.config['metrics_blacklist'])
 
     def get_default_config_help(self):
@@ -261,10 +326,35 @@ class Collector(object):
             'enabled': 'Enable collecting these metrics',
             'byte_unit': 'Default numeric output(s)',
             'measure_collector_time': 'Collect the collector run time in ms',
+            'measure_scheduler': 'Collect how late the collector runs '
+                                 'start, the skipped intervals and overruns',
+            'counter_ttl': 'Number of runs a counter is remembered for '
+                           'after it was last updated, 0 to never forget',
+            'counter_storage': 'dict, or array to keep the counter values '
+                               'in an array of doubles to save memory',
+            'measure_counter_state': 'Collect the number of counters '
+                                     'remembered and evicted',
+            'counter_state_path': 'Directory to save the counters to, so '
+                                  'rates are not lost over a restart',
+            'counter_state_max_age': 'Number of intervals after which '
+                                     'saved counters are too old to restore',
+            'counter_state_save_interval': 'Seconds between saves of the '
+                                           'counters, they are also saved '
+                                           'on shutdown',
             'metrics_whitelist': 'Regex to match metrics to transmit. ' +
                                  'Mutually exclusive with metrics_blacklist',
             'metrics_blacklist': 'Regex to match metrics to block. ' +
                                  'Mutually exclusive with metrics_whitelist',
+            'shared': 'Run in the shared collector process when the server '
+                      'collector_scheduler is shared. Defaults to whether '
+                      'the collector is known to be safe to share',
+            'profile': 'Profile the first profile_runs runs with cProfile. '
+                       'Sending SIGUSR1 to the collector process profiles '
+                       'the next ones',
+            'profile_runs': 'Number of runs to profile',
+            'profile_dir': 'Directory to write the profiles to',
+            'profile_top': 'Number of functions with the highest '
+                           'cumulative time to log',
         }
 
     def get_default_config(self):
@@ -312,6 +402,35 @@ class Collector(object):
             # Collect the collector run time in ms
             'measure_collector_time': False,
 
+            # Collect the scheduler lag, skipped intervals and overruns
+            'measure_scheduler': False,
+
+            # Runs a counter is remembered for after its last update
+            'counter_ttl': 10,
+
+            # Storage of the counter values, dict or array
+            'counter_storage': 'dict',
+
+            # Collect the number of counters remembered and evicted
+            'measure_counter_state': False,
+
+            # Directory to save the counters to over restarts, disabled when
+            # empty
+            'counter_state_path': '',
+
+            # Intervals after which saved counters are too old to restore
+            'counter_state_max_age': 3,
+
+            # Seconds between saves of the counters
+            'counter_state_save_interval': 60,
+
+            # Profile the first runs, written to profile_dir or a directory
+            # in the temporary directory when empty
+            'profile': False,
+            'profile_runs': 5,
+            'profile_dir': '',
+            'profile_top': 20,
+
             # Whitelist of metrics to let through
             'metrics_whitelist': None,
 
@@ -321,35 +440,28 @@ class Collector(object):
 
     def merge_config(self, other, prefix=None):
         if prefix:
-            othercopy = deepcopy(other)
+            othercopy = copy_section(other)
             for key in othercopy.keys():
                 othercopy[prefix + key] = othercopy.pop(key)
             self.config.merge(othercopy)
         else:
-            self.config.merge(other)
+            self.config.merge(copy_section(other))
 
-    def get_metric_path(self, name, instance=None):
+    def _get_path_parts(self):
         """
-        Get metric path.
-        Instance indicates that this is a metric for a
-            virtual machine and should have a different
-            root prefix.
+        Returns the collector path, the metric path prefix including the
+        hostname and suffix, the hostname, and the path prefix and collector
+        path components carried by the metrics. They only depend on the
+        config so they are computed once per config load.
         """
+        if self._path_parts is not None:
+            return self._path_parts
+
         if 'path' in self.config:
             path = self.config['path']
         else:
             path = self.__class__.__name__
 
-        if instance is not None:
-            if 'instance_prefix' in self.config:
-                prefix = self.config['instance_prefix']
-            else:
-                prefix = 'instances'
-            if path == '.':
-                return '.'.join([prefix, instance, name])
-            else:
-                return '.'.join([prefix, instance, path, name])
-
         if 'path_prefix' in self.config:
             prefix = self.config['path_prefix']
         else:
@@ -361,6 +473,16 @@ class Collector(object):
             suffix = None
 
         hostname = get_hostname(self.config)
+
+        # Hand the path components to the metrics when they are the same as
+        # what Metric would parse out of the path, so handlers don't have to
+        components = None
+        if (hostname and prefix and not suffix and
+                path and path != '.' and '.' not in path and
+                '.'.join((prefix, hostname)).index(hostname) ==
+                len(prefix) + 1):
+            components = (prefix, path)
+
         if hostname is not None:
             if prefix:
                 prefix = ".".join((prefix, hostname))
@@ -371,13 +493,56 @@ class Collector(object):
         if suffix:
             prefix = '.'.join((prefix, suffix))
 
-        path_r = [name]
-        if path and path != '.':
-            path_r.insert(0, path)
-        if prefix and prefix != '':
-            path_r.insert(0, prefix)
+        self._path_parts = (path, prefix, hostname, components)
+        return self._path_parts
+
+    def get_metric_path(self, name, instance=None):
+        """
+        Get metric path.
+        Instance indicates that this is a metric for a
+            virtual machine and should have a different
+            root prefix.
+        """
+        if instance is None:
+            key = name
+        else:
+            key = (instance, name)
+
+        metric_path = self._path_cache.get(key)
+        if metric_path is not None:
+            return metric_path
 
-        return '.'.join(path_r)
+        path, prefix, hostname, components = self._get_path_parts()
+
+        if instance is not None:
+            if 'instance_prefix' in self.config:
+                prefix = self.config['instance_prefix']
+            else:
+                prefix = 'instances'
+            if path == '.':
+                metric_path = '.'.join([prefix, instance, name])
+            else:
+                metric_path = '.'.join([prefix, instance, path, name])
+        else:
+            path_r = [name]
+            if path and path != '.':
+                path_r.insert(0, path)
+            if prefix and prefix != '':
+                path_r.insert(0, prefix)
+            metric_path = '.'.join(path_r)
+
+        self._path_cache[key] = metric_path
+
+        return metric_path
+
+    def get_metric_ttl(self):
+        """
+        Get the TTL of the published metrics
+        """
+        if self._ttl is None:
+            self._ttl = float(self.config['interval']) * float(
+                self.config['ttl_multiplier'])
+        return self._ttl
 
     def get_hostname(self):
         return get_hostname(self.config)
@@ -395,24 +560,34 @@ class Collector(object):
         """
         # Check whitelist/blacklist
         if self.config['metrics_whitelist']:
-            if not self.config['metrics_whitelist'].match(name):
+            if not self.config['metrics_whitelist'].matches(name):
                 return
         elif self.config['metrics_blacklist']:
-            if self.config['metrics_blacklist'].match(name):
+            if self.config['metrics_blacklist'].matches(name):
                 return
 
         # Get metric Path
         path = self.get_metric_path(name, instance=instance)
 
         # Get metric TTL
-        ttl = float(self.config['interval']) * float(
-            self.config['ttl_multiplier'])
+        ttl = self.get_metric_ttl()
+
+        # Get the path components known to the collector
+        hostname, components = self._get_path_parts()[2:]
+        if instance is None and components is not None:
+            path_prefix, collector_path = components
+            metric_path = name
+        else:
+            path_prefix = collector_path = metric_path = None
 
         # Create Metric
         try:
             metric = Metric(path, value, raw_value=raw_value, timestamp=None,
-                            precision=precision, host=self.get_hostname(),
-                            metric_type=metric_type, ttl=ttl)
+                            precision=precision, host=hostname,
+                            metric_type=metric_type, ttl=ttl,
+                            path_prefix=path_prefix,
+                            collector_path=collector_path,
+                            metric_path=metric_path)
         except DiamondException:
             self.log.error(('Error when creating new Metric: path=%r, '
                             'value=%r'), path, value)
@@ -425,6 +600,7 @@ class Collector(object):
         """
         Publish a Metric object
         """
+        self._metrics_published += 1
         # Process Metric
         for handler in self.handlers:
             handler._process(metric)
@@ -477,6 +653,11 @@ class Collector(object):
             # If we pass in a interval, use it rather then the configured one
             if interval is None:
                 interval = float(self.config['interval'])
+                # The first values after a restart were restored from a
+                # counter state saved an unknown time ago
+                if self.last_values.restored is not None:
+                    interval = max(time.time() - self.last_values.restored,
+                                   1.0)
 
             # Get Change in Y (time)
             if time_delta:
@@ -496,15 +677,109 @@ class Collector(object):
         # Return result
         return result
 
-    def _run(self):
+    def derivatives(self, names, values, max_values=0, time_delta=True,
+                    interval=None, allow_negative=False, instance=None):
+        """
+        Calculate the derivative of many metrics at once, the same as calling
+        derivative for each of them. max_values is either the max value of
+        every metric or a list with the max value of each metric. Returns the
+        results in the order of names
         """
-        Run the collector unless it's already running
+        # Collectors pass the same names every run, reuse the paths of the
+        # last call rather than looking up every one of them
+        names = list(names)
+        cached = self._derivative_paths.get(instance)
+        if cached is not None and cached[0] == names:
+            paths = cached[1]
+        else:
+            paths = map(self.get_metric_path, names, [instance] * len(names))
+            self._derivative_paths[instance] = (names, paths)
+        old_values = self.last_values.swap(paths, values)
+
+        # If we pass in a interval, use it rather then the configured one
+        if interval is None:
+            interval = float(self.config['interval'])
+            # The first values after a restart were restored from a counter
+            # state saved an unknown time ago
+            if self.last_values.restored is not None:
+                interval = max(time.time() - self.last_values.restored, 1.0)
+
+        # Get Change in Y (time)
+        if time_delta:
+            derivative_y = float(interval)
+        else:
+            derivative_y = 1.0
+
+        if not isinstance(max_values, (list, tuple)):
+            max_values = [max_values] * len(names)
+
+        results = []
+        append = results.append
+        for old, new, max_value in zip(old_values, values, max_values):
+            if old is None:
+                append(0)
+                continue
+            # Check for rollover
+            if new < old:
+                old = old - max_value
+            result = float(new - old) / derivative_y
+            if result < 0 and not allow_negative:
+                result = 0
+            append(result)
+        return results
+
+    def set_self_metrics(self, registry):
         """
+        Allocate the counters reporting on the collector in the registry of
+        the agent metrics. Has to be called before the collector process is
+        forked
+        """
+        prefix = 'collectors.%s.' % self.name.replace(' ', '_').replace(
+            '.', '_')
+        self._self_metrics = {
+            'runs': registry.counter(prefix + 'runs'),
+            'metrics': registry.gauge(prefix + 'metrics'),
+            'duration_ms': registry.gauge(prefix + 'duration_ms'),
+            'dropped': registry.counter(prefix + 'dropped'),
+            'rss_kb': registry.gauge(prefix + 'rss_kb'),
+        }
+
+    def _update_self_metrics(self, start_time):
+        stats = self._self_metrics
+        stats['runs'].inc()
+        stats['metrics'].set(self._metrics_published)
+        stats['duration_ms'].set(int((time.time() - start_time) * 1000))
+
+        # Metrics the handlers had to drop, like a QueueHandler finding the
+        # metric queue full
+        dropped = sum(getattr(handler, 'dropped', 0)
+                      for handler in self.handlers)
+        stats['dropped'].inc(max(dropped - self._dropped_reported, 0))
+        self._dropped_reported = dropped
+
+        rss = get_rss_kb()
+        if rss is not None:
+            stats['rss_kb'].set(rss)
+
+    def _run(self, job=None):
+        """
+        Run the collector unless it's already running. job is the scheduler
+        job running the collector, if any
+        """
+        self._metrics_published = 0
+        profiling = self.profiler.active
         try:
             start_time = time.time()
 
             # Collect Data
-            self.collect()
+            if profiling:
+                self.profiler.enable()
+                try:
+                    self.collect()
+                finally:
+                    self.profiler.disable()
+            else:
+                self.collect()
 
             end_time = time.time()
             collector_time = int((end_time - start_time) * 1000)
@@ -516,12 +791,82 @@ class Collector(object):
                     metric_name = 'collector_time_ms'
                     metric_value = collector_time
                     self.publish(metric_name, metric_value)
+
+            if job is not None and self.config.get('measure_scheduler'):
+                # How late the run started, how many intervals were skipped
+                # since the previous run and whether this run overran
+                self.publish('scheduler.lag_ms', int(job.lag * 1000))
+                self.publish('scheduler.skipped', job.missed)
+                self.publish('scheduler.overrun',
+                             int(end_time - start_time > job.interval))
+
+            # Forget the counters that are gone
+            self.last_values.advance()
+            if self.config.get('measure_counter_state'):
+                self.publish('counter_state.entries', len(self.last_values))
+                self.publish('counter_state.evicted',
+                             self.last_values.evicted)
+
+            save_interval = float(self.config.get(
+                'counter_state_save_interval', 60))
+            if (self._counter_state_saved is None or
+                    end_time - self._counter_state_saved >= save_interval):
+                self.save_counter_state()
         finally:
             # After collector run, invoke a flush
             # method on each handler.
             for handler in self.handlers:
                 handler._flush()
 
+            if self._self_metrics is not None:
+                self._update_self_metrics(start_time)
+
+            if profiling:
+                self.profiler.end_run()
+
+    def get_counter_state_file(self):
+        """
+        Returns the file the counters are saved to, or None
+        """
+        path = self.config.get('counter_state_path')
+        if not path:
+            return None
+        name = self.name.replace(' ', '_').replace(os.sep, '_')
+        return os.path.join(path, '%s.state' % name)
+
+    def save_counter_state(self):
+        """
+        Save the counters so they can be restored after a restart
+        """
+        state_file = self.get_counter_state_file()
+        if state_file is None or not len(self.last_values):
+            return
+        try:
+            self.last_values.save(state_file)
+        except (IOError, OSError), e:
+            self.log.error('%s: Failed to save counters to %s: %s',
+                           self.name, state_file, e)
+        self._counter_state_saved = time.time()
+
+    def load_counter_state(self):
+        """
+        Restore the counters saved by a previous run of the collector, if
+        they are recent enough
+        """
+        state_file = self.get_counter_state_file()
+        if state_file is None or not os.path.exists(state_file):
+            return
+        max_age = (float(self.config.get('counter_state_max_age', 3)) *
+                   float(self.config['interval']))
+        try:
+            count = self.last_values.load(state_file, max_age=max_age)
+        except (IOError, OSError, StateError), e:
+            self.log.error('%s: Failed to restore counters from %s: %s',
+                           self.name, state_file, e)
+            return
+        self.log.debug('%s: Restored %d counters from %s', self.name, count,
+                       state_file)
+
     def find_binary(self, binary):
         """
         Scan and return the first path to a binary that we can find
@@ -614,3 +959,40 @@ class ProcessCollector(Collector):
         except OSError:
             self.log.exception("Unable to run %s", command)
             return None
+
+
+class SelfMetricsCollector(Collector):
+    """
+    Publishes the metrics the agent keeps on itself, see
+    diamond.utils.selfmetrics. It is run by the server rather than a
+    collector process
+    """
+
+    def __init__(self, registry, metric_queue=None, *args, **kwargs):
+        self.registry = registry
+        self.metric_queue = metric_queue
+        super(SelfMetricsCollector, self).__init__(*args, **kwargs)
+
+    def get_default_config(self):
+        """
+        Returns the default collector settings
+        """
+        config = super(SelfMetricsCollector, self).get_default_config()
+        config.update({
+            'path': 'diamond',
+        })
+        return config
+
+    def collect(self):
+        if self.metric_queue is not None:
+            try:
+                self.publish('queue.depth', self.metric_queue.qsize())
+            except NotImplementedError:
+                # multiprocessing queues can't tell their size everywhere
+                pass
+
+        for name, value in self.registry.collect():
+            if name.endswith('.avg'):
+                self.publish(name, value, precision=2)
+            else:
+                self.publish(name, value)
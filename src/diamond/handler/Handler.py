@@ -6,6 +6,9 @@ import traceback
 from configobj import ConfigObj
 import time
 
+from diamond.utils.config import str_to_bool
+from diamond.utils.profiler import RunProfiler
+
 
 class Handler(object):
     """
@@ -40,6 +43,19 @@ class Handler(object):
             self.config['server_error_interval'])
         self._errors = {}
 
+        # Metrics reporting on the handler itself, if enabled
+        self._self_metrics = None
+
+        # Profiling of the next runs, a run ending with a flush
+        self.profiler = RunProfiler(
+            self.__class__.__name__,
+            runs=int(self.config['profile_runs']),
+            directory=self.config['profile_dir'],
+            top=int(self.config['profile_top']),
+            log=self.log)
+        if str_to_bool(self.config['profile']):
+            self.profiler.start()
+
         # Initialize Lock
         self.lock = threading.Lock()
 
@@ -51,6 +67,13 @@ class Handler(object):
             'get_default_config_help': 'get_default_config_help',
             'server_error_interval': ('How frequently to send repeated server '
                                       'errors'),
+            'profile': ('Profile the first profile_runs runs with cProfile, '
+                        'a run ending with a flush. Sending SIGUSR1 to the '
+                        'handler process profiles the next ones'),
+            'profile_runs': 'Number of runs to profile',
+            'profile_dir': 'Directory to write the profiles to',
+            'profile_top': ('Number of functions with the highest cumulative '
+                            'time to log'),
         }
 
     def get_default_config(self):
@@ -60,6 +83,10 @@ class Handler(object):
         return {
             'get_default_config': 'get_default_config',
             'server_error_interval': 120,
+            'profile': False,
+            'profile_runs': 5,
+            'profile_dir': '',
+            'profile_top': 20,
         }
 
     def _process(self, metric):
@@ -68,6 +95,10 @@ class Handler(object):
         """
         if not self.enabled:
             return
+        start_time = time.time()
+        profiling = self.profiler.active
+        if profiling:
+            self.profiler.enable()
         try:
             try:
                 self.lock.acquire()
@@ -75,8 +106,37 @@ class Handler(object):
             except Exception:
                 self.log.error(traceback.format_exc())
         finally:
+            if profiling:
+                self.profiler.disable()
             if self.lock.locked():
                 self.lock.release()
+            if self._self_metrics is not None:
+                self._update_self_metrics('process_ms', start_time)
+
+    def _process_batch(self, metrics):
+        """
+        Decorator for processing a list of metrics with a single lock,
+        catching exceptions
+        """
+        if not self.enabled:
+            return
+        start_time = time.time()
+        profiling = self.profiler.active
+        if profiling:
+            self.profiler.enable()
+        try:
+            try:
+                self.lock.acquire()
+                self.process_batch(metrics)
+            except Exception:
+                self.log.error(traceback.format_exc())
+        finally:
+            if profiling:
+                self.profiler.disable()
+            if self.lock.locked():
+                self.lock.release()
+            if self._self_metrics is not None:
+                self._update_self_metrics('process_ms', start_time)
 
     def process(self, metric):
         """
@@ -86,12 +146,29 @@ class Handler(object):
         """
         raise NotImplementedError
 
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics
+
+        Calls process for every metric by default. Optional: Should be
+        overridden in subclasses that can handle the whole list at once
+        """
+        for metric in metrics:
+            try:
+                self.process(metric)
+            except Exception:
+                self.log.error(traceback.format_exc())
+
     def _flush(self):
         """
         Decorator for flushing handlers with an lock, catching exceptions
         """
         if not self.enabled:
             return
+        start_time = time.time()
+        profiling = self.profiler.active
+        if profiling:
+            self.profiler.enable()
         try:
             try:
                 self.lock.acquire()
@@ -99,8 +176,14 @@ class Handler(object):
             except Exception:
                 self.log.error(traceback.format_exc())
         finally:
+            if profiling:
+                self.profiler.disable()
             if self.lock.locked():
                 self.lock.release()
+            if self._self_metrics is not None:
+                self._update_self_metrics('flush_ms', start_time)
+            if profiling:
+                self.profiler.end_run()
 
     def flush(self):
         """
@@ -110,6 +193,44 @@ class Handler(object):
         """
         pass
 
+    def get_backlog(self):
+        """
+        Returns the number of metrics waiting to be sent, or None for
+        handlers not keeping any
+
+        Optional: Should be overridden in subclasses
+        """
+        return None
+
+    def set_self_metrics(self, registry):
+        """
+        Allocate the counters reporting on the handler in the registry of the
+        agent metrics. Has to be called before the handler process is forked
+        """
+        prefix = 'handlers.%s.' % self.__class__.__name__
+        self._self_metrics = {
+            # Time taken by each call processing a metric or a batch of
+            # metrics, and by each flush
+            'process_ms': registry.histogram(prefix + 'process_ms'),
+            'flush_ms': registry.histogram(prefix + 'flush_ms'),
+            'dropped': registry.counter(prefix + 'dropped'),
+        }
+        if self.get_backlog() is not None:
+            self._self_metrics['backlog'] = registry.gauge(prefix + 'backlog')
+
+    def _update_self_metrics(self, name, start_time):
+        stats = self._self_metrics
+        stats[name].observe((time.time() - start_time) * 1000)
+        if 'backlog' in stats:
+            stats['backlog'].set(self.get_backlog())
+
+    def _count_dropped(self, count):
+        """
+        Count metrics the handler had to drop
+        """
+        if self._self_metrics is not None:
+            self._self_metrics['dropped'].inc(count)
+
     def _throttle_error(self, msg, *args, **kwargs):
         """
         Avoids sending errors repeatedly. Waits at least
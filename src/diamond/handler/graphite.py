@@ -17,9 +17,16 @@ use it.
 """
 
 from Handler import Handler
+from diamond.utils.config import str_to_bool
+from collections import deque
+import bisect
+import errno
 import socket
 import time
 
+# Errors of a non-blocking send that mean the socket buffer is full
+RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
 
 class GraphiteHandler(Handler):
     """
@@ -54,6 +61,22 @@ class GraphiteHandler(Handler):
         self.reconnect_interval = int(self.config['reconnect_interval'])
         self.last_connect_timestamp = -1
 
+        # Buffered mode writes to a non-blocking tcp socket
+        self.buffered = (str_to_bool(self.config['buffered']) and
+                         not self.proto.startswith('udp'))
+        self.buffer_size = int(self.config['buffer_size'])
+        self.flush_interval = float(self.config['flush_interval'])
+        self.max_backlog = int(self.config['max_backlog'])
+        # Data waiting to be written, and the reused buffer being written
+        # with the offsets the data in it ends at
+        self.backlog = deque()
+        self.backlog_bytes = 0
+        self.buffer = bytearray(self.buffer_size if self.buffered else 0)
+        self.buffer_ends = []
+        self.buffer_length = 0
+        self.buffer_offset = 0
+        self.last_write = time.time()
+
         # Connect
         self._connect()
 
@@ -77,6 +100,15 @@ class GraphiteHandler(Handler):
             'scope_id': 'IPv6 Scope ID',
             'reconnect_interval': 'How often (seconds) to reconnect to '
                                   'graphite. Default (0) is never',
+            'buffered': 'Write through a buffer to a non-blocking socket '
+                        'instead of sending every batch, tcp only',
+            'buffer_size': 'Bytes buffered before they are written, in '
+                           'buffered mode',
+            'flush_interval': 'Seconds after which buffered data is written '
+                              'even if the buffer is not full',
+            'max_backlog': 'How many metrics to keep in buffered mode while '
+                           'graphite is unreachable or slow. The oldest are '
+                           'dropped',
         })
 
         return config
@@ -100,6 +132,10 @@ class GraphiteHandler(Handler):
             'flow_info': 0,
             'scope_id': 0,
             'reconnect_interval': 0,
+            'buffered': False,
+            'buffer_size': 65536,
+            'flush_interval': 1.0,
+            'max_backlog': 100000,
         })
 
         return config
@@ -119,9 +155,23 @@ class GraphiteHandler(Handler):
         if len(self.metrics) >= self.batch_size:
             self._send()
 
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics, sending them to graphite in one go
+        """
+        self.metrics.extend([str(metric) for metric in metrics])
+        if len(self.metrics) >= self.batch_size:
+            self._send()
+
     def flush(self):
         """Flush metrics in queue"""
-        self._send()
+        if self.buffered:
+            self._send_buffered(force=True)
+        else:
+            self._send()
+
+    def get_backlog(self):
+        return len(self.metrics) + len(self.backlog)
 
     def _send_data(self, data):
         """
@@ -152,6 +202,10 @@ class GraphiteHandler(Handler):
         """
         Send data to graphite. Data that can not be sent will be queued.
         """
+        if self.buffered:
+            self._send_buffered()
+            return
+
         # Check to see if we have a valid socket. If not, try to connect.
         try:
             try:
@@ -180,8 +234,80 @@ class GraphiteHandler(Handler):
                               ' oldest %d and keeping newest %d metrics',
                               len(self.metrics) - abs(trim_offset),
                               abs(trim_offset))
+                self._count_dropped(len(self.metrics) - abs(trim_offset))
                 self.metrics = self.metrics[trim_offset:]
 
+    def _send_buffered(self, force=False):
+        """
+        Move the metrics to the backlog, which is written once it fills the
+        buffer, flush_interval seconds after the previous write or when forced
+        """
+        for data in self.metrics:
+            self.backlog.append(data)
+            self.backlog_bytes += len(data)
+        self.metrics = []
+
+        dropped = len(self.backlog) - self.max_backlog
+        if dropped > 0:
+            self._throttle_error("GraphiteHandler: Backlog full, dropping the "
+                                 "oldest metrics.")
+            self._count_dropped(dropped)
+            for _ in xrange(dropped):
+                self.backlog_bytes -= len(self.backlog.popleft())
+
+        if (force or self.backlog_bytes >= self.buffer_size or
+                time.time() - self.last_write >= self.flush_interval):
+            self._write()
+
+    def _fill_buffer(self):
+        """
+        Copy data from the backlog into the buffer, up to its size
+        """
+        length = 0
+        del self.buffer_ends[:]
+        while self.backlog:
+            size = len(self.backlog[0])
+            if length and length + size > self.buffer_size:
+                break
+            self.buffer[length:length + size] = self.backlog.popleft()
+            self.backlog_bytes -= size
+            length += size
+            self.buffer_ends.append(length)
+        self.buffer_length = length
+        self.buffer_offset = 0
+
+    def _write(self):
+        """
+        Write the buffer and the backlog for as long as the socket takes them
+        without blocking. What is left is written by the next write
+        """
+        self.last_write = time.time()
+        if self.socket is None:
+            self._connect()
+        if self.socket is None:
+            return
+
+        try:
+            while True:
+                if self.buffer_offset >= self.buffer_length:
+                    if not self.backlog:
+                        break
+                    self._fill_buffer()
+                # No view is kept, the buffer grows for data larger than it
+                self.buffer_offset += self.socket.send(memoryview(
+                    self.buffer)[self.buffer_offset:self.buffer_length])
+        except socket.error, e:
+            if e.args[0] not in RETRY_ERRNOS:
+                self._close()
+                self._throttle_error("GraphiteHandler: Socket error, "
+                                     "reconnecting. %s", e)
+                return
+        self._reset_errors()
+
+        if (self.buffer_offset >= self.buffer_length and not self.backlog and
+                self._time_to_reconnect()):
+            self._close()
+
     def _connect(self):
         """
         Connect to the graphite server
@@ -242,6 +368,8 @@ class GraphiteHandler(Handler):
                            "graphite server %s:%d.",
                            self.host, self.port)
             self.last_connect_timestamp = time.time()
+            if self.buffered:
+                self.socket.setblocking(0)
         except Exception, ex:
             # Log Error
             self._throttle_error("GraphiteHandler: Failed to connect to "
@@ -257,3 +385,9 @@ class GraphiteHandler(Handler):
         if self.socket is not None:
             self.socket.close()
         self.socket = None
+
+        # The rest of data cut by a partial write would be garbage on a new
+        # connection, carry on from the next one
+        if 0 < self.buffer_offset < self.buffer_length:
+            i = bisect.bisect_left(self.buffer_ends, self.buffer_offset)
+            self.buffer_offset = self.buffer_ends[i]
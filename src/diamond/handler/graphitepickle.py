@@ -85,13 +85,34 @@ class GraphitePickleHandler(GraphiteHandler):
             # Clear Batch
             self.batch = []
 
-    def _pickle_batch(self):
+    def process_batch(self, metrics):
+        # Convert metrics to pickle format
+        self.batch.extend([(metric.path, (metric.timestamp, metric.value))
+                           for metric in metrics])
+        if len(self.batch) < self.batch_size:
+            return
+
+        # Pickle every full batch and keep the remainder for later
+        end = len(self.batch) - (len(self.batch) % self.batch_size)
+        self.log.debug("GraphitePickleHandler: Sending %d batches of size: %d",
+                       end / self.batch_size, self.batch_size)
+        self.metrics = [
+            self._pickle_batch(self.batch[offset:offset + self.batch_size])
+            for offset in xrange(0, end, self.batch_size)]
+        self.batch = self.batch[end:]
+        # Send pickled batches
+        self._send()
+
+    def _pickle_batch(self, batch=None):
         """
         Pickle the metrics into a form that can be understood
         by the graphite pickle connector.
         """
+        if batch is None:
+            batch = self.batch
+
         # Pickle
-        payload = pickle.dumps(self.batch)
+        payload = pickle.dumps(batch)
 
         # Pack Message
         header = struct.pack("!L", len(payload))
@@ -6,7 +6,9 @@ Send metrics to a http endpoint via POST
 """
 
 from Handler import Handler
-import urllib2
+from httptransport import HTTP_CONFIG
+from httptransport import HTTP_CONFIG_HELP
+from httptransport import HttpTransport
 
 
 class HttpPostHandler(Handler):
@@ -17,6 +19,7 @@ class HttpPostHandler(Handler):
         self.metrics = []
         self.batch_size = int(self.config['batch'])
         self.url = self.config.get('url')
+        self.transport = HttpTransport.from_config(self.config, self.log)
 
     def get_default_config_help(self):
         """
@@ -28,6 +31,7 @@ class HttpPostHandler(Handler):
             'url': 'Fully qualified url to send metrics to',
             'batch': 'How many to store before sending to the graphite server',
         })
+        config.update(HTTP_CONFIG_HELP)
 
         return config
 
@@ -41,6 +45,7 @@ class HttpPostHandler(Handler):
             'url': 'http://localhost/blah/blah/blah',
             'batch': 100,
         })
+        config.update(HTTP_CONFIG)
 
         return config
 
@@ -56,6 +61,8 @@ class HttpPostHandler(Handler):
         self.post()
 
     def post(self):
-        req = urllib2.Request(self.url, "\n".join(self.metrics))
-        urllib2.urlopen(req)
+        # The content type urllib2 used to send
+        self.transport.post(
+            self.url, "\n".join(self.metrics),
+            {'Content-Type': 'application/x-www-form-urlencoded'})
         self.metrics = []
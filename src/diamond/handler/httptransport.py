@@ -0,0 +1,265 @@
+# coding=utf-8
+
+"""
+HTTP transport shared by the handlers posting metrics over http or https.
+
+Connections are kept alive between posts, one per scheme, host and port, so
+a handler posting every interval pays the TCP and TLS handshakes once rather
+than on every post. Request bodies can be gzipped.
+
+Only the requests the server can't have received are retried: those failing
+to connect, and those about to go out on a kept alive connection the server
+has closed, which are sent on a new one. Requests of idempotent methods are
+retried after any error or a 5xx response as well, posts aren't since the
+server may have acted on them. Rather than waiting in the handler before
+trying a server that can't be connected to again, the requests to it fail
+straight away until the backoff is over.
+
+A transport is not thread safe, every handler has its own.
+"""
+
+import gzip
+import httplib
+import logging
+import select
+import socket
+import time
+import urllib
+import urlparse
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+from diamond.utils.config import str_to_bool
+
+# Options of the handlers using a transport
+HTTP_CONFIG = {
+    'timeout': 15,
+    'gzip': False,
+    'retries': 2,
+    'retry_backoff': 0.5,
+}
+
+HTTP_CONFIG_HELP = {
+    'timeout': 'Seconds to wait for the http server',
+    'gzip': 'Compress the posted data with gzip',
+    'retries': 'How many times to retry a request failing to connect',
+    'retry_backoff': 'Seconds the requests to a server fail without trying '
+                     'to connect after connecting to it failed, doubled for '
+                     'every following failure',
+}
+
+# Methods a server can be sent again without acting on them twice
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                                'TRACE'])
+
+# Most seconds the requests to a server fail without trying to connect
+MAX_BACKOFF = 60
+
+
+class HttpError(Exception):
+    """
+    A request failed with an error response
+    """
+
+    def __init__(self, url, code, reason, body=''):
+        Exception.__init__(self, 'HTTP Error %d: %s' % (code, reason))
+        self.url = url
+        self.code = code
+        self.reason = reason
+        self.body = body
+
+
+class HttpResponse(object):
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        # Header names are lower case
+        self.headers = headers
+        self.body = body
+
+
+class HttpTransport(object):
+    """
+    Sends requests over persistent connections
+    """
+
+    def __init__(self, timeout=15, gzip=False, retries=2, retry_backoff=0.5,
+                 log=None):
+        self.timeout = timeout
+        self.gzip = gzip
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.log = log or logging.getLogger('diamond')
+        # (scheme, host, port) -> (connection, whether the request line
+        # takes the whole url because it goes to a proxy)
+        self.connections = {}
+        # (scheme, host, port) -> (consecutive failures to connect, time
+        # before which the requests fail without trying to connect)
+        self.backoffs = {}
+
+    @classmethod
+    def from_config(cls, config, log=None):
+        return cls(timeout=float(config['timeout']),
+                   gzip=str_to_bool(config['gzip']),
+                   retries=int(config['retries']),
+                   retry_backoff=float(config['retry_backoff']),
+                   log=log)
+
+    def close(self):
+        for connection, _ in self.connections.itervalues():
+            connection.close()
+        self.connections.clear()
+
+    def post(self, url, body, headers=None):
+        return self.request('POST', url, body, headers)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request and return its response, raising HttpError for an
+        error response and socket.error or httplib.HTTPException when the
+        server can't be reached
+        """
+        headers = dict(headers or {})
+        if body is not None and self.gzip:
+            body = compress(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        failures, retry_time = self.backoffs.get(key, (0, 0))
+        if time.time() < retry_time:
+            raise socket.error('Connecting to %s:%s failed, not trying again '
+                               'for %.1fs' % (parts.hostname, parts.port,
+                                              retry_time - time.time()))
+
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                self._open(key, parts)
+            except (socket.error, httplib.HTTPException), e:
+                # Nothing was sent
+                error = e
+                connected = False
+                retry = True
+            else:
+                connected = True
+                self.backoffs.pop(key, None)
+                try:
+                    response = self._request(key, parts, method, url, body,
+                                             headers)
+                except (socket.error, httplib.HTTPException), e:
+                    error = e
+                else:
+                    if response.status < 400:
+                        return response
+                    error = HttpError(url, response.status, response.reason,
+                                      response.body)
+                    if response.status < 500:
+                        raise error
+                # The server may have received the request
+                retry = idempotent
+
+            if not retry or attempt >= self.retries:
+                if not connected:
+                    failures += 1
+                    delay = min(self.retry_backoff * 2 ** (failures - 1),
+                                MAX_BACKOFF)
+                    self.backoffs[key] = (failures, time.time() + delay)
+                raise error
+            attempt += 1
+            self.log.debug('HttpTransport: %s %s failed: %s, retry %d',
+                           method, url, error, attempt)
+
+    def _open(self, key, parts):
+        """
+        Make sure there is a connection to the server of a url, replacing a
+        kept alive connection the server closed
+        """
+        if key in self.connections:
+            connection, _ = self.connections[key]
+            if connection.sock is not None and not is_readable(
+                    connection.sock):
+                return
+            # The server closed the idle connection, or sent something
+            # unasked for
+            self._close(key)
+
+        connection, absolute = self._connect(parts)
+        try:
+            connection.connect()
+        except:
+            connection.close()
+            raise
+        self.connections[key] = (connection, absolute)
+
+    def _request(self, key, parts, method, url, body, headers):
+        connection, absolute = self.connections[key]
+        path = url if absolute else (parts.path or '/')
+        if not absolute and parts.query:
+            path += '?' + parts.query
+
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            # The response has to be read before the next request
+            data = response.read()
+        except:
+            self._close(key)
+            raise
+
+        if response.will_close:
+            self._close(key)
+        return HttpResponse(response.status, response.reason,
+                            dict(response.getheaders()), data)
+
+    def _connect(self, parts):
+        """
+        Create a connection to the server of a url, or to the proxy set up
+        for it in the environment like urllib2 does
+        """
+        if parts.scheme == 'https':
+            cls = httplib.HTTPSConnection
+        else:
+            cls = httplib.HTTPConnection
+
+        proxy = urllib.getproxies().get(parts.scheme)
+        if proxy and not urllib.proxy_bypass(parts.hostname):
+            proxy = urlparse.urlsplit(proxy)
+            connection = cls(proxy.hostname, proxy.port,
+                             timeout=self.timeout)
+            if parts.scheme == 'https':
+                # Tunnel through the proxy
+                connection.set_tunnel(parts.hostname, parts.port)
+                return connection, False
+            return connection, True
+
+        return cls(parts.hostname, parts.port, timeout=self.timeout), False
+
+    def _close(self, key):
+        connection, _ = self.connections.pop(key)
+        connection.close()
+
+
+def is_readable(sock):
+    """
+    Whether there is something to read on a socket, or it was closed
+    """
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+
+def compress(data):
+    output = StringIO()
+    f = gzip.GzipFile(fileobj=output, mode='wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    return output.getvalue()
@@ -153,6 +153,29 @@ class InfluxdbHandler(Handler):
                 self.batch_count,
                 (time.time() - self.batch_timestamp))
 
+    def process_batch(self, metrics):
+        room = self.metric_max_cache - self.batch_count + 1
+        if len(metrics) > room:
+            # The batch may have to be sent to make room for the rest of the
+            # metrics, one metric at a time like process
+            return super(InfluxdbHandler, self).process_batch(metrics)
+
+        for metric in metrics:
+            self.batch.setdefault(metric.path, []).append(
+                [metric.timestamp, metric.value])
+        self.batch_count += len(metrics)
+        # If there are sufficient metrics, then send
+        if self.batch_count >= self.batch_size and (
+                time.time() - self.batch_timestamp) > 2**self.time_multiplier:
+            self.log.debug(
+                "InfluxdbHandler: Sending batch sizeof : %d/%d after %fs",
+                self.batch_count,
+                self.batch_size,
+                (time.time() - self.batch_timestamp))
+            # reset the batch timer
+            self.batch_timestamp = time.time()
+            self._send()
+
     def _send(self):
         """
         Send data to Influxdb. Data that can not be sent will be kept in queued.
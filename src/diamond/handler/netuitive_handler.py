@@ -14,6 +14,10 @@ Enable handler
 """
 
 from Handler import Handler
+from httptransport import HTTP_CONFIG
+from httptransport import HTTP_CONFIG_HELP
+from httptransport import HttpError
+from httptransport import HttpTransport
 import logging
 import re
 import platform
@@ -120,6 +124,7 @@ class NetuitiveHandler(Handler):
             self.version = self._get_version()
             self.api = netuitive.Client(self.config['url'], self.config[
                                         'api_key'], self.version)
+            self.transport = HttpTransport.from_config(self.config, self.log)
 
             self.element = netuitive.Element(
                 location=self.config.get('location'))
@@ -175,6 +180,7 @@ class NetuitiveHandler(Handler):
             'max_backlog_multiplier': 'how many batches to store before trimming',
             'trim_backlog_multiplier': 'Trim down how many batches',
         })
+        config.update(HTTP_CONFIG_HELP)
         return config
 
     def get_default_config(self):
@@ -194,6 +200,7 @@ class NetuitiveHandler(Handler):
             'max_backlog_multiplier': 5,
             'trim_backlog_multiplier': 4,
         })
+        config.update(HTTP_CONFIG)
         return config
 
     def __del__(self):
@@ -373,7 +380,7 @@ class NetuitiveHandler(Handler):
             enabled_collectors = []
 
             if os.path.isfile(cf):
-                serverconf = load_server_config(cf)
+                serverconf = load_server_config(cf, copy=False)
 
             c = serverconf['collectors']
 
@@ -418,6 +425,53 @@ class NetuitiveHandler(Handler):
             logging.debug('flushing data due to exceeding batch_size')
             self.flush()
 
+    def get_backlog(self):
+        element = getattr(self, 'element', None)
+        if element is None:
+            return 0
+        return len(element.samples)
+
+    def _post(self, element):
+        """
+        Post the element like netuitive.Client.post does, over the persistent
+        connection of the transport
+        """
+        api = self.api
+        if not (hasattr(api, 'dataurl') and hasattr(element, 'merge_metrics')):
+            return api.post(element)
+
+        if api.disabled is True:
+            element.clear_samples()
+            logging.error('Posting has been disabled. '
+                          'See previous errors for details.')
+            return False
+
+        element.merge_metrics()
+        payload = json.dumps([element], default=lambda o: o.__dict__,
+                             sort_keys=True)
+        headers = {'Content-Type': 'application/json',
+                   'User-Agent': api.agent}
+        try:
+            self.transport.post(api.dataurl, payload, headers)
+        except HttpError as e:
+            if e.code in api.kill_codes:
+                api.disabled = True
+                logging.error('Posting has been disabled: %s', e)
+                return False
+            error = e
+        except Exception as e:
+            error = e
+        else:
+            api.post_error_count = 0
+            return True
+
+        api.post_error_count += 1
+        if api.post_error_count > api.max_post_errors:
+            element.clear_samples()
+        logging.error('error posting payload to api ingest endpoint (%s): %s',
+                      api.dataurl, error)
+        return False
+
     def flush(self):
         logging.debug('sending data')
 
@@ -436,11 +490,13 @@ class NetuitiveHandler(Handler):
                              ' oldest %d and keeping newest %d metrics',
                              len(self.element.metrics) - abs(trim_offset),
                              abs(trim_offset))
+                self._count_dropped(
+                    len(self.element.metrics) - abs(trim_offset))
                 self.element.metrics = self.element.metrics[trim_offset:]
 
             self._add_aws_meta()
 
-            self.api.post(self.element)
+            self._post(self.element)
             if self.config['write_metric_fqns']:
                 self.write_metric_fqns()
 
@@ -6,6 +6,9 @@ do not try to use it as a normal handler
 """
 
 from Handler import Handler
+from diamond.metric import MetricBatch
+from diamond.utils.wire import MetricEncoder
+import os
 import Queue
 
 
@@ -17,6 +20,15 @@ class QueueHandler(Handler):
 
         self.queue = queue
 
+        # Metrics are buffered during a collector run and handed to the
+        # handler process as a single batch
+        self.metrics = []
+        self.batch_size = int(self.config.get('server', {}).get(
+            'metric_batch_size', 1000))
+        self.encoder = None
+        # Metrics dropped because the queue was full
+        self.dropped = 0
+
     def __del__(self):
         """
         Ensure as many of the metrics as possible are sent to the handers on
@@ -32,10 +44,9 @@ class QueueHandler(Handler):
         We skip any locking code due to the fact that this is now a single
         process per collector
         """
-        try:
-            self.queue.put(metric, block=False)
-        except Queue.Full:
-            self._throttle_error('Queue full, check handlers for delays')
+        self.metrics.append(metric)
+        if self.batch_size > 0 and len(self.metrics) >= self.batch_size:
+            self._send(flush=False)
 
     def flush(self):
         return self._flush()
@@ -45,8 +56,29 @@ class QueueHandler(Handler):
         We skip any locking code due to the fact that this is now a single
         process per collector
         """
-        # Send a None down the queue to indicate a flush
+        # Send the buffered metrics down the queue and flush the handlers
+        self._send(flush=True)
+
+    def _send(self, flush):
+        # The handler is created before the collector processes are forked,
+        # each of them needs an encoder of its own
+        if self.encoder is None or self.encoder.pid != os.getpid():
+            self.encoder = MetricEncoder()
+
+        batch = MetricBatch(self.metrics, flush=flush)
+        self.metrics = []
         try:
-            self.queue.put(None, block=False)
+            data = self.encoder.encode(batch)
+            self.queue.put(data, block=False)
         except Queue.Full:
-            self._throttle_error('Queue full, check handlers for delays')
+            self.encoder.rollback()
+            self.dropped += len(batch)
+            self._throttle_error('Queue full, check handlers for delays. '
+                                 'Dropped %d metrics', len(batch))
+        except:
+            # Interrupted, like by the alarm of the scheduler, or the queue
+            # failed. The batch may or may not have been delivered, so the
+            # string table of the decoder is started over rather than
+            # guessed
+            self.encoder.reset()
+            raise
@@ -5,7 +5,7 @@ Send metrics to signalfx
 
 #### Dependencies
 
- * urllib2
+ * httplib
 
 
 #### Configuration
@@ -20,10 +20,15 @@ Enable this handler
 
 from Handler import Handler
 from diamond.util import get_diamond_version
+from httptransport import HTTP_CONFIG
+from httptransport import HTTP_CONFIG_HELP
+from httptransport import HttpError
+from httptransport import HttpTransport
+import httplib
 import json
 import logging
+import socket
 import time
-import urllib2
 
 
 class SignalfxHandler(Handler):
@@ -36,6 +41,7 @@ class SignalfxHandler(Handler):
         self.url = self.config['url']
         self.auth_token = self.config['auth_token']
         self.batch_max_interval = self.config['batch_max_interval']
+        self.transport = HttpTransport.from_config(self.config, self.log)
         self.resetBatchTimeout()
         if self.auth_token == "":
             logging.error("Failed to load Signalfx module")
@@ -55,6 +61,7 @@ class SignalfxHandler(Handler):
             'batch': 'How many to store before sending',
             'auth_token': 'Org API token to use when sending metrics',
         })
+        config.update(HTTP_CONFIG_HELP)
 
         return config
 
@@ -71,6 +78,7 @@ class SignalfxHandler(Handler):
             'batch_max_interval': 10,
             'auth_token': '',
         })
+        config.update(HTTP_CONFIG)
 
         return config
 
@@ -127,13 +135,12 @@ class SignalfxHandler(Handler):
         self.metrics = []
         postBody = json.dumps(postDictionary)
         logging.debug("Body is %s", postBody)
-        req = urllib2.Request(self.url, postBody,
-                              {"Content-type": "application/json",
-                               "X-SF-TOKEN": self.auth_token,
-                               "User-Agent": self.user_agent()})
+        headers = {"Content-type": "application/json",
+                   "X-SF-TOKEN": self.auth_token,
+                   "User-Agent": self.user_agent()}
         self.resetBatchTimeout()
         try:
-            urllib2.urlopen(req)
-        except urllib2.URLError:
+            self.transport.post(self.url, postBody, headers)
+        except (HttpError, httplib.HTTPException, socket.error):
             logging.exception("Unable to post signalfx metrics")
             return
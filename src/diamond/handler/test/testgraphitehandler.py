@@ -2,6 +2,8 @@
 # coding=utf-8
 ##########################################################################
 
+import errno
+import socket
 import time
 
 from test import unittest
@@ -13,6 +15,7 @@ import configobj
 
 import diamond.handler.graphite as mod
 from diamond.metric import Metric
+from diamond.utils.selfmetrics import SelfMetrics
 
 
 # These two methods are used for overriding the GraphiteHandler._connect method.
@@ -32,6 +35,28 @@ def fake_bad_connect(self):
     self.socket = None
 
 
+class FakeSocket(object):
+    """
+    Takes the given number of bytes on each send, or raises the given error
+    """
+
+    def __init__(self, sizes=()):
+        self.sizes = list(sizes)
+        self.data = ''
+        self.sends = 0
+
+    def send(self, data):
+        size = self.sizes.pop(0) if self.sizes else len(data)
+        if isinstance(size, Exception):
+            raise size
+        self.sends += 1
+        self.data += data[:size].tobytes()
+        return min(size, len(data))
+
+    def close(self):
+        pass
+
+
 class TestGraphiteHandler(unittest.TestCase):
 
     def setUp(self):
@@ -134,6 +159,35 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(sendmock.call_count, len(expected_data))
         self.assertEqual(sendmock.call_args_list, expected_data)
 
+    def test_process_batch(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1
+
+        metrics = [
+            Metric('metricname1', 0, timestamp=123),
+            Metric('metricname2', 0, timestamp=123),
+            Metric('metricname3', 0, timestamp=123),
+        ]
+
+        expected_data = [
+            call("metricname1 0 123\nmetricname2 0 123\nmetricname3 0 123\n"),
+        ]
+
+        handler = mod.GraphiteHandler(config)
+
+        patch_sock = patch.object(handler, 'socket', True)
+        sendmock = Mock()
+        patch_send = patch.object(handler, '_send_data', sendmock)
+
+        patch_sock.start()
+        patch_send.start()
+        handler._process_batch(metrics)
+        patch_send.stop()
+        patch_sock.stop()
+
+        self.assertEqual(sendmock.call_count, len(expected_data))
+        self.assertEqual(sendmock.call_args_list, expected_data)
+
     def test_backlog(self):
         config = configobj.ConfigObj()
         config['batch'] = 1
@@ -177,6 +231,28 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(send_mock.call_count, 0)
         self.assertEqual(handler.metrics, expected_data)
 
+    def test_backlog_self_metrics(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1
+        config['max_backlog_multiplier'] = 4
+        config['trim_backlog_multiplier'] = 3
+
+        mod.GraphiteHandler._connect = fake_bad_connect
+        handler = mod.GraphiteHandler(config)
+        registry = SelfMetrics()
+        handler.set_self_metrics(registry)
+
+        for i in range(8):
+            handler._process(Metric('metricname%d' % i, 0, timestamp=123))
+
+        metrics = dict(registry.collect())
+        self.assertEqual(metrics['handlers.GraphiteHandler.backlog'], 3)
+        self.assertEqual(metrics['handlers.GraphiteHandler.dropped'], 5)
+        self.assertEqual(
+            metrics['handlers.GraphiteHandler.process_ms.count'], 8)
+        self.assertEqual(
+            metrics['handlers.GraphiteHandler.flush_ms.count'], 0)
+
     def test_error_throttling(self):
         """
         This is more of a generic test checking that the _throttle_error method
@@ -276,6 +352,111 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(check_mock.call_count, 3)
         self.assertEqual(len(handler.config['__sockets_created']), 3)
 
+    def buffered_handler(self, **options):
+        config = configobj.ConfigObj()
+        config['buffered'] = True
+        config['buffer_size'] = 64
+        config['flush_interval'] = 60
+        config.update(options)
+        return mod.GraphiteHandler(config)
+
+    def metrics(self, count):
+        return [Metric('metricname%d' % i, 0, timestamp=123)
+                for i in range(count)]
+
+    def lines(self, count):
+        return ['metricname%d 0 123\n' % i for i in range(count)]
+
+    def test_buffered(self):
+        handler = self.buffered_handler()
+        handler.socket = FakeSocket()
+        metrics = self.metrics(5)
+
+        # 54 bytes don't fill the buffer
+        for metric in metrics[:3]:
+            handler._process(metric)
+        self.assertEqual(handler.socket.data, '')
+        self.assertEqual(handler.get_backlog(), 3)
+
+        handler._process(metrics[3])
+        self.assertEqual(handler.socket.data, ''.join(self.lines(4)))
+        self.assertEqual(handler.socket.sends, 2)
+        self.assertEqual(handler.get_backlog(), 0)
+
+        handler._process(metrics[4])
+        self.assertEqual(handler.get_backlog(), 1)
+        handler._flush()
+        self.assertEqual(handler.socket.data, ''.join(self.lines(5)))
+
+    def test_buffered_flush_interval(self):
+        handler = self.buffered_handler(flush_interval=0)
+        handler.socket = FakeSocket()
+        handler._process(self.metrics(1)[0])
+        self.assertEqual(handler.socket.data, self.lines(1)[0])
+
+    def test_buffered_partial_writes(self):
+        handler = self.buffered_handler()
+        handler.socket = FakeSocket([5, socket.error(errno.EAGAIN, '')])
+        # 72 bytes fill the buffer
+        handler._process_batch(self.metrics(4))
+        self.assertEqual(handler.socket.data, self.lines(1)[0][:5])
+
+        # The rest is written once the socket takes it
+        handler._flush()
+        self.assertEqual(handler.socket.data, ''.join(self.lines(4)))
+
+    def test_buffered_reconnect(self):
+        handler = self.buffered_handler()
+        handler.socket = FakeSocket([5, socket.error(errno.EPIPE, '')])
+        handler._process_batch(self.metrics(4))
+        self.assertTrue(handler.socket is None)
+
+        # The metric cut by the error is not finished on the new connection
+        sock = FakeSocket()
+        handler._connect = lambda: setattr(handler, 'socket', sock)
+        handler._flush()
+        self.assertEqual(sock.data, ''.join(self.lines(4)[1:]))
+
+    def test_buffered_reconnect_before_sending(self):
+        handler = self.buffered_handler()
+        handler.socket = FakeSocket([socket.error(errno.ECONNRESET, '')])
+        handler._process_batch(self.metrics(4))
+        self.assertTrue(handler.socket is None)
+
+        # Nothing was sent, the first metric is sent on the new connection
+        sock = FakeSocket()
+        handler._connect = lambda: setattr(handler, 'socket', sock)
+        handler._flush()
+        self.assertEqual(sock.data, ''.join(self.lines(4)))
+
+    def test_buffered_reconnect_between_metrics(self):
+        handler = self.buffered_handler()
+        handler.socket = FakeSocket([len(self.lines(1)[0]),
+                                     socket.error(errno.EPIPE, '')])
+        handler._process_batch(self.metrics(4))
+        self.assertTrue(handler.socket is None)
+
+        # The error came after a whole metric, none is skipped
+        sock = FakeSocket()
+        handler._connect = lambda: setattr(handler, 'socket', sock)
+        handler._flush()
+        self.assertEqual(sock.data, ''.join(self.lines(4)[1:]))
+
+    def test_buffered_backlog(self):
+        mod.GraphiteHandler._connect = fake_bad_connect
+        handler = self.buffered_handler(max_backlog=3)
+        registry = SelfMetrics()
+        handler.set_self_metrics(registry)
+
+        for metric in self.metrics(8):
+            handler._process(metric)
+        handler._flush()
+
+        self.assertEqual(list(handler.backlog), self.lines(8)[5:])
+        metrics = dict(registry.collect())
+        self.assertEqual(metrics['handlers.GraphiteHandler.backlog'], 3)
+        self.assertEqual(metrics['handlers.GraphiteHandler.dropped'], 5)
+
 
 if __name__ == "__main__":
     unittest.main()
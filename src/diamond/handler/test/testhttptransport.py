@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import BaseHTTPServer
+import gzip
+import json
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import configobj
+
+from diamond.handler.httpHandler import HttpPostHandler
+from diamond.handler.httptransport import HttpError
+from diamond.handler.httptransport import HttpTransport
+from diamond.handler.netuitive_handler import NetuitiveHandler
+from diamond.metric import Metric
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           RequestHandler)
+        self.url = 'http://127.0.0.1:%d/ingest' % self.server_address[1]
+        self.requests = []
+        self.connections = set()
+        # Statuses of the next responses, then 200
+        self.statuses = []
+        # Close the connection after the next responses, saying so or not
+        self.close = []
+        # Seconds to wait before responding
+        self.delay = 0
+
+    def process_request(self, request, client_address):
+        self.connections.add(client_address)
+        SocketServer.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        self.server.requests.append((self.path, dict(self.headers), body))
+        time.sleep(self.server.delay)
+
+        status = 200
+        if self.server.statuses:
+            status = self.server.statuses.pop(0)
+        close = None
+        if self.server.close:
+            close = self.server.close.pop(0)
+
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        if close == 'announced':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write('ok')
+        if close:
+            self.close_connection = 1
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class Element(object):
+
+    def __init__(self):
+        self.id = 'host'
+        self.samples = [1]
+
+    def merge_metrics(self):
+        pass
+
+    def clear_samples(self):
+        self.samples = []
+
+
+class TestHttpTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server()
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.transport = HttpTransport(timeout=5, retry_backoff=0)
+        # Don't go through a proxy set in the environment
+        self.environ = patch.dict(os.environ, {'no_proxy': '127.0.0.1'})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for i in range(3):
+            response = self.transport.post(self.server.url, 'data%d' % i)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.body, 'ok')
+        self.assertEqual([r[2] for r in self.server.requests],
+                         ['data0', 'data1', 'data2'])
+        self.assertEqual(self.server.requests[0][0], '/ingest')
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_gzip(self):
+        self.transport.gzip = True
+        self.transport.post(self.server.url, 'data' * 100,
+                            {'Content-Type': 'text/plain'})
+        path, headers, body = self.server.requests[0]
+        self.assertEqual(body, 'data' * 100)
+        self.assertEqual(headers['content-type'], 'text/plain')
+
+    def test_connection_closed(self):
+        self.server.close = ['announced', 'silently']
+        for i in range(3):
+            self.transport.post(self.server.url, 'data%d' % i)
+            # Closed while idle rather than as the next request goes out
+            time.sleep(0.1)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 3)
+
+    def test_retry_server_error(self):
+        self.server.statuses = [503, 500]
+        response = self.transport.request('GET', self.server.url)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_post_server_error_not_retried(self):
+        self.server.statuses = [503]
+        self.assertRaises(HttpError, self.transport.post, self.server.url,
+                          'data')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_post_timeout_not_retried(self):
+        self.transport.timeout = 0.2
+        self.server.delay = 0.5
+        self.assertRaises(socket.timeout, self.transport.post,
+                          self.server.url, 'data')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retries_exhausted(self):
+        self.transport.retries = 1
+        self.server.statuses = [500, 500, 500]
+        try:
+            self.transport.request('GET', self.server.url)
+        except HttpError, e:
+            self.assertEqual(e.code, 500)
+        else:
+            self.fail('No HttpError raised')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_error(self):
+        self.server.statuses = [410]
+        self.assertRaises(HttpError, self.transport.post, self.server.url,
+                          'data')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unreachable(self):
+        self.transport.retries = 0
+        # A port nothing listens on
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+        sock.close()
+        self.assertRaises(socket.error, self.transport.post, url, 'data')
+        self.assertEqual(self.transport.connections, {})
+
+    def test_unreachable_backoff(self):
+        self.transport.retries = 1
+        self.transport.retry_backoff = 60
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+        sock.close()
+
+        connect = Mock(side_effect=self.transport._connect)
+        with patch.object(self.transport, '_connect', connect):
+            self.assertRaises(socket.error, self.transport.post, url, 'data')
+            self.assertEqual(connect.call_count, 2)
+            # Fails without trying to connect until the backoff is over
+            self.assertRaises(socket.error, self.transport.post, url, 'data')
+            self.assertEqual(connect.call_count, 2)
+
+    def test_http_post_handler(self):
+        config = configobj.ConfigObj()
+        config['url'] = self.server.url
+        config['batch'] = 2
+        handler = HttpPostHandler(config)
+        for i in range(5):
+            handler._process(Metric('metric%d' % i, i, timestamp=123))
+        handler._flush()
+
+        self.assertEqual([r[2] for r in self.server.requests], [
+            'metric0 0 123\n\nmetric1 1 123\n',
+            'metric2 2 123\n\nmetric3 3 123\n',
+            'metric4 4 123\n',
+        ])
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_netuitive_post(self):
+        # The netuitive library may be missing, only the attributes of its
+        # client that the handler posts with are needed
+        handler = NetuitiveHandler.__new__(NetuitiveHandler)
+        handler.transport = self.transport
+        handler.api = Mock(dataurl=self.server.url + '/apikey',
+                           agent='Diamond', disabled=False,
+                           kill_codes=[410, 418], post_error_count=3,
+                           max_post_errors=10)
+        element = Element()
+
+        self.assertTrue(handler._post(element))
+        path, headers, body = self.server.requests[0]
+        self.assertEqual(path, '/ingest/apikey')
+        self.assertEqual(headers['user-agent'], 'Diamond')
+        self.assertEqual(json.loads(body), [{'id': 'host', 'samples': [1]}])
+        self.assertEqual(handler.api.post_error_count, 0)
+
+        self.server.statuses = [410]
+        self.assertFalse(handler._post(element))
+        self.assertTrue(handler.api.disabled)
+        self.assertFalse(handler._post(element))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(element.samples, [])
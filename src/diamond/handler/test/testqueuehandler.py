@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import Queue
+
+from test import unittest
+from mock import Mock
+
+import configobj
+
+from diamond.handler.queue import QueueHandler
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.scheduler import handler_process
+from diamond.utils.wire import MetricDecoder
+
+
+class StopHandlerProcess(Exception):
+    pass
+
+
+class TestQueueHandler(unittest.TestCase):
+
+    def make_handler(self, queue, batch_size=None):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        if batch_size is not None:
+            config['server']['metric_batch_size'] = batch_size
+        return QueueHandler(config=config, queue=queue)
+
+    def make_metric(self, value=0):
+        return Metric('servers.host.cpu.total.idle', value, timestamp=1234567,
+                      host='host')
+
+    def test_buffers_until_flush(self):
+        queue = Queue.Queue()
+        handler = self.make_handler(queue)
+
+        for i in range(5):
+            handler._process(self.make_metric(i))
+        self.assertEqual(queue.qsize(), 0)
+
+        handler._flush()
+        self.assertEqual(queue.qsize(), 1)
+
+        batch = MetricDecoder().decode(queue.get())
+        self.assertTrue(isinstance(batch, MetricBatch))
+        self.assertTrue(batch.flush)
+        self.assertEqual([m.value for m in batch.metrics], range(5))
+
+    def test_sends_full_batches(self):
+        queue = Queue.Queue()
+        handler = self.make_handler(queue, batch_size=2)
+
+        for i in range(5):
+            handler._process(self.make_metric(i))
+        handler._flush()
+
+        decoder = MetricDecoder()
+        batches = [decoder.decode(queue.get()) for i in range(queue.qsize())]
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertEqual([b.flush for b in batches], [False, False, True])
+
+    def test_queue_full_drops_batch(self):
+        queue = Queue.Queue(maxsize=1)
+        handler = self.make_handler(queue)
+        handler._throttle_error = Mock()
+        other = Metric('servers.host.cpu.total.user', 1, timestamp=1234567,
+                       host='host')
+
+        handler._process(self.make_metric())
+        handler._flush()
+        handler._process(other)
+        handler._flush()
+
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(handler._throttle_error.call_count, 1)
+        self.assertEqual(handler.metrics, [])
+
+        # The strings defined by the dropped batch are defined again
+        decoder = MetricDecoder()
+        decoder.decode(queue.get())
+        handler._process(other)
+        handler._flush()
+        batch = decoder.decode(queue.get())
+        self.assertEqual(batch.metrics[0].path, other.path)
+
+    def test_queue_error_resets_strings(self):
+        queue = Queue.Queue()
+        handler = self.make_handler(queue)
+        decoder = MetricDecoder()
+        other = Metric('servers.host.cpu.total.user', 1, timestamp=1234567,
+                       host='host')
+
+        handler._process(self.make_metric())
+        handler._flush()
+        decoder.decode(queue.get())
+
+        # Lost on the way
+        handler.queue = Mock()
+        handler.queue.put.side_effect = IOError('Manager connection lost')
+        handler._process(other)
+        self.assertRaises(IOError, handler._flush)
+
+        # Delivered, then interrupted
+        def put(data, block):
+            queue.put(data, block)
+            raise IOError('Interrupted')
+        handler.queue.put.side_effect = put
+        handler._process(other)
+        self.assertRaises(IOError, handler._flush)
+        decoder.decode(queue.get())
+
+        handler.queue = queue
+        handler._process(other)
+        handler._flush()
+        batch = decoder.decode(queue.get())
+        self.assertEqual(batch.metrics[0].path, other.path)
+
+    def test_handler_process_unpacks_batches(self):
+        metrics = [self.make_metric(i) for i in range(3)]
+        queue = Mock()
+        queue.get.side_effect = [MetricBatch(metrics, flush=False),
+                                 MetricBatch([], flush=True),
+                                 StopHandlerProcess()]
+        handler = Mock()
+
+        self.assertRaises(StopHandlerProcess,
+                          handler_process, [handler], queue, Mock())
+
+        handler._process_batch.assert_called_once_with(metrics)
+        handler._flush.assert_called_once_with()
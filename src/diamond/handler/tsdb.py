@@ -109,7 +109,19 @@ class TSDBHandler(Handler):
         """
         Process a metric by sending it to TSDB
         """
+        # Just send the data as a string
+        self._send(self._format(metric))
+
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics by sending them to TSDB in one go
+        """
+        self._send(''.join([self._format(metric) for metric in metrics]))
 
+    def _format(self, metric):
+        """
+        Format a metric as a TSDB put line
+        """
         metric_str = self.metric_format.format(
             Collector=metric.getCollectorPath(),
             Path=metric.path,
@@ -119,8 +131,7 @@ class TSDBHandler(Handler):
             value=metric.value,
             tags=self.tags
         )
-        # Just send the data as a string
-        self._send("put " + str(metric_str) + "\n")
+        return "put " + str(metric_str) + "\n"
 
     def _send(self, data):
         """
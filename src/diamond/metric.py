@@ -13,11 +13,13 @@ class Metric(object):
     # handlers to flush.
     __slots__ = [
         'path', 'value', 'raw_value', 'timestamp', 'precision',
-        'host', 'metric_type', 'ttl'
+        'host', 'metric_type', 'ttl', 'path_prefix', 'collector_path',
+        'metric_path'
         ]
 
     def __init__(self, path, value, raw_value=None, timestamp=None, precision=0,
-                 host=None, metric_type='COUNTER', ttl=None):
+                 host=None, metric_type='COUNTER', ttl=None, path_prefix=None,
+                 collector_path=None, metric_path=None):
         """
         Create new instance of the Metric class
 
@@ -27,6 +29,9 @@ class Metric(object):
             timestamp=[float|int]: the timestamp, in seconds since the epoch
             (as from time.time()) precision=int: the precision to apply.
             Generally the default (2) should work fine.
+            path_prefix, collector_path, metric_path=string: the components
+            of the path, when known. Otherwise they are parsed from the path
+            when asked for.
         """
 
         # Validate the path, value and metric_type submitted
@@ -69,6 +74,9 @@ class Metric(object):
         self.host = host
         self.metric_type = metric_type
         self.ttl = ttl
+        self.path_prefix = path_prefix
+        self.collector_path = collector_path
+        self.metric_path = metric_path
 
     def __repr__(self):
         """
@@ -86,14 +94,15 @@ class Metric(object):
         return fstring % (self.path, self.value, self.timestamp)
 
     def __getstate__(self):
-        return dict(
-            (slot, getattr(self, slot))
-            for slot in self.__slots__
-            if hasattr(self, slot)
-        )
+        # A tuple avoids repeating the slot names in every pickled metric
+        return tuple(getattr(self, slot, None) for slot in self.__slots__)
 
     def __setstate__(self, state):
-        for slot, value in state.items():
+        if isinstance(state, dict):
+            state = [state.get(slot) for slot in self.__slots__]
+        # Slots missing from the state of older versions default to None
+        state = list(state) + [None] * (len(self.__slots__) - len(state))
+        for slot, value in zip(self.__slots__, state):
             setattr(self, slot, value)
 
     @classmethod
@@ -121,6 +130,9 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "servers"
         """
+        if self.path_prefix is not None:
+            return self.path_prefix
+
         # If we don't have a host name, assume it's just the first part of the
         # metric path
         if self.host is None:
@@ -135,6 +147,9 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "cpu"
         """
+        if self.collector_path is not None:
+            return self.collector_path
+
         # If we don't have a host name, assume it's just the third part of the
         # metric path
         if self.host is None:
@@ -151,6 +166,9 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "total.idle"
         """
+        if self.metric_path is not None:
+            return self.metric_path
+
         # If we don't have a host name, assume it's just the fourth+ part of the
         # metric path
         if self.host is None:
@@ -162,3 +180,27 @@ class Metric(object):
 
         offset = len(prefix) + 1
         return self.path[offset:]
+
+
+class MetricBatch(object):
+    """
+    A list of metrics handed from a collector process to the handler process
+    in a single queue operation. When flush is set the handlers are flushed
+    once the metrics have been processed.
+    """
+    __slots__ = ['metrics', 'flush']
+
+    def __init__(self, metrics=None, flush=True):
+        if metrics is None:
+            metrics = []
+        self.metrics = metrics
+        self.flush = flush
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def __getstate__(self):
+        return (self.metrics, self.flush)
+
+    def __setstate__(self, state):
+        self.metrics, self.flush = state
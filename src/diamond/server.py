@@ -18,6 +18,8 @@ sys.path.append(
         os.path.join(
             os.path.dirname(__file__), "../")))
 
+from diamond.collector import SelfMetricsCollector
+
 from diamond.utils.classes import initialize_collector
 from diamond.utils.classes import load_collectors
 from diamond.utils.classes import load_dynamic_class
@@ -25,10 +27,23 @@ from diamond.utils.classes import load_handlers
 from diamond.utils.classes import load_include_path
 
 from diamond.utils.config import load_config
+from diamond.utils.config import set_config_snapshot
 from diamond.utils.config import str_to_bool
 
+from diamond.utils.dispatch import DISPATCH_MODES
+from diamond.utils.dispatch import create_handler_workers
+
+from diamond.utils.ringbuffer import DEFAULT_BUFFER_SIZE
+from diamond.utils.ringbuffer import RingBufferQueue
+
 from diamond.utils.scheduler import collector_process
 from diamond.utils.scheduler import handler_process
+from diamond.utils.scheduler import shared_collector_process
+
+from diamond.utils.selfmetrics import DEFAULT_SLOTS
+from diamond.utils.selfmetrics import SelfMetrics
+
+from diamond.utils.timers import monotonic
 
 from diamond.handler.Handler import Handler
 
@@ -49,8 +64,14 @@ class Server(object):
         self.config = None
         self.handlers = []
         self.handler_queue = []
+        self.handler_workers = None
         self.modules = {}
         self.metric_queue = None
+        self.shared_process = None
+        self.shared_collectors = set()
+        self.self_metrics = None
+        self.self_metrics_collector = None
+        self.self_metrics_next = None
 
         # We do this weird process title swap around to get the sync manager
         # title correct for ps
@@ -82,6 +103,183 @@ class Server(object):
             self.disable_collector(config, 'VMStatCollector')
             self.disable_collector(config, 'NetworkCollector')
 
+    def create_metric_queue(self, metric_queue_size):
+        """
+        Create the queue used to move metrics from the collectors to the
+        handlers, using the transport selected in the server config
+        """
+        transport = self.config['server'].get('metric_queue_transport',
+                                              'manager')
+        transport = transport.strip().lower()
+        self.log.debug('metric_queue_transport: %s', transport)
+
+        if transport == 'ringbuffer':
+            buffer_size = int(self.config['server'].get(
+                'metric_queue_buffer_size', DEFAULT_BUFFER_SIZE))
+            return RingBufferQueue(maxsize=metric_queue_size,
+                                   buffer_size=buffer_size)
+
+        if transport != 'manager':
+            self.log.error('Unknown metric_queue_transport %s, '
+                           'falling back to manager', transport)
+
+        return self.manager.Queue(maxsize=metric_queue_size)
+
+    def create_self_metrics(self):
+        """
+        Create the registry of the metrics the agent keeps on itself when
+        self_metrics is enabled, or None
+        """
+        if not str_to_bool(self.config['server'].get('self_metrics', False)):
+            return None
+        slots = int(self.config['server'].get('self_metrics_slots',
+                                              DEFAULT_SLOTS))
+        return SelfMetrics(slots, log=self.log)
+
+    def create_self_metrics_collector(self):
+        """
+        Create the collector publishing the metrics the agent keeps on itself
+        through a queue handler of its own
+        """
+        QueueHandler = load_dynamic_class(
+            'diamond.handler.queue.QueueHandler',
+            Handler
+        )
+        handler = QueueHandler(config=self.config, queue=self.metric_queue,
+                               log=self.log)
+        interval = self.config['server'].get('self_metrics_interval', 60)
+        config = {
+            'collectors': {
+                'SelfMetricsCollector': {
+                    'interval': interval,
+                },
+            },
+        }
+        return SelfMetricsCollector(self.self_metrics, self.metric_queue,
+                                    config=config, handlers=[handler],
+                                    configfile=self.configfile)
+
+    def publish_self_metrics(self, now=None):
+        """
+        Publish the metrics the agent keeps on itself when they are due
+        """
+        collector = self.self_metrics_collector
+        if collector is None:
+            return
+        if now is None:
+            now = monotonic()
+        if self.self_metrics_next is not None and now < self.self_metrics_next:
+            return
+
+        self.self_metrics_next = now + float(collector.config['interval'])
+        try:
+            collector._run()
+        except Exception:
+            self.log.exception('Failed to publish the self metrics')
+
+    def profile_children(self, signum, frame):
+        """
+        Forward SIGUSR1 to the collector and handler processes, which
+        profile their next runs
+        """
+        for process in multiprocessing.active_children():
+            if ('Collector' in process.name or
+                    process.name == 'Shared scheduler' or
+                    process.name.startswith('Handler')):
+                try:
+                    os.kill(process.pid, signum)
+                except OSError:
+                    pass
+
+    def is_shared_collector(self, process_name, cls):
+        """
+        Returns True if the collector runs in the shared collector process.
+        A collector can opt in or out with its shared option, otherwise it
+        runs there if its class is flagged as SHAREABLE.
+        """
+        scheduler = self.config['server'].get('collector_scheduler', 'process')
+        if scheduler.strip().lower() != 'shared':
+            return False
+
+        config = self.config['collectors'].get(process_name, {})
+        if 'shared' in config:
+            return str_to_bool(config['shared'])
+        return getattr(cls, 'SHAREABLE', False)
+
+    def start_shared_collectors(self, names, collector_classes):
+        """
+        (Re)start the process running the shared collectors
+        """
+        if self.shared_process is not None:
+            if (self.shared_process.is_alive() and
+                    names == self.shared_collectors):
+                return
+            if self.shared_process.is_alive():
+                self.shared_process.terminate()
+            self.shared_process = None
+            self.shared_collectors = set()
+
+        if not names:
+            return
+
+        QueueHandler = load_dynamic_class(
+            'diamond.handler.queue.QueueHandler',
+            Handler
+        )
+
+        collectors = []
+        for process_name in sorted(names):
+            # The collectors run concurrently, each needs its own metric
+            # buffer
+            handler = QueueHandler(config=self.config,
+                                   queue=self.metric_queue, log=self.log)
+            collector = initialize_collector(
+                collector_classes[process_name.split()[0]],
+                name=process_name,
+                configfile=self.configfile,
+                handlers=[handler])
+
+            if collector is None:
+                self.log.error('Failed to load collector %s', process_name)
+                continue
+            if self.self_metrics is not None:
+                collector.set_self_metrics(self.self_metrics)
+            collectors.append(collector)
+
+        threads = int(self.config['server'].get('collector_threads', 4))
+        self.shared_process = multiprocessing.Process(
+            name='Shared scheduler',
+            target=shared_collector_process,
+            args=(collectors, self.metric_queue, self.log, threads)
+        )
+        self.shared_process.daemon = True
+        self.shared_process.start()
+        self.shared_collectors = names
+
+    def load_collectors(self):
+        """
+        Load the collector classes. Unless collectors_lazy_load is disabled
+        only the modules of the enabled collectors are imported.
+        """
+        start = time.time()
+        paths = self.config['server']['collectors_path']
+
+        if str_to_bool(self.config['server'].get('collectors_lazy_load',
+                                                 True)):
+            names = set()
+            for process_name, config in self.config['collectors'].iteritems():
+                if config.get('enabled', False) is True:
+                    names.add(process_name.split()[0])
+            index_file = self.config['server'].get('collectors_index_file')
+            collectors = load_collectors(paths, names=names,
+                                         index_file=index_file)
+        else:
+            collectors = load_collectors(paths)
+
+        self.log.info('Loaded %d collector classes in %.2f seconds',
+                      len(collectors), time.time() - start)
+        return collectors
+
     def run(self):
         """
         Load handler and collector classes and then start collectors
@@ -91,17 +289,20 @@ class Server(object):
         # Config
         #######################################################################
         self.config = load_config(self.configfile)
+        set_config_snapshot(self.config['server'].get('config_snapshot_file'))
 
-        collectors = load_collectors(self.config['server']['collectors_path'])
+        collectors = self.load_collectors()
         metric_queue_size = int(self.config['server'].get('metric_queue_size',
                                                           16384))
-        self.metric_queue = self.manager.Queue(maxsize=metric_queue_size)
+        self.metric_queue = self.create_metric_queue(metric_queue_size)
         self.log.debug('metric_queue_size: %d', metric_queue_size)
 
+        # The counters in shared memory have to be allocated before the
+        # processes updating them are forked
+        self.self_metrics = self.create_self_metrics()
+
         #######################################################################
         # Handlers
-        #
-        # TODO: Eventually move each handler to it's own process space?
         #######################################################################
 
         if 'handlers_path' in self.config['server']:
@@ -137,10 +338,39 @@ class Server(object):
         self.handler_queue = QueueHandler(
             config=self.config, queue=self.metric_queue, log=self.log)
 
+        # Optionally run each handler in its own thread or process
+        handler_dispatch = self.config['server'].get('handler_dispatch',
+                                                     'serial')
+        handler_dispatch = handler_dispatch.strip().lower()
+        if handler_dispatch not in DISPATCH_MODES:
+            self.log.error('Unknown handler_dispatch %s, falling back to '
+                           'serial', handler_dispatch)
+            handler_dispatch = 'serial'
+        self.log.debug('handler_dispatch: %s', handler_dispatch)
+
+        handler_queue_size = int(self.config['server'].get(
+            'handler_queue_size', 1024))
+        self.handler_workers = create_handler_workers(
+            self.handlers, handler_dispatch, maxsize=handler_queue_size,
+            log=self.log)
+
+        if self.self_metrics is not None:
+            for handler in self.handlers:
+                handler.set_self_metrics(self.self_metrics)
+            for worker in self.handler_workers or []:
+                worker.set_self_metrics(self.self_metrics)
+            self.self_metrics_collector = self.create_self_metrics_collector()
+
+        if handler_dispatch == 'process':
+            # The handler process is daemonic and can't have children
+            for worker in self.handler_workers:
+                worker.start()
+
         h_process = multiprocessing.Process(
             name="Handlers",
             target=handler_process,
-            args=(self.handlers, self.metric_queue, self.log),
+            args=(self.handlers, self.metric_queue, self.log,
+                  self.handler_workers),
         )
 
         h_process.daemon = True
@@ -153,6 +383,10 @@ class Server(object):
         if hasattr(signal, 'SIGHUP'):
             signal.signal(signal.SIGHUP, signal_to_exception)
 
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.profile_children)
+            signal.siginterrupt(signal.SIGUSR1, False)
+
         #######################################################################
 
         while True:
@@ -162,6 +396,14 @@ class Server(object):
                     raise Exception(
                         'Handler appears to be dead! Exiting.')
 
+                if handler_dispatch == 'process':
+                    for worker in self.handler_workers:
+                        if worker.is_alive() is not True:
+                            signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+                            raise Exception(
+                                'Handler %s appears to be dead! Exiting.' %
+                                worker.name)
+
                 active_children = multiprocessing.active_children()
                 running_processes = []
                 for process in active_children:
@@ -180,6 +422,22 @@ class Server(object):
                     running_collectors.append(collector)
                 running_collectors = set(running_collectors)
 
+                collector_classes = dict(
+                    (cls.__name__.split('.')[-1], cls)
+                    for cls in collectors.values()
+                )
+
+                # Lightweight collectors can share a single process
+                shared_collectors = set(
+                    process_name for process_name in running_collectors
+                    if process_name.split()[0] in collector_classes and
+                    self.is_shared_collector(
+                        process_name,
+                        collector_classes[process_name.split()[0]]))
+                self.start_shared_collectors(shared_collectors,
+                                             collector_classes)
+                running_collectors -= shared_collectors
+
                 # Collectors that are running but shouldn't be
                 for process_name in running_processes - running_collectors:
                     if 'Collector' not in process_name:
@@ -188,11 +446,6 @@ class Server(object):
                         if process.name == process_name:
                             process.terminate()
 
-                collector_classes = dict(
-                    (cls.__name__.split('.')[-1], cls)
-                    for cls in collectors.values()
-                )
-
                 load_delay = self.config['server'].get('collectors_load_delay',
                                                        1.0)
                 for process_name in running_collectors - running_processes:
@@ -220,6 +473,9 @@ class Server(object):
                                        process_name)
                         continue
 
+                    if self.self_metrics is not None:
+                        collector.set_self_metrics(self.self_metrics)
+
                     # Splay the loads
                     time.sleep(float(load_delay))
 
@@ -233,6 +489,8 @@ class Server(object):
 
                 ##############################################################
 
+                self.publish_self_metrics()
+
                 time.sleep(1)
 
             except SIGHUPException:
@@ -242,8 +500,9 @@ class Server(object):
 
                 self.log.info('Reloading state due to HUP')
                 self.config = load_config(self.configfile)
-                collectors = load_collectors(
-                    self.config['server']['collectors_path'])
+                set_config_snapshot(
+                    self.config['server'].get('config_snapshot_file'))
+                collectors = self.load_collectors()
                 # restore SIGHUP handler
                 signal.signal(signal.SIGHUP, original_sighup_handler)
 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Measure the time taken to load the config for a number of collectors.
+
+Builds a synthetic config directory with a config file per collector and
+handler, then loads the config the way the collectors do: parsing it every
+time as before the config cache, from the cache, and from the snapshot a
+forked process would read after a change.
+
+    python src/diamond/test/benchconfig.py --files 500 --collectors 60
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', '..')))
+
+from diamond.utils import config as config_module
+from diamond.utils.config import _load_config
+from diamond.utils.config import load_config
+from diamond.utils.config import set_config_snapshot
+
+SERVER_CONFIG = '''
+[server]
+handlers = diamond.handler.graphite.GraphiteHandler
+handlers_config_path = %(path)s/handlers
+collectors_config_path = %(path)s/collectors
+
+[handlers]
+
+[[default]]
+
+[collectors]
+
+[[default]]
+interval = 60
+'''
+
+COLLECTOR_CONFIG = '''
+enabled = True
+interval = 30
+path = collector%(i)d
+metrics_whitelist = ^cpu.*, ^memory.*, ^disk.*
+hosts = host1:1234, host2:1234, host3:1234
+
+[devices]
+sda = True
+sdb = False
+'''
+
+
+def build(path, files):
+    for directory in ('handlers', 'collectors'):
+        os.mkdir(os.path.join(path, directory))
+    for i in xrange(files):
+        if i % 10 == 0:
+            name = os.path.join(path, 'handlers', 'Handler%d.conf' % i)
+        else:
+            name = os.path.join(path, 'collectors', 'Collector%d.conf' % i)
+        f = open(name, 'w')
+        f.write(COLLECTOR_CONFIG % {'i': i})
+        f.close()
+    configfile = os.path.join(path, 'diamond.conf')
+    f = open(configfile, 'w')
+    f.write(SERVER_CONFIG % {'path': path})
+    f.close()
+    return configfile
+
+
+def timed(name, collectors, func):
+    start = time.time()
+    for i in xrange(collectors):
+        func()
+    elapsed = time.time() - start
+    print '%-10s %4d loads %8.3fs %8.2fms per load' % (
+        name, collectors, elapsed, elapsed * 1000 / collectors)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--files', type='int', default=500,
+                      help='number of config files')
+    parser.add_option('--collectors', type='int', default=60,
+                      help='number of collectors loading the config')
+    (options, args) = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        configfile = build(path, options.files)
+        set_config_snapshot(os.path.join(path, 'config.snapshot'))
+
+        timed('parse', options.collectors,
+              lambda: _load_config(configfile, []))
+        timed('cached', options.collectors,
+              lambda: load_config(configfile, copy=False))
+        timed('copy', options.collectors,
+              lambda: load_config(configfile))
+
+        def from_snapshot():
+            config_module._cache.clear()
+            load_config(configfile, copy=False)
+        timed('snapshot', options.collectors, from_snapshot)
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
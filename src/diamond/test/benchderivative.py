@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Measure the time taken to compute the rates of many counters.
+
+Feeds the same counters to a collector calling derivative for each of them,
+the way the collectors used to, and to one calling derivatives once per run,
+with the counter values kept in a dict and in an array.
+
+    python src/diamond/test/benchderivative.py --counters 10000 --runs 20
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', '..')))
+
+import configobj
+
+from diamond.collector import Collector
+from diamond.collector import MAX_COUNTER
+
+
+def make_collector(storage):
+    config = configobj.ConfigObj()
+    config['server'] = {}
+    config['server']['collectors_config_path'] = ''
+    config['collectors'] = {}
+    config['collectors']['default'] = {
+        'hostname': 'host',
+        'path': 'bench',
+        'interval': 10,
+        'counter_storage': storage,
+    }
+    return Collector(config, [])
+
+
+def loop(collector, names, values):
+    derivative = collector.derivative
+    for name, value in zip(names, values):
+        derivative(name, value, MAX_COUNTER)
+
+
+def bulk(collector, names, values):
+    collector.derivatives(names, values, MAX_COUNTER)
+
+
+def timed(name, func, storage, names, runs):
+    collector = make_collector(storage)
+    values = [random.randint(0, 1000000) for i in xrange(len(names))]
+    elapsed = 0
+    for i in xrange(runs):
+        values = [value + random.randint(0, 1000) for value in values]
+        start = time.time()
+        func(collector, names, values)
+        elapsed += time.time() - start
+        collector.last_values.advance()
+    print '%-6s %-6s %6d counters %8.3fs %8.2fms per run' % (
+        name, storage, len(names), elapsed, elapsed * 1000 / runs)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--counters', type='int', default=10000,
+                      help='number of counters')
+    parser.add_option('--runs', type='int', default=20,
+                      help='number of collector runs')
+    (options, args) = parser.parse_args()
+
+    names = ['device%d.counter%d' % (i / 16, i % 16)
+             for i in xrange(options.counters)]
+    for storage in ('dict', 'array'):
+        timed('loop', loop, storage, names, options.runs)
+        timed('bulk', bulk, storage, names, options.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Compare loading every collector with loading only the enabled ones.
+
+Each mode runs in a fresh interpreter and reports the time taken to load the
+collector classes, the number of modules loaded and the resident memory of
+the process afterwards.
+
+    python src/diamond/test/benchdiscovery.py --collectors-path src/collectors
+"""
+
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+DEFAULT_COLLECTORS = ','.join([
+    'CPUCollector', 'DiskSpaceCollector', 'DiskUsageCollector',
+    'LoadAverageCollector', 'MemoryCollector', 'NetworkCollector',
+    'SockstatCollector', 'TCPCollector', 'VMStatCollector',
+])
+
+CHILD = '''
+import logging
+import sys
+import time
+sys.path.insert(0, %(root)r)
+logging.basicConfig(level=logging.CRITICAL)
+
+from diamond.utils.classes import load_collectors
+
+
+def rss():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1])
+    return 0
+
+before = rss()
+modules = len(sys.modules)
+start = time.time()
+collectors = load_collectors(%(path)r, names=%(names)r,
+                             index_file=%(index_file)r)
+elapsed = time.time() - start
+print '%%-12s %%4d classes %%5d modules %%8.3fs %%8d kB RSS' %% (
+    %(mode)r, len(collectors), len(sys.modules) - modules, elapsed,
+    rss() - before)
+'''
+
+
+def run(mode, path, names, index_file=None):
+    code = CHILD % {
+        'root': ROOT,
+        'path': path,
+        'names': names,
+        'index_file': index_file,
+        'mode': mode,
+    }
+    subprocess.call([sys.executable, '-c', code])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--collectors-path',
+                      default=os.path.join(ROOT, 'collectors'))
+    parser.add_option('--collectors', default=DEFAULT_COLLECTORS,
+                      help='comma separated enabled collectors')
+    (options, args) = parser.parse_args()
+
+    path = os.path.abspath(options.collectors_path)
+    names = set(options.collectors.split(','))
+    index_file = os.path.join(tempfile.mkdtemp(), 'collectors.json')
+
+    run('eager', path, None)
+    run('lazy', path, names)
+    run('lazy cold', path, names, index_file)
+    run('lazy cached', path, names, index_file)
+    os.unlink(index_file)
+    os.rmdir(os.path.dirname(index_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Measure the throughput and latency of the whole metric pipeline.
+
+Synthetic collectors publish metrics through the real QueueHandler onto the
+metric queue created by the Server, which the real handler process drains
+into the handlers. Each handler sends its metrics to a local stand-in sink:
+a TCP sink for the GraphiteHandler and TSDBHandler, an HTTP sink for the
+HttpPostHandler and NetuitiveHandler.
+
+Every metric carries the time it was published as its value, so the sinks
+measure the end to end latency of each of them. The report has the metrics
+per second and the latency percentiles of every handler, and the CPU time
+and resident memory of every process.
+
+    python src/diamond/test/benchpipeline.py --collectors 20 --metrics 1000 \\
+        --runs 5 --handlers graphite,tsdb,http --transport ringbuffer
+"""
+
+import BaseHTTPServer
+import json
+import logging
+import multiprocessing
+import optparse
+import os
+import resource
+import select
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', '..')))
+
+import configobj
+
+from diamond.collector import Collector
+from diamond.handler.queue import QueueHandler
+from diamond.server import Server
+from diamond.utils.classes import load_handlers
+from diamond.utils.dispatch import create_handler_workers
+from diamond.utils.scheduler import handler_process
+
+# Sink and config of each handler
+HANDLERS = {
+    'graphite': ('diamond.handler.graphite.GraphiteHandler', 'tcp'),
+    'tsdb': ('diamond.handler.tsdb.TSDBHandler', 'tcp'),
+    'http': ('diamond.handler.httpHandler.HttpPostHandler', 'http'),
+    'netuitive': ('diamond.handler.netuitive_handler.NetuitiveHandler',
+                  'http'),
+}
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    index = min(int(len(values) * percent / 100.0), len(values) - 1)
+    return values[index]
+
+
+def process_usage(pid):
+    """
+    Returns the CPU seconds and the resident memory in kB of a process
+    """
+    try:
+        f = open('/proc/%d/stat' % pid)
+        try:
+            # The command may contain spaces, the fields follow the last )
+            fields = f.read().rsplit(')', 1)[1].split()
+        finally:
+            f.close()
+        cpu = (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS)
+
+        rss = 0
+        f = open('/proc/%d/status' % pid)
+        try:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+        finally:
+            f.close()
+    except (IOError, OSError, IndexError, ValueError):
+        return None, None
+    return cpu, rss
+
+
+def own_usage():
+    """
+    Returns the CPU seconds and the peak resident memory in kB of the
+    current process
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class Sink(object):
+    """
+    Counts the metrics received and their latency, in a process of its own
+    """
+
+    def __init__(self, name, base):
+        self.name = name
+        self.base = base
+        self.received = multiprocessing.RawValue('L', 0)
+        self.stop = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.latencies = []
+        self.process = None
+
+    def record(self, value):
+        try:
+            sent = float(value)
+        except ValueError:
+            return
+        self.latencies.append(time.time() - self.base - sent)
+        self.received.value += 1
+
+    def start(self):
+        self.process = multiprocessing.Process(name='Sink %s' % self.name,
+                                               target=self.run)
+        self.process.daemon = True
+        self.process.start()
+
+    def run(self):
+        self.serve()
+        self.results.put((sorted(self.latencies), own_usage()))
+
+    def finish(self):
+        self.stop.set()
+        latencies, usage = self.results.get(timeout=30)
+        self.process.join()
+        return latencies, usage
+
+
+class TCPSink(Sink):
+    """
+    Receives graphite lines, path value timestamp, and TSDB put lines, put
+    path timestamp value tags
+    """
+
+    def __init__(self, name, base):
+        super(TCPSink, self).__init__(name, base)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(64)
+        self.port = self.socket.getsockname()[1]
+
+    def handle_line(self, line):
+        fields = line.split()
+        if len(fields) < 3:
+            return
+        if fields[0] == 'put':
+            self.record(fields[3])
+        else:
+            self.record(fields[1])
+
+    def serve(self):
+        buffers = {}
+        while not self.stop.is_set():
+            readable = select.select([self.socket] + buffers.keys(), [], [],
+                                     0.1)[0]
+            for sock in readable:
+                if sock is self.socket:
+                    connection = self.socket.accept()[0]
+                    buffers[connection] = ''
+                    continue
+                data = sock.recv(65536)
+                if not data:
+                    sock.close()
+                    del buffers[sock]
+                    continue
+                lines = (buffers[sock] + data).split('\n')
+                buffers[sock] = lines.pop()
+                for line in lines:
+                    self.handle_line(line)
+
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves every kept alive connection on a thread of its own
+    """
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The handlers are killed with their connections open
+        pass
+
+
+class HTTPSink(Sink):
+    """
+    Receives posts of metric lines from the HttpPostHandler and of JSON
+    elements from the NetuitiveHandler
+    """
+
+    def __init__(self, name, base):
+        super(HTTPSink, self).__init__(name, base)
+        sink = self
+
+        class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send a response in one go rather than a write per header, which
+            # Nagle's algorithm holds back on a kept alive connection
+            wbufsize = -1
+
+            def respond(self, body=''):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.respond()
+
+            def do_HEAD(self):
+                self.respond()
+
+            def do_POST(self):
+                length = int(self.headers.getheader('Content-Length', 0))
+                sink.handle_body(self.rfile.read(length))
+                self.respond()
+
+            def log_message(self, *args):
+                pass
+
+        self.lock = threading.Lock()
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.timeout = 0.1
+        self.port = self.server.server_address[1]
+
+    def handle_samples(self, data):
+        if isinstance(data, list):
+            for item in data:
+                self.handle_samples(item)
+        elif isinstance(data, dict):
+            for sample in data.get('samples', []):
+                self.record(sample['val'])
+            for value in data.itervalues():
+                if isinstance(value, (list, dict)):
+                    self.handle_samples(value)
+
+    def handle_body(self, body):
+        self.lock.acquire()
+        try:
+            if body[:1] in ('[', '{'):
+                self.handle_samples(json.loads(body))
+                return
+            for line in body.split('\n'):
+                fields = line.split()
+                if len(fields) >= 3:
+                    self.record(fields[1])
+        finally:
+            self.lock.release()
+
+    def serve(self):
+        while not self.stop.is_set():
+            self.server.handle_request()
+
+
+class BenchCollector(Collector):
+    """
+    Publishes a number of metrics holding the time they were published
+    """
+
+    def __init__(self, count, base, *args, **kwargs):
+        self.count = count
+        self.base = base
+        super(BenchCollector, self).__init__(*args, **kwargs)
+
+    def collect(self):
+        for i in xrange(self.count):
+            self.publish('metric%d' % i, time.time() - self.base,
+                         precision=6)
+
+
+def collector(config, queue, name, count, runs, interval, base, results):
+    handler = QueueHandler(config=config, queue=queue)
+    c = BenchCollector(count, base, config, [handler], name=name)
+    next_run = time.time()
+    for i in xrange(runs):
+        c._run()
+        next_run += interval
+        delay = next_run - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    results.put((name, own_usage(), handler.dropped))
+
+
+def build_config(options, sinks):
+    config = configobj.ConfigObj()
+    config['server'] = {
+        'metric_queue_transport': options.transport,
+        'metric_batch_size': options.batch_size,
+        'handler_dispatch': options.dispatch,
+    }
+    config['handlers'] = {'default': {}}
+    for name, sink in sinks.iteritems():
+        if HANDLERS[name][1] == 'tcp':
+            section = {'host': '127.0.0.1', 'port': sink.port}
+        else:
+            section = {'url': 'http://127.0.0.1:%d' % sink.port,
+                       'api_key': 'bench'}
+        config['handlers'][HANDLERS[name][0].split('.')[-1]] = section
+    config['collectors'] = {
+        'default': {
+            'hostname': 'bench',
+            'path': 'bench',
+            'interval': max(options.interval, 1),
+        },
+    }
+    return config
+
+
+def report_usage(name, usage):
+    cpu, rss = usage
+    if cpu is None:
+        print '%-30s %10s %10s' % (name, '-', '-')
+    else:
+        print '%-30s %10.2f %10d' % (name, cpu, rss)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--collectors', type='int', default=10,
+                      help='number of collector processes')
+    parser.add_option('--metrics', type='int', default=1000,
+                      help='metrics published by a collector per run')
+    parser.add_option('--runs', type='int', default=5,
+                      help='runs of every collector')
+    parser.add_option('--interval', type='float', default=0,
+                      help='seconds between the runs of a collector')
+    parser.add_option('--handlers', default='graphite,tsdb,http',
+                      help='comma separated handlers out of %s' %
+                      ', '.join(sorted(HANDLERS)))
+    parser.add_option('--transport', default='manager',
+                      help='metric queue transport, manager or ringbuffer')
+    parser.add_option('--dispatch', default='serial',
+                      help='handler dispatch, serial, thread or process')
+    parser.add_option('--queue-size', type='int', default=16384)
+    parser.add_option('--batch-size', type='int', default=1000)
+    parser.add_option('--timeout', type='float', default=120,
+                      help='seconds to wait for the sinks to receive '
+                      'everything')
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    log = logging.getLogger('diamond')
+    # The sinks are local
+    os.environ['no_proxy'] = '127.0.0.1,localhost'
+
+    base = time.time()
+    sinks = {}
+    for name in options.handlers.split(','):
+        name = name.strip()
+        if name not in HANDLERS:
+            parser.error('Unknown handler %s' % name)
+        if name == 'netuitive':
+            try:
+                __import__('netuitive')
+            except ImportError:
+                print 'Skipping netuitive, the netuitive library is missing'
+                continue
+        if HANDLERS[name][1] == 'tcp':
+            sinks[name] = TCPSink(name, base)
+        else:
+            sinks[name] = HTTPSink(name, base)
+    for sink in sinks.values():
+        sink.start()
+
+    config = build_config(options, sinks)
+    server = Server(None)
+    server.config = config
+    queue = server.create_metric_queue(options.queue_size)
+
+    handlers = load_handlers(config, [HANDLERS[key][0] for key in sinks])
+    for handler in handlers:
+        if not handler.enabled:
+            print 'Warning: %s is disabled, its sink will get nothing' % (
+                handler.__class__.__name__)
+    workers = create_handler_workers(handlers, options.dispatch, log=log)
+    if options.dispatch == 'process':
+        for worker in workers:
+            worker.start()
+    h_process = multiprocessing.Process(name='Handlers',
+                                        target=handler_process,
+                                        args=(handlers, queue, log, workers))
+    h_process.daemon = True
+    h_process.start()
+
+    # Wait for the handlers to connect to the sinks
+    time.sleep(0.5)
+
+    results = multiprocessing.Queue()
+    start = time.time()
+    processes = [
+        multiprocessing.Process(
+            name='BenchCollector%d' % i, target=collector,
+            args=(config, queue, 'BenchCollector%d' % i, options.metrics,
+                  options.runs, options.interval, base, results))
+        for i in xrange(options.collectors)]
+    for process in processes:
+        process.start()
+
+    collector_usage = []
+    dropped = 0
+    for process in processes:
+        name, usage, process_dropped = results.get()
+        collector_usage.append(usage)
+        dropped += process_dropped
+    published_time = time.time() - start
+    for process in processes:
+        process.join()
+
+    expected = options.collectors * options.metrics * options.runs
+    deadline = time.time() + options.timeout
+    while time.time() < deadline:
+        if all(sink.received.value >= expected - dropped
+               for sink in sinks.values()):
+            break
+        time.sleep(0.01)
+    elapsed = time.time() - start
+
+    handler_usage = [('handler process', process_usage(h_process.pid))]
+    for worker in workers or []:
+        if options.dispatch == 'process':
+            handler_usage.append(('%s worker' % worker.name,
+                                  process_usage(worker.worker.pid)))
+    handler_usage.append(('server', process_usage(os.getpid())))
+    h_process.terminate()
+    for worker in workers or []:
+        if options.dispatch == 'process':
+            worker.worker.terminate()
+
+    print ('%d collectors x %d metrics x %d runs, transport %s, dispatch %s, '
+           'batch size %d' % (options.collectors, options.metrics,
+                              options.runs, options.transport,
+                              options.dispatch, options.batch_size))
+    print '%d metrics published in %.2fs, %d dropped by the QueueHandlers' % (
+        expected, published_time, dropped)
+    print
+    print '%-10s %10s %10s %12s %10s %10s' % (
+        'handler', 'received', 'lost', 'metrics/s', 'p50 ms', 'p99 ms')
+    sink_usage = []
+    for name in sorted(sinks):
+        sink = sinks[name]
+        latencies, usage = sink.finish()
+        sink_usage.append(('sink %s' % name, usage))
+        print '%-10s %10d %10d %12.0f %10.1f %10.1f' % (
+            name, len(latencies), expected - len(latencies),
+            len(latencies) / elapsed, percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000)
+
+    print
+    print '%-30s %10s %10s' % ('process', 'cpu s', 'rss kB')
+    cpu = sum(usage[0] for usage in collector_usage)
+    rss = max(usage[1] for usage in collector_usage)
+    report_usage('collectors (total cpu, max rss)', (cpu, rss))
+    for name, usage in handler_usage + sink_usage:
+        report_usage(name, usage)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Compare the throughput of the metric queue transports.
+
+Spawns a number of producer processes that put encoded metric batches on the
+queue the same way the QueueHandler does and a single consumer that drains
+and decodes them the same way the handler process does, then reports the
+metrics per second for each transport.
+
+    python src/diamond/test/benchtransport.py --producers 40 --metrics 5000
+"""
+
+import multiprocessing
+import optparse
+import os
+import Queue
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', '..')))
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.ringbuffer import RingBufferQueue
+from diamond.utils.wire import MetricDecoder
+from diamond.utils.wire import MetricEncoder
+
+
+def producer(queue, count, batch_size):
+    encoder = MetricEncoder()
+    metrics = [Metric('servers.host.cpu.cpu%d.idle' % i, 98.5,
+                      timestamp=1234567, host='host', metric_type='GAUGE',
+                      ttl=600)
+               for i in xrange(batch_size)]
+    sent = 0
+    while sent < count:
+        batch = MetricBatch(metrics[:count - sent], flush=False)
+        data = encoder.encode(batch)
+        while True:
+            try:
+                queue.put(data, block=False)
+                break
+            except Queue.Full:
+                time.sleep(0.0001)
+        sent += len(batch)
+    queue.put(None, block=True)
+
+
+def consumer(queue, producers, done):
+    decoder = MetricDecoder()
+    flushes = 0
+    metrics = 0
+    while flushes < producers:
+        item = queue.get(block=True, timeout=None)
+        if item is None:
+            flushes += 1
+        else:
+            metrics += len(decoder.decode(item))
+    done.put(metrics)
+
+
+def run(queue, producers, count, batch_size):
+    done = multiprocessing.Queue()
+    start = time.time()
+    c = multiprocessing.Process(target=consumer,
+                                args=(queue, producers, done))
+    c.start()
+    ps = [multiprocessing.Process(target=producer,
+                                  args=(queue, count, batch_size))
+          for i in range(producers)]
+    for p in ps:
+        p.start()
+    metrics = done.get()
+    elapsed = time.time() - start
+    for p in ps:
+        p.join()
+    c.join()
+    return metrics, elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--producers', type='int', default=8)
+    parser.add_option('--metrics', type='int', default=5000,
+                      help='metrics per producer')
+    parser.add_option('--batch-size', type='int', default=1000,
+                      help='metrics per batch, 1 to send metrics one by one')
+    parser.add_option('--queue-size', type='int', default=16384)
+    parser.add_option('--buffer-size', type='int', default=4 * 1024 * 1024)
+    (options, args) = parser.parse_args()
+
+    manager = multiprocessing.Manager()
+    transports = [
+        ('manager', manager.Queue(maxsize=options.queue_size)),
+        ('ringbuffer', RingBufferQueue(maxsize=options.queue_size,
+                                       buffer_size=options.buffer_size)),
+    ]
+
+    for name, queue in transports:
+        metrics, elapsed = run(queue, options.producers, options.metrics,
+                               options.batch_size)
+        print '%-12s %10d metrics %8.2fs %12.0f metrics/sec' % (
+            name, metrics, elapsed, metrics / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding=utf-8
+##########################################################################
+"""
+Measure the encode and decode throughput of the metric batch wire format
+against pickling the batch, which is what the metric queue used to carry.
+
+    python src/diamond/test/benchwire.py --metrics 5000 --rounds 20
+"""
+
+import optparse
+import os
+import sys
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle as pickle
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', '..')))
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.wire import MetricDecoder
+from diamond.utils.wire import MetricEncoder
+
+
+def make_batch(count):
+    metrics = []
+    for i in xrange(count):
+        metrics.append(Metric('servers.host.postgres.database.db%d.tup_%d' % (
+            i % 50, i), i * 1.5, timestamp=1234567, precision=2,
+            host='host', metric_type='GAUGE', ttl=600))
+    return MetricBatch(metrics, flush=True)
+
+
+def measure(name, rounds, count, size, encode, decode):
+    start = time.time()
+    for i in xrange(rounds):
+        data = encode()
+    encoded = time.time() - start
+
+    start = time.time()
+    for i in xrange(rounds):
+        decode(data)
+    decoded = time.time() - start
+
+    total = rounds * count
+    print ('%-8s %8d bytes/batch %10.0f encoded metrics/sec '
+           '%10.0f decoded metrics/sec') % (name, size(data), total / encoded,
+                                            total / decoded)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--metrics', type='int', default=5000,
+                      help='metrics per batch')
+    parser.add_option('--rounds', type='int', default=20)
+    (options, args) = parser.parse_args()
+
+    batch = make_batch(options.metrics)
+
+    measure('pickle', options.rounds, options.metrics, len,
+            lambda: pickle.dumps(batch.metrics, pickle.HIGHEST_PROTOCOL),
+            pickle.loads)
+
+    # Every round after the first only carries string ids
+    encoder = MetricEncoder()
+    decoder = MetricDecoder()
+    decoder.decode(encoder.encode(batch))
+    measure('wire', options.rounds, options.metrics, len,
+            lambda: encoder.encode(batch), decoder.decode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import patch
+
+from diamond.utils import cgroups
+from diamond.utils.cgroups import ContainerCgroups
+
+ID1 = 'a' * 64
+ID2 = 'b' * 64
+ID3 = 'c' * 64
+
+NET_DEV = """\
+Inter-|   Receive                            |  Transmit
+ face |bytes packets errs drop fifo frame compressed multicast|bytes packets \
+errs drop fifo colls carrier compressed
+    lo:     100       1    0    0    0     0          0         0      100 \
+      1    0    0    0     0       0          0
+  eth0:    2000      20    1    2    0     0          0         0     3000 \
+     30    3    4    0     0       0          0
+"""
+
+
+class TestContainerCgroups(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.root = os.path.join(self.path, 'cgroup')
+        self.proc = os.path.join(self.path, 'proc')
+        os.makedirs(self.root)
+        self.write(self.proc, 'stat', 'cpu  100 10 50 800 20 5 5 10 0 0\n'
+                                      'cpu0 100 10 50 800 20 5 5 10 0 0\n')
+        self.write(self.proc, 'meminfo', 'MemTotal:       1000 kB\n')
+        self.write(self.proc, '42/net/dev', NET_DEV)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, directory, name, content):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+
+    def write_v1(self, container, cgroup):
+        memory = os.path.join(self.root, 'memory', cgroup)
+        self.write(memory, 'memory.stat', 'rss 300\ntotal_rss 300\n')
+        self.write(memory, 'memory.usage_in_bytes', '4096\n')
+        self.write(memory, 'memory.max_usage_in_bytes', '8192\n')
+        self.write(memory, 'memory.limit_in_bytes', '9223372036854771712\n')
+        self.write(memory, 'memory.failcnt', '0\n')
+
+        cpu = os.path.join(self.root, 'cpu,cpuacct', cgroup)
+        self.write(cpu, 'cpuacct.usage', '5000000000\n')
+        self.write(cpu, 'cpuacct.usage_percpu', '3000000000 2000000000 \n')
+        self.write(cpu, 'cpuacct.stat', 'user 300\nsystem 100\n')
+        self.write(cpu, 'cpu.stat',
+                   'nr_periods 10\nnr_throttled 2\nthrottled_time 500\n')
+
+        blkio = os.path.join(self.root, 'blkio', cgroup)
+        self.write(blkio, 'blkio.io_service_bytes_recursive', 'Total 0\n')
+        self.write(blkio, 'blkio.throttle.io_service_bytes',
+                   '8:0 Read 4096\n8:0 Write 512\nTotal 4608\n')
+
+        pids = os.path.join(self.root, 'pids', cgroup)
+        self.write(pids, 'pids.current', '2\n')
+        self.write(pids, 'pids.max', 'max\n')
+
+        for directory in (memory, cpu, blkio, pids):
+            self.write(directory, 'cgroup.procs', '42\n43\n')
+
+    def test_v1(self):
+        self.write_v1(ID1, 'docker/' + ID1)
+        self.write_v1(ID2, 'system.slice/docker-%s.scope' % ID2)
+        reader = ContainerCgroups(self.root, self.proc)
+        self.assertEqual(reader.version, 1)
+
+        stats = reader.stats([ID1, ID2, ID3])
+        self.assertEqual(sorted(stats), [ID1, ID2])
+        stat = stats[ID2]
+        self.assertEqual(stat['memory_stats'], {
+            'usage': 4096,
+            'max_usage': 8192,
+            # The memory of the host when unlimited
+            'limit': 1024000,
+            'failcnt': 0,
+            'stats': {'rss': 300, 'total_rss': 300},
+        })
+        clock_ticks = reader.clock_ticks
+        self.assertEqual(stat['cpu_stats'], {
+            'cpu_usage': {
+                'total_usage': 5000000000,
+                'percpu_usage': [3000000000, 2000000000],
+                'usage_in_usermode': 300 * 1000000000 // clock_ticks,
+                'usage_in_kernelmode': 100 * 1000000000 // clock_ticks,
+            },
+            'throttling_data': {
+                'periods': 10,
+                'throttled_periods': 2,
+                'throttled_time': 500,
+            },
+            'system_cpu_usage': 990 * 1000000000 // clock_ticks,
+        })
+        self.assertEqual(stat['blkio_stats']['io_service_bytes_recursive'], [
+            {'major': 8, 'minor': 0, 'op': 'Read', 'value': 4096},
+            {'major': 8, 'minor': 0, 'op': 'Write', 'value': 512},
+        ])
+        self.assertEqual(stat['pids_stats'], {'current': 2, 'limit': None})
+        self.assertEqual(stat['networks'], {'eth0': {
+            'rx_bytes': 2000, 'rx_packets': 20, 'rx_errors': 1,
+            'rx_dropped': 2, 'tx_bytes': 3000, 'tx_packets': 30,
+            'tx_errors': 3, 'tx_dropped': 4,
+        }})
+
+    def test_v2(self):
+        self.write(self.root, 'cgroup.controllers', 'cpu io memory pids\n')
+        cgroup = os.path.join(self.root, 'kubepods.slice', 'pod1',
+                              'cri-containerd-%s.scope' % ID3)
+        self.write(cgroup, 'memory.current', '4096\n')
+        self.write(cgroup, 'memory.max', '2048000\n')
+        self.write(cgroup, 'memory.stat', 'anon 300\nfile 200\n')
+        self.write(cgroup, 'cpu.stat', 'usage_usec 5000\nuser_usec 3000\n'
+                                       'system_usec 2000\nnr_periods 0\n'
+                                       'nr_throttled 0\nthrottled_usec 0\n')
+        self.write(cgroup, 'io.stat', '8:0 rbytes=4096 wbytes=512 rios=4 '
+                                      'wios=1 dbytes=0 dios=0\n')
+        self.write(cgroup, 'pids.current', '2\n')
+        self.write(cgroup, 'pids.max', '100\n')
+        self.write(cgroup, 'cgroup.procs', '')
+
+        reader = ContainerCgroups(self.root, self.proc)
+        self.assertEqual(reader.version, 2)
+        stat = reader.stats([ID3])[ID3]
+        self.assertEqual(stat['memory_stats'], {
+            'usage': 4096,
+            # No more than the memory of the host
+            'limit': 1024000,
+            'stats': {'anon': 300, 'file': 200},
+        })
+        self.assertEqual(stat['cpu_stats']['cpu_usage'], {
+            'total_usage': 5000000,
+            'usage_in_usermode': 3000000,
+            'usage_in_kernelmode': 2000000,
+        })
+        self.assertEqual(stat['blkio_stats'], {
+            'io_service_bytes_recursive': [
+                {'major': 8, 'minor': 0, 'op': 'Read', 'value': 4096},
+                {'major': 8, 'minor': 0, 'op': 'Write', 'value': 512},
+            ],
+            'io_serviced_recursive': [
+                {'major': 8, 'minor': 0, 'op': 'Read', 'value': 4},
+                {'major': 8, 'minor': 0, 'op': 'Write', 'value': 1},
+            ],
+        })
+        self.assertEqual(stat['pids_stats'], {'current': 2, 'limit': 100})
+        self.assertFalse('networks' in stat)
+
+    def test_looks_up_once(self):
+        self.write_v1(ID1, 'docker/' + ID1)
+        reader = ContainerCgroups(self.root, self.proc)
+        walk = patch.object(cgroups.os, 'walk', wraps=os.walk)
+        walk_mock = walk.start()
+        try:
+            reader.stats([ID1])
+            walks = walk_mock.call_count
+            self.assertTrue(walks > 0)
+            reader.stats([ID1])
+            self.assertEqual(walk_mock.call_count, walks)
+
+            # A new container is looked up
+            self.write_v1(ID2, 'docker/' + ID2)
+            self.assertEqual(sorted(reader.stats([ID1, ID2])), [ID1, ID2])
+            self.assertTrue(walk_mock.call_count > walks)
+        finally:
+            walk.stop()
+
+    def test_stopped_container(self):
+        self.write_v1(ID1, 'docker/' + ID1)
+        self.write_v1(ID2, 'docker/' + ID2)
+        reader = ContainerCgroups(self.root, self.proc)
+        self.assertEqual(len(reader.stats([ID1, ID2])), 2)
+
+        for controller in ('memory', 'cpu,cpuacct', 'blkio', 'pids'):
+            shutil.rmtree(os.path.join(self.root, controller, 'docker', ID2))
+        self.assertEqual(reader.stats([ID1, ID2]).keys(), [ID1])
+        self.assertFalse(ID2 in reader.paths)
+
+        # Forgotten once no longer listed
+        reader.stats([])
+        self.assertEqual(reader.paths, {})
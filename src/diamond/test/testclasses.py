@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+
+from test import unittest
+
+from diamond.utils.classes import build_collector_index
+from diamond.utils.classes import load_collectors_from_index
+from diamond.utils.classes import scan_collector_classes
+
+MODULE = '''
+import diamond.collector
+
+
+class Helper(object):
+    pass
+
+
+class %(name)s(diamond.collector.Collector):
+    pass
+'''
+
+
+class TestCollectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.modules = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        for module in self.modules:
+            sys.modules.pop(module, None)
+            if os.path.join(self.path, module) in sys.path:
+                sys.path.remove(os.path.join(self.path, module))
+
+    def write_module(self, module, source):
+        directory = os.path.join(self.path, module)
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        fpath = os.path.join(directory, module + '.py')
+        f = open(fpath, 'w')
+        f.write(source)
+        f.close()
+        self.modules.append(module)
+        return fpath
+
+    def test_scan(self):
+        fpath = self.write_module('indexscan', MODULE % {'name': 'netapp'})
+        self.assertEqual(scan_collector_classes(fpath), ['netapp'])
+
+        fpath = self.write_module('indexbroken', 'class BrokenCollector(:')
+        self.assertEqual(scan_collector_classes(fpath), [])
+
+    def test_index_file(self):
+        fpath = self.write_module('indexfile',
+                                  MODULE % {'name': 'FooCollector'})
+        self.write_module('testindexfile', MODULE % {'name': 'TestCollector'})
+        index_file = os.path.join(self.path, 'index.json')
+
+        index = build_collector_index([self.path], index_file)
+        self.assertEqual(index, {'FooCollector': fpath})
+        self.assertTrue(os.path.exists(index_file))
+
+        # A changed module is scanned again
+        f = open(fpath, 'a')
+        f.write(MODULE % {'name': 'BarCollector'})
+        f.close()
+        index = build_collector_index([self.path], index_file)
+        self.assertEqual(sorted(index), ['BarCollector', 'FooCollector'])
+
+    def test_load_enabled_only(self):
+        self.write_module('indexenabled',
+                          MODULE % {'name': 'EnabledCollector'})
+        self.write_module('indexdisabled', 'raise ImportError("imported")')
+
+        collectors = load_collectors_from_index([self.path],
+                                                ['EnabledCollector'])
+        self.assertEqual(collectors.keys(), ['EnabledCollector'])
+        self.assertFalse('indexdisabled' in sys.modules)
@@ -2,10 +2,18 @@
 # coding=utf-8
 ##########################################################################
 
+import os
+import shutil
+import tempfile
+
 from test import unittest
 import configobj
+from mock import Mock
 
 from diamond.collector import Collector
+from diamond.collector import SelfMetricsCollector
+from diamond.metric import Metric
+from diamond.utils.selfmetrics import SelfMetrics
 
 
 class BaseCollectorTest(unittest.TestCase):
@@ -51,3 +59,207 @@ class BaseCollectorTest(unittest.TestCase):
         self.assertEquals('https://api.app.netuitive.com/ingest/infrastructure', c.config['netuitive_url'])
         self.assertEquals('3bd5b41c0cbbbe3e8a1eefb16a6f8c58', c.config['netuitive_api_key'])
 
+    def get_config(self, **default):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = default
+        return config
+
+    def test_MetricPath(self):
+        c = Collector(self.get_config(hostname='host', path_suffix='sfx'), [])
+        c.config['path'] = 'cpu'
+        self.assertEquals('servers.host.sfx.cpu.total.idle',
+                          c.get_metric_path('total.idle'))
+        self.assertEquals('instances.vm1.cpu.total.idle',
+                          c.get_metric_path('total.idle', instance='vm1'))
+
+    def test_MetricPathCachedUntilReload(self):
+        c = Collector(self.get_config(hostname='host'), [])
+        c.config['path'] = 'cpu'
+        c.config['interval'] = 10
+        self.assertEquals('servers.host.cpu.idle', c.get_metric_path('idle'))
+        self.assertEquals(20.0, c.get_metric_ttl())
+
+        c.load_config(override_config=self.get_config(hostname='other',
+                                                      path='mem',
+                                                      interval=60))
+        self.assertEquals('servers.other.mem.idle', c.get_metric_path('idle'))
+        self.assertEquals(120.0, c.get_metric_ttl())
+
+    def test_PublishUsesCachedPath(self):
+        handler = Mock()
+        c = Collector(self.get_config(hostname='host', path='cpu'), [handler])
+        c.publish('idle', 1)
+        c.publish('idle', 2)
+
+        metrics = [args[0][0] for args in handler._process.call_args_list]
+        self.assertEquals(['servers.host.cpu.idle'] * 2,
+                          [m.path for m in metrics])
+        self.assertEquals(['host'] * 2, [m.host for m in metrics])
+        self.assertEquals([600.0] * 2, [m.ttl for m in metrics])
+
+    def test_PublishStructuredPath(self):
+        handler = Mock()
+        c = Collector(self.get_config(hostname='host', path='cpu'), [handler])
+        c.publish('total.idle', 1)
+
+        metric = handler._process.call_args[0][0]
+        self.assertEquals('servers', metric.path_prefix)
+        self.assertEquals('cpu', metric.collector_path)
+        self.assertEquals('total.idle', metric.metric_path)
+
+        parsed = Metric(metric.path, 1, host=metric.host)
+        self.assertEquals(parsed.getPathPrefix(), metric.getPathPrefix())
+        self.assertEquals(parsed.getCollectorPath(),
+                          metric.getCollectorPath())
+        self.assertEquals(parsed.getMetricPath(), metric.getMetricPath())
+
+    def test_PublishStructuredPathFallback(self):
+        handler = Mock()
+        c = Collector(self.get_config(hostname='host', path='cpu',
+                                      path_suffix='sfx'), [handler])
+        c.publish('total.idle', 1)
+
+        metric = handler._process.call_args[0][0]
+        self.assertEquals(None, metric.metric_path)
+        self.assertEquals('cpu.total.idle', metric.getMetricPath())
+
+    def test_RunPublishesSchedulerMetrics(self):
+        handler = Mock()
+        c = Collector(self.get_config(hostname='host', path='cpu',
+                                      measure_scheduler='true'), [handler])
+        c.collect = Mock()
+        job = Mock(lag=1.5, missed=2, interval=10)
+        c._run(job)
+
+        metrics = dict((args[0][0].path, args[0][0].value)
+                       for args in handler._process.call_args_list)
+        self.assertEquals({
+            'servers.host.cpu.scheduler.lag_ms': 1500,
+            'servers.host.cpu.scheduler.skipped': 2,
+            'servers.host.cpu.scheduler.overrun': 0,
+        }, metrics)
+        self.assertEquals(1, handler._flush.call_count)
+
+    def test_Derivatives(self):
+        config = self.get_config(hostname='host', path='net', interval=10)
+        c = Collector(config, [])
+        bulk = Collector(config, [])
+        names = ['a', 'b', 'c']
+        max_values = [0, 100, 0]
+        for values in ([10, 90, 50], [30, 20, 40], [60, 40, 45]):
+            expected = [c.derivative(name, value, max_value)
+                        for name, value, max_value in zip(names, values,
+                                                          max_values)]
+            self.assertEquals(expected,
+                              bulk.derivatives(names, values, max_values))
+        self.assertEquals([3.0, 2.0, 0.5], expected)
+
+        self.assertEquals([5, -5], bulk.derivatives(
+            ['a', 'c'], [65, 40], time_delta=False, allow_negative=True))
+        self.assertEquals([0, 0.5], bulk.derivatives(
+            ['d', 'c'], [1, 50], interval=20))
+
+    def test_SelfMetrics(self):
+        registry = SelfMetrics()
+        handler = Mock(dropped=0)
+        c = Collector(self.get_config(hostname='host', path='cpu'),
+                      [handler], name='CPUCollector x')
+        c.set_self_metrics(registry)
+
+        def collect():
+            c.publish('a', 1)
+            c.publish('b', 2)
+            handler.dropped += 1
+        c.collect = collect
+        c._run()
+        c._run()
+
+        metrics = dict(registry.collect())
+        self.assertEquals(2, metrics['collectors.CPUCollector_x.runs'])
+        self.assertEquals(2, metrics['collectors.CPUCollector_x.metrics'])
+        self.assertEquals(2, metrics['collectors.CPUCollector_x.dropped'])
+
+        # The self metrics collector publishes them under diamond
+        queue = Mock()
+        queue.qsize.return_value = 3
+        publisher = Mock()
+        self_metrics = SelfMetricsCollector(
+            registry, queue, self.get_config(hostname='host'), [publisher])
+        c._run()
+        self_metrics._run()
+        metrics = dict((args[0][0].path, args[0][0].value)
+                       for args in publisher._process.call_args_list)
+        self.assertEquals(3, metrics['servers.host.diamond.queue.depth'])
+        self.assertEquals(
+            1, metrics['servers.host.diamond.collectors.CPUCollector_x.runs'])
+
+    def test_Profile(self):
+        path = tempfile.mkdtemp()
+        try:
+            c = Collector(self.get_config(hostname='host', path='cpu',
+                                          profile='True', profile_runs=2,
+                                          profile_dir=path), [])
+            c.collect = Mock(side_effect=Exception('failed'))
+            self.assertRaises(Exception, c._run)
+            c.collect = Mock()
+            c._run()
+            c._run()
+            self.assertEquals(3, len(os.listdir(path)))
+
+            # Reloading the config doesn't start over, turning the option on
+            # does
+            c.load_config(override_config=self.get_config(
+                profile='True', profile_runs=2, profile_dir=path))
+            self.assertFalse(c.profiler.active)
+            c.load_config(override_config=self.get_config())
+            c.load_config(override_config=self.get_config(
+                profile='True', profile_runs=2, profile_dir=path))
+            self.assertTrue(c.profiler.active)
+        finally:
+            shutil.rmtree(path)
+
+    def test_DerivativeStateEvicted(self):
+        c = Collector(self.get_config(hostname='host', path='docker',
+                                      counter_ttl=1,
+                                      counter_storage='array'), [])
+        c.collect = Mock()
+
+        c.derivative('container1.cpu', 10)
+        c.derivative('container2.cpu', 10)
+        c._run()
+        self.assertEquals(5, c.derivative('container1.cpu', 20,
+                                          interval=2))
+        c._run()
+        self.assertEquals(['servers.host.docker.container1.cpu'],
+                          c.last_values.keys())
+        self.assertEquals(1, c.last_values.total_evicted)
+
+        # The state is kept across config reloads
+        c.load_config(override_config=self.get_config(counter_ttl=5,
+                                                      counter_storage='array'))
+        self.assertEquals(5, c.last_values.ttl)
+        self.assertEquals(1, len(c.last_values))
+
+    def test_CounterStateRestored(self):
+        path = tempfile.mkdtemp()
+        try:
+            config = self.get_config(hostname='host', path='net',
+                                     interval=10, counter_state_path=path)
+            c = Collector(config, [])
+            c.collect = Mock()
+            c.derivative('eth0.rx_bytes', 1000)
+            c._run()
+            c.last_values.timestamp -= 20
+            c.save_counter_state()
+
+            # The first rate is over the time since the counters were saved
+            c = Collector(config, [])
+            self.assertEquals(['servers.host.net.eth0.rx_bytes'],
+                              c.last_values.keys())
+            rate = c.derivative('eth0.rx_bytes', 3000)
+            self.assertTrue(95 < rate <= 100, rate)
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import patch
+
+from diamond.utils import config as config_module
+from diamond.utils.config import copy_section
+from diamond.utils.config import load_config
+from diamond.utils.config import set_config_snapshot
+
+SERVER_CONFIG = '''
+[server]
+collectors_config_path = %s
+
+[collectors]
+
+[[default]]
+interval = 60
+'''
+
+
+class TestLoadConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.collectors_path = os.path.join(self.path, 'collectors')
+        os.mkdir(self.collectors_path)
+        self.configfile = os.path.join(self.path, 'diamond.conf')
+        self.write(self.configfile, SERVER_CONFIG % self.collectors_path)
+        self.write_collector('CPUCollector', 'enabled = True\n')
+
+    def tearDown(self):
+        set_config_snapshot(None)
+        config_module._cache.clear()
+        shutil.rmtree(self.path)
+
+    def write(self, path, content):
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+
+    def write_collector(self, name, content):
+        self.write(os.path.join(self.collectors_path, name + '.conf'),
+                   content)
+
+    def test_cached(self):
+        config = load_config(self.configfile, copy=False)
+        self.assertTrue(config['collectors']['CPUCollector']['enabled'])
+        self.assertTrue(load_config(self.configfile, copy=False) is config)
+
+        copied = load_config(self.configfile)
+        self.assertFalse(copied is config)
+        self.assertEqual(copied, config)
+
+    def test_reloaded_on_change(self):
+        config = load_config(self.configfile, copy=False)
+
+        self.write_collector('CPUCollector', 'enabled = False\n')
+        config = load_config(self.configfile, copy=False)
+        self.assertFalse(config['collectors']['CPUCollector']['enabled'])
+
+        # A new file changes the mtime of the directory
+        os.utime(self.collectors_path, (0, 0))
+        self.write_collector('MemoryCollector', 'enabled = True\n')
+        config = load_config(self.configfile, copy=False)
+        self.assertTrue(config['collectors']['MemoryCollector']['enabled'])
+
+    def test_snapshot(self):
+        set_config_snapshot(os.path.join(self.path, 'config.snapshot'))
+        config = load_config(self.configfile, copy=False)
+        config_module._cache.clear()
+
+        with patch.object(config_module, '_load_config') as _load_config:
+            snapshot = load_config(self.configfile, copy=False)
+            self.assertEqual(_load_config.call_count, 0)
+        self.assertEqual(snapshot, config)
+
+        # A stale snapshot is ignored
+        config_module._cache.clear()
+        self.write_collector('CPUCollector', 'enabled = False, True\n')
+        config = load_config(self.configfile, copy=False)
+        self.assertEqual(config['collectors']['CPUCollector']['enabled'],
+                         ['False', 'True'])
+
+    def test_copy_section(self):
+        config = load_config(self.configfile, copy=False)
+        self.write_collector('CPUCollector', 'hosts = a, b\n')
+        config = load_config(self.configfile, copy=False)
+
+        section = copy_section(config['collectors']['CPUCollector'])
+        section['hosts'].append('c')
+        self.assertEqual(config['collectors']['CPUCollector']['hosts'],
+                         ['a', 'b'])
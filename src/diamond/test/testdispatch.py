@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import threading
+import time
+
+from test import unittest
+from mock import Mock
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.dispatch import HandlerWorker
+from diamond.utils.dispatch import create_handler_workers
+from diamond.utils.selfmetrics import SelfMetrics
+
+
+def make_batch(count, flush=True):
+    return MetricBatch([Metric('servers.host.cpu.total.idle', i,
+                               timestamp=1234567, host='host')
+                        for i in range(count)], flush=flush)
+
+
+def make_handler():
+    # Create the attributes up front, a Mock creating them lazily from two
+    # threads at once is not thread safe
+    handler = Mock()
+    handler._process_batch = Mock()
+    handler._flush = Mock()
+    handler._throttle_error = Mock()
+    return handler
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestHandlerWorker(unittest.TestCase):
+
+    def test_serial_has_no_workers(self):
+        self.assertEqual(create_handler_workers([Mock()], 'serial'), None)
+
+    def test_thread_worker_processes_batches(self):
+        handler = make_handler()
+        worker = HandlerWorker(handler, mode='thread', maxsize=10)
+        worker.start()
+
+        batch = make_batch(3)
+        worker.put(batch)
+
+        self.assertTrue(wait_for(lambda: handler._flush.called))
+        handler._process_batch.assert_called_once_with(batch.metrics)
+        self.assertEqual(worker.dropped, 0)
+
+    def test_slow_handler_drops_only_its_own_batches(self):
+        release = threading.Event()
+        slow = make_handler()
+        slow._process_batch.side_effect = lambda metrics: release.wait(5)
+        fast = make_handler()
+
+        slow_worker, fast_worker = create_handler_workers(
+            [slow, fast], 'thread', maxsize=1)
+        registry = SelfMetrics()
+        slow_worker.set_self_metrics(registry)
+        for worker in (slow_worker, fast_worker):
+            worker.start()
+
+        for i in range(4):
+            for worker in (slow_worker, fast_worker):
+                worker.put(make_batch(2))
+            wait_for(lambda: fast_worker.qsize() == 0)
+
+        self.assertTrue(slow_worker.dropped >= 2)
+        self.assertEqual(slow_worker.dropped_items * 2, slow_worker.dropped)
+        # In a slot of their own, the handler counts the metrics it drops
+        metrics = dict(registry.collect())
+        self.assertEqual(metrics['handlers.Mock.queue_dropped'],
+                         slow_worker.dropped)
+        self.assertFalse(slow._count_dropped.called)
+        self.assertEqual(fast_worker.dropped, 0)
+        self.assertTrue(wait_for(lambda: fast._flush.call_count == 4))
+
+        release.set()
+        self.assertTrue(wait_for(lambda: slow_worker.qsize() == 0))
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, HandlerWorker, Mock(), 'fork')
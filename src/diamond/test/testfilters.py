@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import re
+
+from test import unittest
+
+from diamond.utils.cache import LRUCache
+from diamond.utils.filters import MetricFilter
+from diamond.utils.filters import parse_literal
+from diamond.utils.filters import split_alternatives
+
+PATTERNS = [
+    'cpu.total.idle$',
+    '^cpu\.total\.idle$',
+    'cpu\.total',
+    'cpu\.total.*',
+    'cpu\.total.*$',
+    'network\.eth[0-9]+\.rx_bytes|network\.lo\.|memory\.Active$',
+    '(cpu|memory)\.total|loadavg\.01',
+    'cpu\.cpu\d+\.user',
+    '(?i)CPU\.total',
+    '[|]pipe|cpu\.total\.idle\\$',
+    'vmstat\.|',
+    'total',
+    '^/boot|^/mnt|m',
+]
+
+NAMES = [
+    'cpu.total.idle',
+    'cpu.total.idle2',
+    'cpuXtotal.idle',
+    'cpu.total.user',
+    'cpu.cpu0.user',
+    'cpu.cpuX.user',
+    'memory.Active',
+    'memory.Active.x',
+    'memory.total',
+    'network.eth0.rx_bytes',
+    'network.ethX.rx_bytes',
+    'network.lo.rx_bytes',
+    'loadavg.01',
+    'loadavg.05',
+    '|pipe',
+    'cpu.total.idle$',
+    'vmstat.pgpgin',
+    '/boot',
+    '/mnt/data',
+    '/home',
+    '/',
+    '',
+]
+
+
+class TestMetricFilter(unittest.TestCase):
+
+    def test_split_alternatives(self):
+        self.assertEqual(split_alternatives('a|b\|c|(d|e)|[|]|f'),
+                         ['a', 'b\|c', '(d|e)', '[|]', 'f'])
+        self.assertEqual(split_alternatives('[]|]|a'), ['[]|]', 'a'])
+
+    def test_parse_literal(self):
+        self.assertEqual(parse_literal('^cpu\.total$'),
+                         ('cpu.total', True, True))
+        self.assertEqual(parse_literal('cpu\.total.*'),
+                         ('cpu.total', False, False))
+        self.assertEqual(parse_literal('cpu\.total\$'),
+                         ('cpu.total$', False, False))
+        self.assertEqual(parse_literal('cpu.total'), None)
+        self.assertEqual(parse_literal('cpu\d'), None)
+
+    def test_same_as_regex(self):
+        for pattern in PATTERNS:
+            regex = re.compile(pattern)
+            anchored = MetricFilter(pattern)
+            unanchored = MetricFilter(pattern, anchored=False)
+            for name in NAMES:
+                # Twice to go through the cache
+                for i in range(2):
+                    self.assertEqual(
+                        anchored.matches(name), bool(regex.match(name)),
+                        'match %r %r' % (pattern, name))
+                    self.assertEqual(
+                        unanchored.matches(name), bool(regex.search(name)),
+                        'search %r %r' % (pattern, name))
+
+    def test_pattern_list(self):
+        f = MetricFilter(['^/boot', '^/mnt', 'tmp'], anchored=False)
+        self.assertTrue(f.matches('/boot'))
+        self.assertTrue(f.matches('/mnt/data'))
+        self.assertTrue(f.matches('/var/tmp'))
+        self.assertFalse(f.matches('/home'))
+
+        self.assertFalse(MetricFilter([]).matches('cpu.total.idle'))
+
+    def test_standalone_patterns(self):
+        # The flag of the first pattern doesn't apply to the others
+        f = MetricFilter(['(?i)CPU\.total', 'memory\.Active$', 'load.v'])
+        self.assertTrue(f.matches('cpu.total.idle'))
+        self.assertTrue(f.matches('memory.Active'))
+        self.assertFalse(f.matches('MEMORY.ACTIVE'))
+        self.assertFalse(f.matches('LOADAVG'))
+
+        # Backreferences keep referring to their own group
+        f = MetricFilter(['(x)\\1', 'disk\\.(sd.)\\.\\1'])
+        self.assertTrue(f.matches('disk.sda.sda'))
+        self.assertFalse(f.matches('disk.sda.sdb'))
+        self.assertTrue(f.matches('xx'))
+
+    def test_literals_skip_the_regex(self):
+        f = MetricFilter('cpu\.total\.idle$|memory\.|loadavg\.\d+')
+        self.assertEqual(f.exact, set(['cpu.total.idle']))
+        self.assertTrue(f.match_prefix('memory.Active'))
+        self.assertEqual(f.regex.pattern, 'loadavg\.\d+')
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_bounded(self):
+        cache = LRUCache(10)
+        for i in range(100):
+            cache[i] = i
+        self.assertTrue(len(cache) <= 10)
+        self.assertEqual(cache.get(99), 99)
+        self.assertEqual(cache.get(0), None)
+
+    def test_keeps_recently_used(self):
+        cache = LRUCache(4)
+        cache['a'] = 1
+        for i in range(10):
+            cache[i] = i
+            self.assertEqual(cache.get('a'), 1)
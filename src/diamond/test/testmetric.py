@@ -111,3 +111,22 @@ class TestMetric(unittest.TestCase):
                 message = 'Actual %s, expected %s' % (actual_value,
                                                       expected_value)
                 self.assertEqual(actual_value, expected_value, message)
+
+    def test_structured_path(self):
+        metric = Metric('servers.host.cpu.total.idle', 0, host='host',
+                        path_prefix='servers', collector_path='cpu',
+                        metric_path='total.idle')
+        parsed = Metric('servers.host.cpu.total.idle', 0, host='host')
+
+        self.assertEqual(metric.getPathPrefix(), parsed.getPathPrefix())
+        self.assertEqual(metric.getCollectorPath(), parsed.getCollectorPath())
+        self.assertEqual(metric.getMetricPath(), parsed.getMetricPath())
+
+    def test_setstate_without_structured_path(self):
+        metric = Metric('servers.host.cpu.total.idle', 0, host='host')
+        state = metric.__getstate__()[:8]
+
+        restored = Metric.__new__(Metric)
+        restored.__setstate__(state)
+        self.assertEqual(restored.path_prefix, None)
+        self.assertEqual(restored.getMetricPath(), 'total.idle')
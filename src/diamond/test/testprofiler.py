@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import Mock
+
+from diamond.utils.profiler import RunProfiler
+
+
+def busy_function():
+    return sum(i * i for i in xrange(1000))
+
+
+class TestRunProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_once(self, profiler):
+        profiler.enable()
+        busy_function()
+        profiler.disable()
+        profiler.end_run()
+
+    def test_inactive(self):
+        profiler = RunProfiler('CPUCollector', directory=self.path)
+        self.assertFalse(profiler.active)
+        profiler.end_run()
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_profiles_runs(self):
+        log = Mock()
+        profiler = RunProfiler('Disk Collector', runs=2,
+                               directory=os.path.join(self.path, 'profiles'),
+                               top=5, log=log)
+        profiler.start()
+        self.assertTrue(profiler.active)
+
+        self.run_once(profiler)
+        self.assertTrue(profiler.active)
+        self.assertFalse(log.info.call_count > 1)
+
+        self.run_once(profiler)
+        self.assertFalse(profiler.active)
+        files = sorted(os.listdir(os.path.join(self.path, 'profiles')))
+        self.assertEqual(len(files), 3)
+        session = 'Disk_Collector-%s' % profiler.session
+        self.assertEqual(files, [session + '-1.prof', session + '-2.prof',
+                                 session + '.prof'])
+
+        # The top functions of both runs are logged
+        report = log.info.call_args[0][-1]
+        self.assertTrue('busy_function' in report, report)
+        self.assertTrue('2 function calls' not in report)
+
+        # Not profiled any more
+        self.run_once(profiler)
+        self.assertEqual(len(os.listdir(os.path.join(self.path,
+                                                     'profiles'))), 3)
+
+    def test_unwritable_directory(self):
+        log = Mock()
+        path = os.path.join(self.path, 'file')
+        open(path, 'w').close()
+        profiler = RunProfiler('CPUCollector', runs=2, directory=path,
+                               log=log)
+        profiler.start()
+        self.run_once(profiler)
+        self.assertFalse(profiler.active)
+        self.assertEqual(log.error.call_count, 1)
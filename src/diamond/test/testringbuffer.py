@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import multiprocessing
+import Queue
+
+from test import unittest
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.ringbuffer import RingBufferQueue
+
+
+def produce(queue, count):
+    for i in range(count):
+        queue.put(Metric('servers.host.cpu.total.idle', i,
+                         timestamp=1234567, host='host'), block=True)
+    queue.put(None, block=True)
+
+
+class TestRingBufferQueue(unittest.TestCase):
+
+    def assertMetricEqual(self, actual, expected):
+        for slot in Metric.__slots__:
+            self.assertEqual(getattr(actual, slot), getattr(expected, slot))
+
+    def test_put_get_metric(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        metric = Metric('servers.host.cpu.total.idle', 98.5, raw_value=123,
+                        timestamp=1234567, precision=2, host='host',
+                        metric_type='GAUGE', ttl=600)
+        queue.put(metric, block=False)
+        self.assertEqual(queue.qsize(), 1)
+        self.assertMetricEqual(queue.get(), metric)
+        self.assertTrue(queue.empty())
+
+    def test_put_get_int_metric(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        metric = Metric('servers.host.network.eth0.rx_bytes', 2 ** 62,
+                        timestamp=1234567)
+        queue.put(metric, block=False)
+        actual = queue.get()
+        self.assertMetricEqual(actual, metric)
+        self.assertTrue(isinstance(actual.value, (int, long)))
+
+    def test_flush_and_pickled_items(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        queue.put(None, block=False)
+        queue.put({'foo': [1, 2]}, block=False)
+        self.assertEqual(queue.get(), None)
+        self.assertEqual(queue.get(), {'foo': [1, 2]})
+
+    def test_put_get_bytes(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        queue.put('\x00\x01encoded batch', block=False)
+        self.assertEqual(queue.get(), '\x00\x01encoded batch')
+
+    def test_put_get_batch(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        metrics = [Metric('servers.host.cpu.total.idle', i, timestamp=1234567,
+                          host='host')
+                   for i in range(10)]
+        metrics.append(Metric(u'servers.host.cpu.total.user', 1,
+                              timestamp=1234567))
+        queue.put(MetricBatch(metrics, flush=False), block=False)
+        self.assertEqual(queue.qsize(), 1)
+
+        batch = queue.get()
+        self.assertFalse(batch.flush)
+        self.assertEqual(len(batch), len(metrics))
+        for actual, expected in zip(batch.metrics, metrics):
+            self.assertMetricEqual(actual, expected)
+
+    def test_full(self):
+        queue = RingBufferQueue(maxsize=2, buffer_size=4096)
+        queue.put(None, block=False)
+        queue.put(None, block=False)
+        self.assertRaises(Queue.Full, queue.put, None, False)
+
+        queue = RingBufferQueue(buffer_size=64)
+        self.assertRaises(Queue.Full, queue.put, 'x' * 100, False)
+
+    def test_get_timeout(self):
+        queue = RingBufferQueue(buffer_size=4096)
+        self.assertRaises(Queue.Empty, queue.get, True, 0.01)
+        self.assertRaises(Queue.Empty, queue.get_nowait)
+
+    def test_wraps_around(self):
+        queue = RingBufferQueue(buffer_size=200)
+        for i in range(100):
+            metric = Metric('servers.host.cpu.total.idle', i,
+                            timestamp=1234567, host='host')
+            queue.put(metric, block=False)
+            self.assertMetricEqual(queue.get(), metric)
+
+    def test_multiple_producers(self):
+        queue = RingBufferQueue(buffer_size=1024)
+        producers = [multiprocessing.Process(target=produce,
+                                             args=(queue, 200))
+                     for i in range(3)]
+        for process in producers:
+            process.start()
+
+        values = []
+        flushes = 0
+        while flushes < len(producers):
+            item = queue.get(timeout=10)
+            if item is None:
+                flushes += 1
+            else:
+                values.append(item.value)
+
+        for process in producers:
+            process.join()
+
+        self.assertEqual(sorted(values), sorted(range(200) * 3))
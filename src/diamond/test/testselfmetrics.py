@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import multiprocessing
+
+from test import unittest
+
+from diamond.utils.selfmetrics import NULL_METRIC
+from diamond.utils.selfmetrics import SelfMetrics
+from diamond.utils.selfmetrics import get_rss_kb
+
+
+def update(counter, gauge, histogram):
+    counter.inc(3)
+    gauge.set(7)
+    histogram.observe(20)
+
+
+class TestSelfMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        registry = SelfMetrics(16)
+        counter = registry.counter('runs')
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(registry.collect(), [('runs', 3)])
+        counter.inc()
+        self.assertEqual(registry.collect(), [('runs', 1)])
+        self.assertEqual(registry.collect(), [('runs', 0)])
+
+        # A counter restarting from 0 doesn't go negative
+        counter.set(0)
+        self.assertEqual(registry.collect(), [('runs', 0)])
+
+    def test_gauge(self):
+        registry = SelfMetrics(16)
+        registry.gauge('depth').set(5)
+        self.assertEqual(registry.collect(), [('depth', 5)])
+        self.assertEqual(registry.collect(), [('depth', 5)])
+
+    def test_histogram(self):
+        registry = SelfMetrics(32)
+        histogram = registry.histogram('flush_ms')
+        self.assertEqual(registry.collect(), [('flush_ms.count', 0)])
+
+        for value in [0.5] * 50 + [3] * 45 + [40] * 4 + [20000]:
+            histogram.observe(value)
+        self.assertEqual(dict(registry.collect()), {
+            'flush_ms.count': 100,
+            'flush_ms.avg': (25 + 135 + 160 + 20000) / 100.0,
+            'flush_ms.p50': 1,
+            'flush_ms.p90': 5,
+            'flush_ms.p99': 50,
+        })
+
+        # Only the observations since the previous collect count
+        histogram.observe(20000)
+        metrics = dict(registry.collect())
+        self.assertEqual(metrics['flush_ms.count'], 1)
+        self.assertEqual(metrics['flush_ms.p50'], 10000)
+
+    def test_allocation(self):
+        registry = SelfMetrics(8)
+        counter = registry.counter('runs')
+        self.assertTrue(registry.counter('runs') is counter)
+        self.assertRaises(ValueError, registry.gauge, 'runs')
+
+        # Out of slots
+        self.assertTrue(registry.histogram('flush_ms') is NULL_METRIC)
+        NULL_METRIC.observe(1)
+        self.assertEqual(registry.collect(), [('runs', 0)])
+
+    def test_shared_with_children(self):
+        registry = SelfMetrics(32)
+        counter = registry.counter('runs')
+        gauge = registry.gauge('rss')
+        histogram = registry.histogram('process_ms')
+
+        process = multiprocessing.Process(target=update,
+                                          args=(counter, gauge, histogram))
+        process.start()
+        process.join()
+
+        metrics = dict(registry.collect())
+        self.assertEqual(metrics['runs'], 3)
+        self.assertEqual(metrics['rss'], 7)
+        self.assertEqual(metrics['process_ms.count'], 1)
+        self.assertEqual(metrics['process_ms.p99'], 25)
+
+    def test_rss(self):
+        rss = get_rss_kb()
+        self.assertTrue(rss is None or rss > 0)
@@ -2,9 +2,12 @@
 # coding=utf-8
 ##########################################################################
 
+import Queue
+
 from test import unittest
 import configobj
 from diamond.server import Server
+from diamond.utils.wire import MetricDecoder
 
 
 class ServerTest(unittest.TestCase):
@@ -96,5 +99,59 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(config['collectors']['VMStatCollector']['enabled'], 'True')
         self.assertEqual(config['collectors']['NetworkCollector']['enabled'], 'True')
 
+    def test_SharedCollectors(self):
+        class Shareable(object):
+            SHAREABLE = True
+
+        config = configobj.ConfigObj()
+        config['server'] = {'collector_scheduler': 'shared'}
+        config['collectors'] = {
+            'CPUCollector': {},
+            'MemoryCollector': {'shared': 'False'},
+        }
+
+        server = Server(None)
+        server.config = config
+        self.assertTrue(server.is_shared_collector('CPUCollector', Shareable))
+        self.assertFalse(server.is_shared_collector('MemoryCollector',
+                                                    Shareable))
+        self.assertFalse(server.is_shared_collector('CPUCollector', object))
 
+        config['collectors']['CPUCollector']['shared'] = 'True'
+        self.assertTrue(server.is_shared_collector('CPUCollector', object))
 
+        config['server']['collector_scheduler'] = 'process'
+        self.assertFalse(server.is_shared_collector('CPUCollector',
+                                                    Shareable))
+
+    def test_SelfMetrics(self):
+        config = configobj.ConfigObj()
+        config['server'] = {'self_metrics_interval': 30}
+        config['collectors'] = {}
+
+        server = Server(None)
+        server.config = config
+        self.assertEqual(server.create_self_metrics(), None)
+
+        config['server']['self_metrics'] = 'True'
+        server.self_metrics = server.create_self_metrics()
+        server.self_metrics.counter('collectors.CPUCollector.runs').inc()
+        server.metric_queue = Queue.Queue()
+        server.self_metrics_collector = server.create_self_metrics_collector()
+
+        # Published right away and then every interval
+        server.publish_self_metrics(now=100)
+        self.assertEqual(server.metric_queue.qsize(), 1)
+        server.publish_self_metrics(now=129)
+        self.assertEqual(server.metric_queue.qsize(), 1)
+        server.publish_self_metrics(now=130)
+        self.assertEqual(server.metric_queue.qsize(), 2)
+
+        # Without the path prefix and hostname
+        batch = MetricDecoder().decode(server.metric_queue.get())
+        self.assertEqual(
+            dict((metric.path.split('.', 2)[2], metric.value)
+                 for metric in batch.metrics), {
+                'diamond.queue.depth': 0,
+                'diamond.collectors.CPUCollector.runs': 1,
+            })
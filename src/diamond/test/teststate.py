@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import tempfile
+import time
+
+from test import unittest
+
+from diamond.utils.state import CounterStore
+from diamond.utils.state import StateError
+
+
+class TestCounterStore(unittest.TestCase):
+
+    def check_mapping(self, store):
+        store['a'] = 1
+        store['b'] = 2
+        store['a'] = 3
+        self.assertEqual(len(store), 2)
+        self.assertTrue('a' in store)
+        self.assertFalse('c' in store)
+        self.assertEqual(store['a'], 3)
+        self.assertEqual(store.get('c', 4), 4)
+        self.assertEqual(sorted(store.items()), [('a', 3), ('b', 2)])
+        self.assertRaises(KeyError, store.__getitem__, 'c')
+
+        del store['a']
+        self.assertEqual(sorted(store), ['b'])
+        store.clear()
+        self.assertEqual(len(store), 0)
+
+    def test_dict(self):
+        self.check_mapping(CounterStore())
+
+    def test_array(self):
+        store = CounterStore(typecode='d')
+        self.check_mapping(store)
+
+        # Slots of deleted counters are reused
+        store['a'] = 1
+        store['b'] = 2
+        del store['a']
+        store['c'] = 3
+        self.assertEqual(len(store.array), 2)
+        self.assertEqual(store['c'], 3.0)
+
+    def test_array_large_integers(self):
+        store = CounterStore(typecode='d')
+        # Rounded up in a double
+        large = 2 ** 53 + 1
+        store['a'] = large
+        self.assertEqual(store['a'], large)
+        self.assertEqual(store.swap(['a', 'b'], [large + 2, 2 ** 64 - 1]),
+                         [large, None])
+        self.assertEqual(store['a'] - large, 2)
+        self.assertEqual(store['b'], 2 ** 64 - 1)
+
+        # Back in the array once it fits
+        store['a'] = 5
+        self.assertEqual(store['a'], 5.0)
+        self.assertEqual(store.exact, {'b': 2 ** 64 - 1})
+        del store['b']
+        self.assertEqual(store.exact, {})
+        self.assertEqual(sorted(store.items()), [('a', 5.0)])
+
+    def test_swap(self):
+        for typecode in (None, 'd'):
+            store = CounterStore(ttl=1, typecode=typecode)
+            store['a'] = 1
+            self.assertEqual(store.swap(['a', 'b', 'c'], [2, 3, 4]),
+                             [1, None, None])
+            self.assertEqual(store.swap(['c', 'a'], [5, 6]), [4, 2])
+            self.assertEqual(sorted(store.items()),
+                             [('a', 6), ('b', 3), ('c', 5)])
+
+            # Swapped counters are kept, the others are evicted
+            store.advance()
+            store.swap(['a'], [7])
+            store.advance()
+            self.assertEqual(sorted(store), ['a'])
+
+    def test_eviction(self):
+        store = CounterStore(ttl=2)
+        store['old'] = 1
+        store['new'] = 1
+        store.advance()
+        store['new'] = 2
+        store.advance()
+        self.assertEqual(sorted(store), ['new', 'old'])
+
+        store['new'] = 3
+        store.advance()
+        store['new'] = 4
+        store.advance()
+        self.assertEqual(sorted(store), ['new'])
+        self.assertEqual(store.evicted, 1)
+        self.assertEqual(store.total_evicted, 1)
+
+        store.advance()
+        self.assertEqual(store.evicted, 0)
+
+    def test_no_eviction(self):
+        store = CounterStore(ttl=0, typecode='d')
+        store['a'] = 1
+        for i in range(100):
+            store.advance()
+        self.assertEqual(store['a'], 1.0)
+
+
+class TestCounterStoreFile(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.path, 'Collector.state')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        store = CounterStore()
+        store['int'] = -5
+        store['uint'] = 2 ** 64 - 1
+        store['float'] = 1.5
+        store['string'] = 'skipped'
+        store.advance()
+        store.save(self.state_file)
+        self.assertEqual(os.listdir(self.path), ['Collector.state'])
+
+        restored = CounterStore(typecode='d')
+        self.assertEqual(restored.load(self.state_file), 3)
+        self.assertEqual(sorted(restored.items()), [
+            ('float', 1.5), ('int', -5.0), ('uint', 2 ** 64 - 1)])
+        self.assertEqual(restored['uint'], 2 ** 64 - 1)
+        self.assertEqual(restored.restored, store.timestamp)
+
+        restored = CounterStore()
+        restored.load(self.state_file)
+        self.assertEqual(restored['uint'], 2 ** 64 - 1)
+
+        # The first run after the restore uses the restored values
+        restored.advance()
+        self.assertEqual(restored.restored, None)
+
+    def test_too_old(self):
+        store = CounterStore()
+        store['a'] = 1
+        store.timestamp = time.time() - 120
+        store.save(self.state_file)
+
+        restored = CounterStore()
+        self.assertEqual(restored.load(self.state_file, max_age=60), 0)
+        self.assertEqual(len(restored), 0)
+        self.assertEqual(restored.load(self.state_file, max_age=180), 1)
+
+    def test_invalid(self):
+        f = open(self.state_file, 'w')
+        f.write('DCST\x01')
+        f.close()
+        self.assertRaises(StateError, CounterStore().load, self.state_file)
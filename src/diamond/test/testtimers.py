@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import threading
+import time
+
+from test import unittest
+from mock import Mock
+
+from diamond.utils.scheduler import ScheduledCollector
+from diamond.utils.timers import TimerScheduler
+from diamond.utils.timers import monotonic
+
+
+class TestTimerScheduler(unittest.TestCase):
+
+    def test_runs_due_jobs_in_order(self):
+        calls = []
+        scheduler = TimerScheduler(threads=0)
+        scheduler.add('b', lambda: calls.append('b'), 10, start=105)
+        scheduler.add('a', lambda: calls.append('a'), 10, start=100)
+        scheduler.add('c', lambda: calls.append('c'), 10, start=200)
+
+        self.assertEqual(scheduler.next_delay(now=90), 10)
+        self.assertEqual(scheduler.run_pending(now=106), 2)
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(scheduler.next_delay(now=106), 4)
+
+        self.assertEqual(scheduler.run_pending(now=110), 1)
+        self.assertEqual(calls, ['a', 'b', 'a'])
+        self.assertEqual(scheduler.next_delay(now=110), 5)
+
+    def test_skips_missed_intervals(self):
+        func = Mock()
+        scheduler = TimerScheduler(threads=0, log=Mock())
+        job = scheduler.add('job', func, 10, start=100)
+
+        scheduler.run_pending(now=155)
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(job.next_run, 160)
+        self.assertEqual(job.skipped, 5)
+
+        scheduler.run_pending(now=160)
+        self.assertEqual(job.missed, 0)
+
+    def test_accounting(self):
+        clock = Mock(side_effect=[103, 115, 121, 123])
+        scheduler = TimerScheduler(threads=0, log=Mock(), clock=clock)
+        job = scheduler.add('job', Mock(), 10, start=100)
+
+        # Starts 3s late and takes 12s
+        scheduler.run_pending(now=103)
+        self.assertEqual(job.lag, 3)
+        self.assertEqual(job.duration, 12)
+        self.assertEqual(job.overruns, 1)
+
+        # The run due at 110 was missed
+        scheduler.run_pending(now=121)
+        self.assertEqual(job.lag, 1)
+        self.assertEqual(job.missed, 1)
+        self.assertEqual(job.stats(), {
+            'lag': 1,
+            'max_lag': 3,
+            'duration': 2,
+            'runs': 2,
+            'skipped': 1,
+            'overruns': 1,
+        })
+
+    def test_monotonic(self):
+        first = monotonic()
+        self.assertTrue(monotonic() >= first)
+
+    def test_skips_running_job(self):
+        func = Mock()
+        scheduler = TimerScheduler(threads=0, log=Mock())
+        job = scheduler.add('job', func, 10, start=100)
+        job.running = True
+
+        self.assertEqual(scheduler.run_pending(now=100), 0)
+        self.assertEqual(job.skipped, 1)
+        self.assertEqual(func.call_count, 0)
+
+        job.running = False
+        scheduler.run_pending(now=110)
+        self.assertEqual(job.missed, 1)
+
+    def test_failing_job_is_rescheduled(self):
+        scheduler = TimerScheduler(threads=0, log=Mock())
+        job = scheduler.add('job', Mock(side_effect=Exception('boom')), 10,
+                            start=100)
+
+        scheduler.run_pending(now=100)
+        scheduler.run_pending(now=110)
+        self.assertEqual(job.runs, 2)
+        self.assertFalse(job.running)
+
+    def test_invalid_interval(self):
+        scheduler = TimerScheduler(threads=0)
+        self.assertRaises(ValueError, scheduler.add, 'job', Mock(), 0)
+
+    def test_thread_pool(self):
+        done = threading.Event()
+        scheduler = TimerScheduler(threads=2)
+        scheduler.add('job', done.set, 10, start=100)
+        scheduler.start()
+
+        scheduler.run_pending(now=100)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(len(scheduler.workers), 2)
+
+
+class TestScheduledCollector(unittest.TestCase):
+
+    def test_reload(self):
+        collector = Mock()
+        collector.config = {'interval': 30}
+        runner = ScheduledCollector(collector)
+        scheduler = TimerScheduler(threads=0)
+        runner.job = scheduler.add('collector', runner, 10, start=time.time())
+
+        runner()
+        self.assertEqual(collector.load_config.call_count, 0)
+
+        runner.reload = True
+        runner()
+        self.assertEqual(collector.load_config.call_count, 1)
+        self.assertEqual(collector._run.call_count, 2)
+        self.assertEqual(runner.job.interval, 30.0)
+        self.assertFalse(runner.reload)
+        collector._run.assert_called_with(runner.job)
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+from test import unittest
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+from diamond.utils.wire import MetricDecoder
+from diamond.utils.wire import MetricEncoder
+from diamond.utils.wire import WireError
+
+
+class TestWire(unittest.TestCase):
+
+    def assertMetricEqual(self, actual, expected):
+        for slot in Metric.__slots__:
+            self.assertEqual(getattr(actual, slot), getattr(expected, slot))
+
+    def assertBatchEqual(self, actual, expected):
+        self.assertEqual(actual.flush, expected.flush)
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual.metrics, expected.metrics):
+            self.assertMetricEqual(a, e)
+
+    def test_roundtrip(self):
+        batch = MetricBatch([
+            Metric('servers.host.cpu.total.idle', 98.5, raw_value=123,
+                   timestamp=1234567, precision=2, host='host',
+                   metric_type='GAUGE', ttl=600),
+            Metric('servers.host.network.eth0.rx_bytes', 2 ** 62,
+                   timestamp=1234567, host='host'),
+            Metric('metricname', 1, timestamp=1234567),
+            Metric('servers.host.cpu.total.system', 1.5, timestamp=1234567,
+                   host='host', path_prefix='servers', collector_path='cpu',
+                   metric_path='total.system'),
+            # Not representable by the struct record, pickled instead
+            Metric(u'servers.host.cpu.total.user', 1, timestamp=1234567),
+            Metric('servers.host.big', 2 ** 70, timestamp=1234567),
+        ], flush=False)
+
+        actual = MetricDecoder().decode(MetricEncoder().encode(batch))
+        self.assertBatchEqual(actual, batch)
+        self.assertTrue(isinstance(actual.metrics[1].value, (int, long)))
+
+    def test_strings_are_interned(self):
+        encoder = MetricEncoder()
+        decoder = MetricDecoder()
+        batch = MetricBatch([Metric('servers.host.cpu.total.idle', i,
+                                    timestamp=1234567, host='host')
+                             for i in range(10)])
+
+        first = encoder.encode(batch)
+        second = encoder.encode(batch)
+        self.assertTrue(len(second) < len(first))
+        self.assertFalse('servers.host.cpu.total.idle' in second)
+
+        self.assertBatchEqual(decoder.decode(first), batch)
+        self.assertBatchEqual(decoder.decode(second), batch)
+
+    def test_multiple_producers(self):
+        decoder = MetricDecoder()
+        a = MetricEncoder()
+        b = MetricEncoder()
+        batch_a = MetricBatch([Metric('a.host.x.y', 1, timestamp=1,
+                                      host='host')])
+        batch_b = MetricBatch([Metric('b.host.x.y', 2, timestamp=1,
+                                      host='host')])
+
+        self.assertBatchEqual(decoder.decode(a.encode(batch_a)), batch_a)
+        self.assertBatchEqual(decoder.decode(b.encode(batch_b)), batch_b)
+        self.assertBatchEqual(decoder.decode(a.encode(batch_a)), batch_a)
+        self.assertBatchEqual(decoder.decode(b.encode(batch_b)), batch_b)
+
+    def test_rollback(self):
+        encoder = MetricEncoder()
+        decoder = MetricDecoder()
+        batch = MetricBatch([Metric('servers.host.cpu.total.idle', 1,
+                                    timestamp=1234567, host='host')])
+
+        # The first batch is lost on the way
+        encoder.encode(batch)
+        encoder.rollback()
+
+        self.assertBatchEqual(decoder.decode(encoder.encode(batch)), batch)
+
+    def test_unknown_strings(self):
+        encoder = MetricEncoder()
+        batch = MetricBatch([Metric('servers.host.cpu.total.idle', 1,
+                                    timestamp=1234567, host='host')])
+        encoder.encode(batch)
+
+        self.assertRaises(WireError, MetricDecoder().decode,
+                          encoder.encode(batch))
+        self.assertRaises(WireError, MetricDecoder().decode, 'garbage')
+
+    def test_string_table_reset(self):
+        encoder = MetricEncoder(max_strings=3)
+        decoder = MetricDecoder()
+        for i in range(5):
+            batch = MetricBatch([Metric('servers.host.m%d' % i, i,
+                                        timestamp=1234567, host='host')])
+            self.assertBatchEqual(decoder.decode(encoder.encode(batch)),
+                                  batch)
+        self.assertTrue(len(encoder.strings) <= 3)
+
+    def test_pickle_state(self):
+        import pickle
+        metric = Metric('servers.host.cpu.total.idle', 1, timestamp=1234567,
+                        host='host', ttl=600)
+        self.assertMetricEqual(pickle.loads(pickle.dumps(metric, 2)), metric)
+
+        # State pickled by older versions
+        restored = Metric.__new__(Metric)
+        restored.__setstate__({'path': 'a.b', 'value': 1})
+        self.assertEqual(restored.path, 'a.b')
+        self.assertEqual(restored.host, None)
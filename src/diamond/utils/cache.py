@@ -0,0 +1,53 @@
+# coding=utf-8
+
+"""
+Small bounded caches shared by the collectors
+"""
+
+
+class LRUCache(object):
+    """
+    Bounded cache keeping the most recently used entries.
+
+    Entries live in two generations. A hit in the old generation promotes the
+    entry to the new one, and once the new generation is full the old one is
+    dropped as a whole. This approximates LRU eviction while only using plain
+    dict operations on the lookup path.
+    """
+
+    def __init__(self, size=10000):
+        self.generation_size = max(int(size) // 2, 1)
+        self.new = {}
+        self.old = {}
+
+    def get(self, key, default=None):
+        try:
+            return self.new[key]
+        except KeyError:
+            pass
+        try:
+            value = self.old.pop(key)
+        except KeyError:
+            return default
+        self._set(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.old.pop(key, None)
+        self._set(key, value)
+
+    def _set(self, key, value):
+        if len(self.new) >= self.generation_size:
+            self.old = self.new
+            self.new = {}
+        self.new[key] = value
+
+    def __contains__(self, key):
+        return key in self.new or key in self.old
+
+    def __len__(self):
+        return len(self.new) + len(self.old)
+
+    def clear(self):
+        self.new = {}
+        self.old = {}
@@ -0,0 +1,360 @@
+# coding=utf-8
+
+"""
+Read the stats of containers straight from their cgroups.
+
+The cgroup directory of a container is looked up once, by walking the cgroup
+hierarchies for a directory named after its id: <id> with the cgroupfs
+driver of docker, docker-<id>.scope with the systemd driver, at any depth so
+the containers of pods nested under kubepods are found too. Every run then
+only reads the memory, cpu, blkio and pids files of the containers.
+
+The stats are returned in the layout of the docker stats API, so they are
+parsed the same whichever way they were read. Both the v1 layout, with a
+hierarchy per controller, and the v2 unified layout are supported.
+"""
+
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# The v1 hierarchies read, under the names they can be mounted as
+V1_CONTROLLERS = {
+    'memory': ('memory',),
+    'cpuacct': ('cpuacct', 'cpu,cpuacct', 'cpuacct,cpu'),
+    'blkio': ('blkio',),
+    'pids': ('pids',),
+}
+
+NANOSECONDS = 1000000000
+
+
+def read_file(path):
+    f = open(path)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def read_int(path):
+    """
+    Returns the number in a file, None if it is missing or unlimited
+    """
+    try:
+        value = read_file(path).strip()
+    except IOError:
+        return None
+    if value == 'max':
+        return None
+    return int(value)
+
+
+def read_keyed(path):
+    """
+    Returns the numbers of a file of key value lines, like memory.stat
+    """
+    values = {}
+    try:
+        lines = read_file(path).splitlines()
+    except IOError:
+        return values
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 2:
+            values[fields[0]] = int(fields[1])
+    return values
+
+
+def read_blkio_v1(path):
+    """
+    Returns the entries of a v1 blkio file, major:minor op value lines
+    """
+    entries = []
+    try:
+        lines = read_file(path).splitlines()
+    except IOError:
+        return entries
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        major, minor = fields[0].split(':')
+        entries.append({'major': int(major), 'minor': int(minor),
+                        'op': fields[1], 'value': int(fields[2])})
+    return entries
+
+
+def read_io_v2(path):
+    """
+    Returns the bytes and operations entries of a v2 io.stat file, as the
+    docker API reports them
+    """
+    service_bytes = []
+    serviced = []
+    try:
+        lines = read_file(path).splitlines()
+    except IOError:
+        return service_bytes, serviced
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        major, minor = fields[0].split(':')
+        values = dict(field.split('=', 1) for field in fields[1:])
+        for entries, read, write in ((service_bytes, 'rbytes', 'wbytes'),
+                                     (serviced, 'rios', 'wios')):
+            for op, key in (('Read', read), ('Write', write)):
+                if key in values:
+                    entries.append({'major': int(major),
+                                    'minor': int(minor), 'op': op,
+                                    'value': int(values[key])})
+    return service_bytes, serviced
+
+
+def container_id(dirname):
+    """
+    Returns the container id a cgroup directory may be named after:
+    <id>, docker-<id>.scope, cri-containerd-<id>.scope, ...
+    """
+    if dirname.endswith('.scope'):
+        dirname = dirname[:-len('.scope')]
+    return dirname.rsplit('-', 1)[-1]
+
+
+class ContainerCgroups(object):
+    """
+    Finds the cgroups of containers and reads their stats
+    """
+
+    def __init__(self, root=CGROUP_ROOT, proc='/proc'):
+        self.root = root
+        self.proc = proc
+        if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+            self.version = 2
+        else:
+            self.version = 1
+        self.hierarchies = self._hierarchies()
+        # Container id -> controller -> cgroup directory. Containers whose
+        # cgroup wasn't found map to nothing so they aren't looked up again
+        self.paths = {}
+        try:
+            self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        except (AttributeError, ValueError, OSError):
+            self.clock_ticks = 100
+
+    def _hierarchies(self):
+        if self.version == 2:
+            return {'unified': self.root}
+        hierarchies = {}
+        for controller, names in V1_CONTROLLERS.iteritems():
+            for name in names:
+                path = os.path.join(self.root, name)
+                if os.path.isdir(path):
+                    hierarchies[controller] = path
+                    break
+        return hierarchies
+
+    def update(self, container_ids):
+        """
+        Look up the cgroups of the containers not seen yet, and forget the
+        containers that are gone
+        """
+        container_ids = set(container_ids)
+        for known in self.paths.keys():
+            if known not in container_ids:
+                del self.paths[known]
+
+        missing = container_ids.difference(self.paths)
+        if not missing:
+            return
+        for container in missing:
+            self.paths[container] = {}
+        for controller, hierarchy in self.hierarchies.iteritems():
+            for root, dirnames, filenames in os.walk(hierarchy):
+                for dirname in list(dirnames):
+                    container = container_id(dirname)
+                    if container in missing:
+                        self.paths[container][controller] = os.path.join(
+                            root, dirname)
+                        # Don't walk the cgroups of the container
+                        dirnames.remove(dirname)
+
+    def stats(self, container_ids):
+        """
+        Returns the stats of the running containers by id, leaving out the
+        ones whose cgroup is missing or gone
+        """
+        self.update(container_ids)
+        system_cpu_usage = self.system_cpu_usage()
+        host_memory = self.host_memory()
+
+        stats = {}
+        for container in container_ids:
+            paths = self.paths.get(container)
+            if not paths:
+                continue
+            try:
+                # Gone when the container stopped since it was listed
+                if not os.path.isdir(paths.values()[0]):
+                    raise IOError('No cgroup %s' % paths.values()[0])
+                if self.version == 2:
+                    stat = self.stats_v2(paths['unified'])
+                else:
+                    stat = self.stats_v1(paths)
+            except (IOError, OSError, ValueError):
+                del self.paths[container]
+                continue
+
+            memory = stat['memory_stats']
+            if memory.get('limit') is None or memory['limit'] > host_memory:
+                memory['limit'] = host_memory
+            stat['cpu_stats']['system_cpu_usage'] = system_cpu_usage
+            networks = self.networks(paths.values()[0])
+            if networks:
+                stat['networks'] = networks
+            stats[container] = stat
+        return stats
+
+    def stats_v1(self, paths):
+        stats = {'memory_stats': {}, 'cpu_stats': {}, 'blkio_stats': {},
+                 'pids_stats': {}}
+
+        path = paths.get('memory')
+        if path:
+            stats['memory_stats'] = {
+                'usage': read_int(os.path.join(path,
+                                               'memory.usage_in_bytes')),
+                'max_usage': read_int(os.path.join(
+                    path, 'memory.max_usage_in_bytes')),
+                'limit': read_int(os.path.join(path,
+                                               'memory.limit_in_bytes')),
+                'failcnt': read_int(os.path.join(path, 'memory.failcnt')),
+                'stats': read_keyed(os.path.join(path, 'memory.stat')),
+            }
+
+        path = paths.get('cpuacct')
+        if path:
+            ticks = read_keyed(os.path.join(path, 'cpuacct.stat'))
+            try:
+                percpu = read_file(os.path.join(path, 'cpuacct.usage_percpu'))
+            except IOError:
+                percpu = ''
+            throttling = read_keyed(os.path.join(path, 'cpu.stat'))
+            stats['cpu_stats'] = {
+                'cpu_usage': {
+                    'total_usage': read_int(os.path.join(path,
+                                                         'cpuacct.usage')),
+                    'percpu_usage': [int(usage) for usage in percpu.split()],
+                    'usage_in_usermode': self.ticks_to_ns(
+                        ticks.get('user', 0)),
+                    'usage_in_kernelmode': self.ticks_to_ns(
+                        ticks.get('system', 0)),
+                },
+                'throttling_data': {
+                    'periods': throttling.get('nr_periods', 0),
+                    'throttled_periods': throttling.get('nr_throttled', 0),
+                    'throttled_time': throttling.get('throttled_time', 0),
+                },
+            }
+
+        path = paths.get('blkio')
+        if path:
+            blkio = stats['blkio_stats']
+            for key, name in (('io_service_bytes_recursive',
+                               'io_service_bytes'),
+                              ('io_serviced_recursive', 'io_serviced')):
+                # Not filled in without the CFQ scheduler
+                blkio[key] = read_blkio_v1(os.path.join(
+                    path, 'blkio.%s_recursive' % name))
+                if not blkio[key]:
+                    blkio[key] = read_blkio_v1(os.path.join(
+                        path, 'blkio.throttle.%s' % name))
+
+        path = paths.get('pids')
+        if path:
+            stats['pids_stats'] = {
+                'current': read_int(os.path.join(path, 'pids.current')),
+                'limit': read_int(os.path.join(path, 'pids.max')),
+            }
+        return stats
+
+    def stats_v2(self, path):
+        cpu = read_keyed(os.path.join(path, 'cpu.stat'))
+        service_bytes, serviced = read_io_v2(os.path.join(path, 'io.stat'))
+        return {
+            'memory_stats': {
+                'usage': read_int(os.path.join(path, 'memory.current')),
+                'limit': read_int(os.path.join(path, 'memory.max')),
+                'stats': read_keyed(os.path.join(path, 'memory.stat')),
+            },
+            'cpu_stats': {
+                'cpu_usage': {
+                    'total_usage': cpu.get('usage_usec', 0) * 1000,
+                    'usage_in_usermode': cpu.get('user_usec', 0) * 1000,
+                    'usage_in_kernelmode': cpu.get('system_usec', 0) * 1000,
+                },
+                'throttling_data': {
+                    'periods': cpu.get('nr_periods', 0),
+                    'throttled_periods': cpu.get('nr_throttled', 0),
+                    'throttled_time': cpu.get('throttled_usec', 0) * 1000,
+                },
+            },
+            'blkio_stats': {
+                'io_service_bytes_recursive': service_bytes,
+                'io_serviced_recursive': serviced,
+            },
+            'pids_stats': {
+                'current': read_int(os.path.join(path, 'pids.current')),
+                'limit': read_int(os.path.join(path, 'pids.max')),
+            },
+        }
+
+    def ticks_to_ns(self, ticks):
+        return ticks * NANOSECONDS // self.clock_ticks
+
+    def system_cpu_usage(self):
+        """
+        Returns the cpu time of the host in nanoseconds, like docker does
+        """
+        for line in read_file(os.path.join(self.proc, 'stat')).splitlines():
+            fields = line.split()
+            if fields and fields[0] == 'cpu':
+                # user nice system idle iowait irq softirq
+                return self.ticks_to_ns(sum(int(f) for f in fields[1:8]))
+        return None
+
+    def host_memory(self):
+        for line in read_file(os.path.join(self.proc,
+                                           'meminfo')).splitlines():
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1]) * 1024
+        return None
+
+    def networks(self, path):
+        """
+        Returns the interface counters of the network namespace of the
+        processes of a cgroup
+        """
+        try:
+            pids = read_file(os.path.join(path, 'cgroup.procs')).split()
+            if not pids:
+                return None
+            lines = read_file(os.path.join(self.proc, pids[0], 'net',
+                                           'dev')).splitlines()
+        except IOError:
+            return None
+
+        networks = {}
+        for line in lines[2:]:
+            interface, _, counters = line.partition(':')
+            interface = interface.strip()
+            counters = counters.split()
+            if interface == 'lo' or len(counters) < 12:
+                continue
+            networks[interface] = dict(
+                (name, int(counters[i])) for i, name in (
+                    (0, 'rx_bytes'), (1, 'rx_packets'), (2, 'rx_errors'),
+                    (3, 'rx_dropped'), (8, 'tx_bytes'), (9, 'tx_packets'),
+                    (10, 'tx_errors'), (11, 'tx_dropped')))
+        return networks
@@ -1,5 +1,6 @@
 # coding=utf-8
 
+import ast
 import configobj
 import os
 import sys
@@ -8,6 +9,11 @@ import inspect
 import traceback
 import pkg_resources
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 from diamond.util import load_class_from_name
 from diamond.collector import Collector
 from diamond.handler.Handler import Handler
@@ -99,15 +105,183 @@ def load_handlers(config, handler_names):
     return handlers
 
 
-def load_collectors(paths):
+def load_collectors(paths, names=None, index_file=None):
     """
-    Load all collectors
+    Load all collectors, or only the modules defining the collector classes
+    in names
     """
-    collectors = load_collectors_from_paths(paths)
+    if names is None:
+        collectors = load_collectors_from_paths(paths)
+    else:
+        collectors = load_collectors_from_index(paths, names, index_file)
     collectors.update(load_collectors_from_entry_point('diamond.collectors'))
     return collectors
 
 
+def split_paths(paths):
+    if isinstance(paths, basestring):
+        paths = paths.split(',')
+        paths = map(str.strip, paths)
+    return paths
+
+
+def find_collector_modules(paths):
+    """
+    Yields the path of every module that may hold collectors, skipping the
+    same files and directories as load_collectors_from_paths
+    """
+    for path in paths:
+        if not os.path.exists(path):
+            raise OSError("Directory does not exist: %s" % path)
+
+        if path.endswith('tests') or path.endswith('fixtures'):
+            return
+
+        for f in os.listdir(path):
+            fpath = os.path.join(path, f)
+            if os.path.isdir(fpath):
+                for module in find_collector_modules([fpath]):
+                    yield module
+            elif (os.path.isfile(fpath) and
+                  len(f) > 3 and
+                  f[-3:] == '.py' and
+                  f[0:4] != 'test' and
+                  f[0] != '.'):
+                yield fpath
+
+
+def scan_collector_classes(fpath):
+    """
+    Returns the names of the classes a module defines that look like
+    collectors, by parsing its source instead of importing it
+    """
+    try:
+        f = open(fpath)
+        try:
+            tree = ast.parse(f.read(), fpath)
+        finally:
+            f.close()
+    except (IOError, SyntaxError, TypeError), e:
+        logger.debug('Failed to scan module %s: %s', fpath, e)
+        return []
+
+    names = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = [getattr(base, 'id', getattr(base, 'attr', ''))
+                 for base in node.bases]
+        if ('Collector' in node.name or
+                [base for base in bases if base.endswith('Collector')]):
+            names.append(node.name)
+    return names
+
+
+def build_collector_index(paths, index_file=None):
+    """
+    Returns a dict of collector class names to the path of the module
+    defining them.
+
+    The classes found in each module are cached in index_file along with
+    the mtime and size of the module, only new or changed modules are parsed
+    again.
+    """
+    cached = {}
+    if index_file and os.path.exists(index_file):
+        try:
+            f = open(index_file)
+            try:
+                cached = json.load(f).get('files', {})
+            finally:
+                f.close()
+        except (IOError, ValueError, AttributeError), e:
+            logger.warning('Ignoring collector index %s: %s', index_file, e)
+            cached = {}
+
+    files = {}
+    index = {}
+    for fpath in find_collector_modules(paths):
+        stat = os.stat(fpath)
+        entry = cached.get(fpath)
+        if (not isinstance(entry, list) or len(entry) != 3 or
+                entry[0] != stat.st_mtime or entry[1] != stat.st_size):
+            entry = [stat.st_mtime, stat.st_size,
+                     scan_collector_classes(fpath)]
+        files[fpath] = entry
+        for name in entry[2]:
+            index.setdefault(name, fpath)
+
+    if index_file and files != cached:
+        try:
+            # Write to a temporary file first so a reader never sees a
+            # partial index
+            tmp_file = '%s.%d.tmp' % (index_file, os.getpid())
+            f = open(tmp_file, 'w')
+            try:
+                json.dump({'files': files}, f)
+            finally:
+                f.close()
+            os.rename(tmp_file, index_file)
+        except (IOError, OSError), e:
+            logger.warning('Failed to write collector index %s: %s',
+                           index_file, e)
+
+    return index
+
+
+def load_collectors_from_index(paths, names, index_file=None):
+    """
+    Import only the modules defining the collector classes in names. Falls
+    back to importing every module when a class can't be found in the index
+    """
+    collectors = {}
+
+    if paths is None:
+        return collectors
+
+    paths = split_paths(paths)
+    load_include_path(paths)
+
+    index = build_collector_index(paths, index_file)
+
+    missing = [name for name in names if name not in index]
+    if missing:
+        logger.warning('Collectors %s not found in the collector index, '
+                       'loading every collector', ', '.join(sorted(missing)))
+        return load_collectors_from_paths(paths)
+
+    modules = set(index[name] for name in names)
+    for fpath in sorted(modules):
+        mod = import_collector_module(str(os.path.basename(fpath)[:-3]))
+        if mod is not None:
+            for name, cls in get_collectors_from_module(mod):
+                collectors[name] = cls
+
+    return collectors
+
+
+def import_collector_module(modname):
+    """
+    Import a collector module, returns None if it fails to import
+    """
+    try:
+        # Import the module
+        return __import__(modname, globals(), locals(), ['*'])
+    except (KeyboardInterrupt, SystemExit), err:
+        logger.error(
+            "System or keyboard interrupt "
+            "while loading module %s"
+            % modname)
+        if isinstance(err, SystemExit):
+            sys.exit(err.code)
+        raise KeyboardInterrupt
+    except Exception:
+        # Log error
+        logger.error("Failed to import module: %s. %s",
+                     modname,
+                     traceback.format_exc())
+
+
 def load_collectors_from_paths(paths):
     """
     Scan for collectors to load from path
@@ -118,9 +292,7 @@ def load_collectors_from_paths(paths):
     if paths is None:
         return
 
-    if isinstance(paths, basestring):
-        paths = paths.split(',')
-        paths = map(str.strip, paths)
+    paths = split_paths(paths)
 
     load_include_path(paths)
 
@@ -149,25 +321,8 @@ def load_collectors_from_paths(paths):
                   f[0:4] != 'test' and
                   f[0] != '.'):
 
-                modname = f[:-3]
-
-                try:
-                    # Import the module
-                    mod = __import__(modname, globals(), locals(), ['*'])
-                except (KeyboardInterrupt, SystemExit), err:
-                    logger.error(
-                        "System or keyboard interrupt "
-                        "while loading module %s"
-                        % modname)
-                    if isinstance(err, SystemExit):
-                        sys.exit(err.code)
-                    raise KeyboardInterrupt
-                except Exception:
-                    # Log error
-                    logger.error("Failed to import module: %s. %s",
-                                 modname,
-                                 traceback.format_exc())
-                else:
+                mod = import_collector_module(f[:-3])
+                if mod is not None:
                     for name, cls in get_collectors_from_module(mod):
                         collectors[name] = cls
 
@@ -1,7 +1,24 @@
 # coding=utf-8
 
 import configobj
+import errno
+import logging
+import marshal
 import os
+import threading
+
+logger = logging.getLogger('diamond')
+
+# Parsed configs by config file, with the files and directories they were
+# read from
+_cache = {}
+_cache_lock = threading.Lock()
+
+# File the parsed config is written to so processes forked before a change
+# don't all have to parse it again, see set_config_snapshot
+_snapshot_file = None
+
+SNAPSHOT_VERSION = 1
 
 
 def str_to_bool(value):
@@ -21,13 +38,135 @@ def str_to_bool(value):
     return value
 
 
-def load_config(configfile):
+def set_config_snapshot(snapshot_file):
     """
-    Load the full config / merge splitted configs if configured
+    Set the file holding a snapshot of the last parsed config. Processes
+    sharing it only parse the config files once per change.
+    """
+    global _snapshot_file
+    _snapshot_file = snapshot_file
+
+
+def _signature(paths):
+    """
+    Returns the mtime and size of each of the paths, None for missing ones
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime, stat.st_size))
+    return signature
+
+
+def _to_dict(section):
+    """
+    Convert a config to plain dicts and lists, copying all of them
+    """
+    result = {}
+    for key, value in section.iteritems():
+        if isinstance(value, dict):
+            value = _to_dict(value)
+        elif isinstance(value, list):
+            value = list(value)
+        result[key] = value
+    return result
+
+
+def copy_section(section):
+    """
+    Returns a copy of a config section that can be merged into another
+    config without sharing any of its lists
     """
+    return _to_dict(section)
 
+
+def _read_snapshot(configfile):
+    if _snapshot_file is None:
+        return None
+    try:
+        f = open(_snapshot_file, 'rb')
+        try:
+            snapshot = marshal.load(f)
+        finally:
+            f.close()
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            logger.warning('Failed to read config snapshot %s: %s',
+                           _snapshot_file, e)
+        return None
+    except (EOFError, ValueError, TypeError), e:
+        logger.warning('Ignoring config snapshot %s: %s', _snapshot_file, e)
+        return None
+
+    if (not isinstance(snapshot, tuple) or len(snapshot) != 5 or
+            snapshot[0] != SNAPSHOT_VERSION or snapshot[1] != configfile):
+        return None
+    version, configfile, paths, signature, data = snapshot
+    if _signature(paths) != signature:
+        return None
+    return paths, signature, configobj.ConfigObj(data)
+
+
+def _write_snapshot(configfile, paths, signature, config):
+    if _snapshot_file is None:
+        return
+    snapshot = (SNAPSHOT_VERSION, configfile, paths, signature,
+                _to_dict(config))
+    # Write to a temporary file first so a reader never sees a partial
+    # snapshot
+    tmp_file = '%s.%d.tmp' % (_snapshot_file, os.getpid())
+    try:
+        f = open(tmp_file, 'wb')
+        try:
+            marshal.dump(snapshot, f)
+        finally:
+            f.close()
+        os.rename(tmp_file, _snapshot_file)
+    except (IOError, OSError, ValueError), e:
+        logger.warning('Failed to write config snapshot %s: %s',
+                       _snapshot_file, e)
+
+
+def load_config(configfile, copy=True):
+    """
+    Load the full config / merge splitted configs if configured
+
+    The config is only parsed again when one of the files or directories it
+    was read from changed. Unless copy is True the config returned is shared
+    with every other caller and must not be modified.
+    """
     configfile = os.path.abspath(configfile)
+
+    _cache_lock.acquire()
+    try:
+        cached = _cache.get(configfile)
+        if cached is None or _signature(cached[0]) != cached[1]:
+            cached = _read_snapshot(configfile)
+            if cached is None:
+                paths = []
+                config = _load_config(configfile, paths)
+                cached = (paths, _signature(paths), config)
+                _write_snapshot(configfile, *cached)
+            _cache[configfile] = cached
+        config = cached[2]
+    finally:
+        _cache_lock.release()
+
+    if copy:
+        config = configobj.ConfigObj(_to_dict(config))
+    return config
+
+
+def _load_config(configfile, paths):
+    """
+    Parse the config files, adding the files and directories read to paths
+    """
     config = configobj.ConfigObj(configfile)
+    paths.append(configfile)
 
     config_extension = '.conf'
 
@@ -40,12 +179,14 @@ def load_config(configfile):
 
         # Load other configs
         if 'path' in config['configs']:
+            paths.append(config['configs']['path'])
             for cfgfile in os.listdir(config['configs']['path']):
                 cfgfile = os.path.join(config['configs']['path'],
                                        cfgfile)
                 cfgfile = os.path.abspath(cfgfile)
                 if not cfgfile.endswith(config_extension):
                     continue
+                paths.append(cfgfile)
                 newconfig = configobj.ConfigObj(cfgfile)
                 config.merge(newconfig)
 
@@ -63,6 +204,7 @@ def load_config(configfile):
 
     if 'handlers_config_path' in config['server']:
         handlers_config_path = config['server']['handlers_config_path']
+        paths.append(handlers_config_path)
         if os.path.exists(handlers_config_path):
             for cfgfile in os.listdir(handlers_config_path):
                 cfgfile = os.path.join(handlers_config_path, cfgfile)
@@ -75,6 +217,7 @@ def load_config(configfile):
                 if handler not in config['handlers']:
                     config['handlers'][handler] = configobj.ConfigObj()
 
+                paths.append(cfgfile)
                 newconfig = configobj.ConfigObj(cfgfile)
                 config['handlers'][handler].merge(newconfig)
 
@@ -87,6 +230,7 @@ def load_config(configfile):
 
     if 'collectors_config_path' in config['server']:
         collectors_config_path = config['server']['collectors_config_path']
+        paths.append(collectors_config_path)
         if os.path.exists(collectors_config_path):
             for cfgfile in os.listdir(collectors_config_path):
                 cfgfile = os.path.join(collectors_config_path, cfgfile)
@@ -99,6 +243,7 @@ def load_config(configfile):
                 if collector not in config['collectors']:
                     config['collectors'][collector] = configobj.ConfigObj()
 
+                paths.append(cfgfile)
                 try:
                     newconfig = configobj.ConfigObj(cfgfile)
                 except Exception, e:
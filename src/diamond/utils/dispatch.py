@@ -0,0 +1,182 @@
+# coding=utf-8
+
+"""
+Per handler dispatch for the handler process.
+
+By default the handler process runs every handler serially for every item it
+takes off the metric queue, so a single slow handler holds up all the others.
+With handler_dispatch set to thread or process, each handler gets a bounded
+queue of its own drained by a dedicated worker thread or process, and the
+handler process only fans the items out. When a handler falls behind its
+queue fills up and the items meant for it are dropped and counted, without
+affecting the other handlers.
+"""
+
+import multiprocessing
+import Queue
+import signal
+import threading
+import traceback
+
+try:
+    from setproctitle import getproctitle, setproctitle
+except ImportError:
+    setproctitle = None
+
+from diamond.metric import MetricBatch
+
+DISPATCH_MODES = ('serial', 'thread', 'process')
+
+
+def process_item(handler, item):
+    """
+    Hand an item taken off the metric queue to a handler
+    """
+    if isinstance(item, MetricBatch):
+        if item.metrics:
+            handler._process_batch(item.metrics)
+        if item.flush:
+            handler._flush()
+    elif item is not None:
+        handler._process(item)
+    else:
+        handler._flush()
+
+
+def item_size(item):
+    """
+    Number of metrics carried by an item
+    """
+    if isinstance(item, MetricBatch):
+        return len(item.metrics)
+    if item is None:
+        return 0
+    return 1
+
+
+def handler_worker(handler, queue, log):
+    """
+    Drain a handler queue for the lifetime of the worker
+    """
+    proc = multiprocessing.current_process()
+    if setproctitle and proc.name != 'MainProcess':
+        setproctitle('%s - %s' % (getproctitle(), proc.name))
+
+    # A worker process profiles the next runs of its handler on SIGUSR1,
+    # thread workers are left to the handler process
+    profiler = getattr(handler, 'profiler', None)
+    if (profiler is not None and
+            isinstance(threading.current_thread(), threading._MainThread)):
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: profiler.start())
+        signal.siginterrupt(signal.SIGUSR1, False)
+
+    while True:
+        item = queue.get(block=True, timeout=None)
+        try:
+            process_item(handler, item)
+        except Exception:
+            log.error(traceback.format_exc())
+
+
+class HandlerWorker(object):
+    """
+    Feeds a single handler from its own bounded queue
+    """
+
+    def __init__(self, handler, mode='thread', maxsize=1024, log=None):
+        if mode not in ('thread', 'process'):
+            raise ValueError('Unknown handler dispatch mode %s' % mode)
+
+        self.handler = handler
+        self.mode = mode
+        self.name = handler.__class__.__name__
+        self.log = log or handler.log
+
+        # Number of metrics and items dropped because the queue was full
+        self.dropped = 0
+        self.dropped_items = 0
+        self._queue_depth = None
+        self._queue_dropped = None
+
+        name = 'Handler %s' % self.name
+        if mode == 'process':
+            self.queue = multiprocessing.Queue(maxsize=maxsize)
+            args = (handler, self.queue, self.log)
+            self.worker = multiprocessing.Process(name=name,
+                                                  target=handler_worker,
+                                                  args=args)
+        else:
+            self.queue = Queue.Queue(maxsize=maxsize)
+            args = (handler, self.queue, self.log)
+            self.worker = threading.Thread(name=name,
+                                           target=handler_worker,
+                                           args=args)
+        self.worker.daemon = True
+        self.started = False
+
+    def start(self):
+        """
+        Start the worker. Thread workers have to be started in the handler
+        process, process workers by the server as the handler process is
+        daemonic and can't have children
+        """
+        if not self.started:
+            self.worker.start()
+            self.started = True
+
+    def is_alive(self):
+        return self.worker.is_alive()
+
+    def set_self_metrics(self, registry):
+        """
+        Allocate the gauge of the depth of the queue of the handler, and the
+        counter of the metrics dropped because it was full, in the registry
+        of the agent metrics. They have slots of their own, only written by
+        the process dispatching the items
+        """
+        prefix = 'handlers.%s.' % self.handler.__class__.__name__
+        self._queue_depth = registry.gauge(prefix + 'queue_depth')
+        self._queue_dropped = registry.counter(prefix + 'queue_dropped')
+
+    def put(self, item):
+        """
+        Queue an item for the handler without blocking
+        """
+        try:
+            self.queue.put(item, block=False)
+        except Queue.Full:
+            self.dropped += item_size(item)
+            self.dropped_items += 1
+            if self._queue_dropped is not None:
+                self._queue_dropped.inc(item_size(item))
+            self.handler._throttle_error(
+                '%s: Queue full, dropped %d metrics in total',
+                self.name, self.dropped)
+
+        if self._queue_depth is not None:
+            self._queue_depth.set(self.qsize())
+
+    def qsize(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # multiprocessing.Queue.qsize is not available on every platform
+            return -1
+
+    def stats(self):
+        return {
+            'queue_depth': self.qsize(),
+            'dropped': self.dropped,
+            'dropped_items': self.dropped_items,
+        }
+
+
+def create_handler_workers(handlers, mode, maxsize=1024, log=None):
+    """
+    Create a worker per handler, returns None for the serial mode
+    """
+    if mode == 'serial':
+        return None
+    return [HandlerWorker(handler, mode=mode, maxsize=maxsize, log=log)
+            for handler in handlers]
@@ -0,0 +1,205 @@
+# coding=utf-8
+
+"""
+Regex based name filtering without running the regex for every name.
+
+Whitelists, blacklists and exclude lists are usually long alternations of
+plain names and prefixes. MetricFilter splits the patterns on their top level
+alternatives and sorts each of them into
+
+  * a set of exact names, for literals anchored at the end with $
+  * a prefix trie, for literals that only have to match the start of the name
+  * a residual regex, for everything else
+
+and caches the decision for every name it has seen in a bounded LRU cache.
+The result is always the same as running the original patterns through
+re.match, or re.search when the filter is not anchored.
+
+Patterns with inline flags, groups with special meanings or backreferences
+are compiled on their own, as joining them with the others would change
+what they, or the others, match.
+"""
+
+import re
+
+from diamond.utils.cache import LRUCache
+
+# Characters with a special meaning in a regex, outside of a character class
+METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+# Marks the end of a prefix in the trie
+TERMINAL = None
+
+# Inline flags, extension groups and backreferences, which don't keep their
+# meaning once a pattern is joined with others
+STANDALONE = re.compile(r'\(\?|\\[1-9]')
+
+
+def split_alternatives(pattern):
+    """
+    Split a regex on its top level | operators
+    """
+    alternatives = []
+    depth = 0
+    start = 0
+    in_class = False
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            # A ] right after the opening [ or [^ is a literal
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+            elif pattern[i + 1:i + 3] == '^]':
+                i += 2
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def parse_literal(alternative):
+    """
+    Parse a single alternative made of literal characters. Returns a tuple of
+    (literal, anchored at the start, anchored at the end) or None if the
+    alternative needs the regex engine
+    """
+    anchored_start = alternative.startswith('^')
+    if anchored_start:
+        alternative = alternative[1:]
+
+    # A trailing .* matches anything, the same as no end anchor
+    anchored_end = True
+    for suffix in ('.*$', '.*'):
+        if alternative.endswith(suffix) and not alternative.endswith(
+                '\\' + suffix):
+            alternative = alternative[:-len(suffix)]
+            anchored_end = False
+            break
+    else:
+        if alternative.endswith('$') and not alternative.endswith('\\$'):
+            alternative = alternative[:-1]
+        else:
+            anchored_end = False
+
+    literal = []
+    i = 0
+    length = len(alternative)
+    while i < length:
+        char = alternative[i]
+        if char == '\\':
+            escaped = alternative[i + 1:i + 2]
+            # \d, \w, \b, ... are classes or assertions, not literals
+            if not escaped or escaped.isalnum():
+                return None
+            literal.append(escaped)
+            i += 2
+            continue
+        if char in METACHARACTERS:
+            return None
+        literal.append(char)
+        i += 1
+
+    return ''.join(literal), anchored_start, anchored_end
+
+
+class MetricFilter(object):
+    """
+    Matches names against a list of regexes.
+
+    When anchored is True (the default) the patterns have to match at the
+    start of the name like re.match, otherwise anywhere like re.search.
+    """
+
+    def __init__(self, patterns, anchored=True, cache_size=10000):
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+
+        self.patterns = list(patterns)
+        self.anchored = anchored
+        self.exact = set()
+        self.trie = {}
+        self.regex = None
+        # Match methods of the patterns compiled on their own
+        self.standalone = []
+        self.cache = LRUCache(cache_size)
+
+        residual = []
+        for pattern in self.patterns:
+            # An inline flag would apply to the whole residual regex, and the
+            # group numbers would shift, so leave the pattern alone
+            if STANDALONE.search(pattern):
+                regex = re.compile(pattern)
+                if anchored:
+                    self.standalone.append(regex.match)
+                else:
+                    self.standalone.append(regex.search)
+                continue
+
+            for alternative in split_alternatives(pattern):
+                literal = parse_literal(alternative)
+                if literal is None:
+                    residual.append(alternative)
+                    continue
+
+                literal, anchored_start, anchored_end = literal
+                if not (anchored or anchored_start):
+                    # Could be anywhere in the name
+                    residual.append(alternative)
+                elif anchored_end:
+                    self.exact.add(literal)
+                else:
+                    self.add_prefix(literal)
+
+        if residual:
+            self.regex = re.compile('|'.join(residual))
+            if anchored:
+                self.regex_match = self.regex.match
+            else:
+                self.regex_match = self.regex.search
+
+    def add_prefix(self, prefix):
+        node = self.trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[TERMINAL] = True
+
+    def match_prefix(self, name):
+        node = self.trie
+        if TERMINAL in node:
+            return True
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return False
+            if TERMINAL in node:
+                return True
+        return False
+
+    def matches(self, name):
+        """
+        Returns True if any of the patterns matches the name
+        """
+        result = self.cache.get(name)
+        if result is None:
+            result = bool(
+                name in self.exact or
+                (self.trie and self.match_prefix(name)) or
+                (self.regex is not None and self.regex_match(name)) or
+                any(match(name) for match in self.standalone))
+            self.cache[name] = result
+        return result
@@ -0,0 +1,127 @@
+# coding=utf-8
+
+"""
+Profiling of a number of collector or handler runs with cProfile.
+
+A RunProfiler is armed for a number of runs, by the profile option of the
+collector or handler or by sending SIGUSR1 to its process. Each of those runs
+is profiled and its stats are written to the profile directory. Once the last
+one is done the stats of all of them are added up, written to the directory
+as well and the functions with the highest cumulative time are logged.
+
+cProfile only profiles the thread it was enabled in, so collectors running on
+the threads of the shared scheduler are profiled separately.
+"""
+
+import cProfile
+import logging
+import os
+import pstats
+import tempfile
+import time
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+def default_profile_dir():
+    return os.path.join(tempfile.gettempdir(), 'diamond-profiles')
+
+
+class RunProfiler(object):
+    """
+    Profiles the next runs of a collector or handler when armed
+    """
+
+    def __init__(self, name, runs=5, directory=None, top=20, log=None):
+        self.name = name.replace(' ', '_').replace(os.sep, '_')
+        self.runs = runs
+        self.directory = directory or default_profile_dir()
+        self.top = top
+        self.log = log or logging.getLogger('diamond')
+
+        # Runs left to profile
+        self.remaining = 0
+        self.profile = None
+        self.session = None
+        self.files = []
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def start(self, runs=None):
+        """
+        Profile the next runs
+        """
+        if runs is None:
+            runs = self.runs
+        if runs <= 0:
+            return
+        self.remaining = runs
+        self.session = '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'),
+                                  os.getpid())
+        self.files = []
+        self.log.info('%s: Profiling the next %d runs to %s', self.name,
+                      runs, self.directory)
+
+    def enable(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def disable(self):
+        if self.profile is not None:
+            self.profile.disable()
+
+    def end_run(self):
+        """
+        Write the stats of the run that just ended. After the last run the
+        stats of all of them are written and logged
+        """
+        if not self.active or self.profile is None:
+            return
+        profile, self.profile = self.profile, None
+        self.remaining -= 1
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = os.path.join(self.directory, '%s-%s-%d.prof' % (
+                self.name, self.session, len(self.files) + 1))
+            profile.dump_stats(path)
+            self.files.append(path)
+        except (IOError, OSError), e:
+            self.log.error('%s: Failed to write the profile: %s', self.name,
+                           e)
+            self.remaining = 0
+            return
+
+        if not self.remaining:
+            self.report()
+
+    def report(self):
+        """
+        Write the stats added up over the profiled runs and log the top
+        functions
+        """
+        if not self.files:
+            return
+        output = StringIO()
+        stats = pstats.Stats(self.files[0], stream=output)
+        for path in self.files[1:]:
+            stats.add(path)
+
+        path = os.path.join(self.directory, '%s-%s.prof' % (self.name,
+                                                            self.session))
+        try:
+            stats.dump_stats(path)
+        except (IOError, OSError), e:
+            self.log.error('%s: Failed to write the profile: %s', self.name,
+                           e)
+
+        stats.sort_stats('cumulative').print_stats(self.top)
+        self.log.info('%s: Profile of %d runs written to %s\n%s', self.name,
+                      len(self.files), path, output.getvalue())
@@ -0,0 +1,176 @@
+# coding=utf-8
+
+"""
+Shared memory ring buffer used as the metric queue between the collector
+processes and the handler process.
+
+The default metric queue is a multiprocessing Manager queue, which means every
+put from a collector is a round trip through the Manager server process with
+the Metric pickled on the way. The ring buffer instead lives in an anonymous
+shared memory mapping that is inherited by every forked child. Producers copy
+a record into the buffer while holding a lock for the duration of the copy
+only, and the handler process waits on a semaphore that counts the records
+available.
+
+Each record in the buffer is a small header followed by the payload:
+
+    <length:uint32><kind:uint8><payload>
+
+The QueueHandler puts metric batches already encoded by diamond.utils.wire,
+which are stored as is. Anything else put on the queue is pickled.
+"""
+
+import ctypes
+import multiprocessing
+import Queue
+import struct
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle as pickle
+
+# Default size of the shared buffer in bytes
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+RECORD_FLUSH = 0
+RECORD_BYTES = 1
+RECORD_PICKLE = 2
+
+RECORD_HEADER = struct.Struct('<IB')
+
+
+def encode_record(item):
+    """
+    Returns the kind and the payload for an item put on the queue
+    """
+    if item is None:
+        return RECORD_FLUSH, ''
+
+    if isinstance(item, str):
+        return RECORD_BYTES, item
+
+    return RECORD_PICKLE, pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+
+def decode_record(kind, data):
+    """
+    Returns the item stored in a record
+    """
+    if kind == RECORD_FLUSH:
+        return None
+    if kind == RECORD_BYTES:
+        return data
+    return pickle.loads(data)
+
+
+class RingBufferQueue(object):
+    """
+    Multi producer, single consumer queue backed by shared memory. It
+    implements the subset of the Queue.Queue interface used by the
+    QueueHandler and the handler process.
+
+    The queue has to be created before the producer and consumer processes
+    are forked.
+    """
+
+    def __init__(self, maxsize=0, buffer_size=DEFAULT_BUFFER_SIZE):
+        if buffer_size <= RECORD_HEADER.size:
+            raise ValueError('buffer_size of %s is too small' % buffer_size)
+
+        self.maxsize = maxsize
+        self.buffer_size = buffer_size
+
+        self._buffer = multiprocessing.RawArray(ctypes.c_char, buffer_size)
+        self._address = ctypes.addressof(self._buffer)
+
+        # head and tail are absolute byte offsets, count is the number of
+        # records currently stored
+        self._state = multiprocessing.RawArray(ctypes.c_ulonglong, 3)
+
+        self._lock = multiprocessing.Lock()
+        self._items = multiprocessing.Semaphore(0)
+
+    def _write(self, offset, data):
+        pos = offset % self.buffer_size
+        first = min(len(data), self.buffer_size - pos)
+        ctypes.memmove(self._address + pos, data, first)
+        if first < len(data):
+            ctypes.memmove(self._address, data[first:], len(data) - first)
+
+    def _read(self, offset, length):
+        pos = offset % self.buffer_size
+        first = min(length, self.buffer_size - pos)
+        data = ctypes.string_at(self._address + pos, first)
+        if first < length:
+            data += ctypes.string_at(self._address, length - first)
+        return data
+
+    def _try_put(self, record):
+        """
+        Copy a record into the buffer. Returns False if there is no room
+        """
+        state = self._state
+        with self._lock:
+            head, tail, count = state[0], state[1], state[2]
+            if self.maxsize > 0 and count >= self.maxsize:
+                return False
+            if len(record) > self.buffer_size - (head - tail):
+                return False
+            self._write(head, record)
+            state[0] = head + len(record)
+            state[2] = count + 1
+        self._items.release()
+        return True
+
+    def put(self, item, block=True, timeout=None):
+        kind, data = encode_record(item)
+        record = RECORD_HEADER.pack(len(data), kind) + data
+
+        if len(record) > self.buffer_size:
+            raise Queue.Full()
+
+        if self._try_put(record):
+            return
+        if not block:
+            raise Queue.Full()
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            time.sleep(0.001)
+            if self._try_put(record):
+                return
+            if timeout is not None and time.time() >= deadline:
+                raise Queue.Full()
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        if not self._items.acquire(block, timeout):
+            raise Queue.Empty()
+
+        state = self._state
+        with self._lock:
+            tail = state[1]
+            length, kind = RECORD_HEADER.unpack(
+                self._read(tail, RECORD_HEADER.size))
+            data = self._read(tail + RECORD_HEADER.size, length)
+            state[1] = tail + RECORD_HEADER.size + length
+            state[2] -= 1
+
+        return decode_record(kind, data)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return int(self._state[2])
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return self.maxsize > 0 and self.qsize() >= self.maxsize
@@ -13,41 +13,142 @@ try:
 except ImportError:
     setproctitle = None
 
+from diamond.utils.dispatch import process_item
+from diamond.utils.timers import TimerScheduler
+from diamond.utils.timers import wall_to_monotonic
+from diamond.utils.wire import MetricDecoder
+from diamond.utils.wire import WireError
 from diamond.utils.signals import signal_to_exception
 from diamond.utils.signals import SIGALRMException
-from diamond.utils.signals import SIGHUPException
+
+
+def first_run(interval, now=None):
+    """
+    Returns the time of the scheduler clock to first run a collector at: the
+    start of the current window plus a random stagger delay to avoid having
+    all collectors running at the same time, or right away if that has
+    passed already
+    """
+    if now is None:
+        now = time.time()
+    next_window = math.floor(now / interval) * interval
+    stagger_offset = random.uniform(0, max(interval - 1, 0))
+    return wall_to_monotonic(max(next_window + stagger_offset, now))
+
+
+class ScheduledCollector(object):
+    """
+    Runs a collector from a scheduler, reloading its config before the next
+    run when asked to. With timeout set a run is killed with SIGALRM when it
+    takes longer than the interval, which only works in the main thread.
+    """
+
+    def __init__(self, collector, timeout=False):
+        self.collector = collector
+        self.timeout = timeout
+        self.job = None
+        self.reload = False
+
+    def __call__(self):
+        if self.reload:
+            self.reload = False
+            self.collector.load_config()
+            self.collector.log.info('Config reloaded')
+            self.job.interval = float(self.collector.config['interval'])
+
+        if self.timeout:
+            signal.alarm(int(max(self.job.interval, 1)))
+        try:
+            self.collector._run(self.job)
+        except SIGALRMException:
+            self.collector.log.error('%s took too long to run! Killed!',
+                                     self.collector.name)
+        finally:
+            if self.timeout:
+                signal.alarm(0)
+
+
+def schedule_collectors(scheduler, collectors, log, timeout=False):
+    """
+    Add the collectors to a scheduler. Returns a ScheduledCollector for each
+    collector with a valid interval
+    """
+    runners = []
+    for collector in collectors:
+        interval = float(collector.config['interval'])
+        if interval <= 0:
+            log.critical('%s: interval of %s is not valid!', collector.name,
+                         interval)
+            continue
+
+        runner = ScheduledCollector(collector, timeout=timeout)
+        runner.job = scheduler.add(collector.name, runner, interval,
+                                   start=first_run(interval))
+        runners.append(runner)
+        log.debug('%s: interval %s seconds', collector.name, interval)
+    return runners
+
+
+def reload_on_hup(runners, log):
+    """
+    Reload the config of the collectors on SIGHUP. Collectors may be running
+    when the signal arrives, so the reload is left to each of them before
+    their next run
+    """
+    def reload_config(signum, frame):
+        log.info('Reloading config due to HUP')
+        for runner in runners:
+            runner.reload = True
+
+    signal.signal(signal.SIGHUP, reload_config)
+
+
+def save_on_term(runners, log):
+    """
+    Save the counters of the collectors before exiting on SIGTERM
+    """
+    def save_counter_state(signum, frame):
+        for runner in runners:
+            runner.collector.save_counter_state()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, save_counter_state)
+
+
+def profile_on_usr1(profilers, log):
+    """
+    Profile the next runs of the collectors or handlers on SIGUSR1
+    """
+    def start_profiling(signum, frame):
+        for profiler in profilers:
+            profiler.start()
+
+    signal.signal(signal.SIGUSR1, start_profiling)
+    # Let the system calls in progress carry on
+    signal.siginterrupt(signal.SIGUSR1, False)
 
 
 def collector_process(collector, metric_queue, log):
     """
+    Run a single collector
     """
     proc = multiprocessing.current_process()
     if setproctitle:
         setproctitle('%s - %s' % (getproctitle(), proc.name))
 
     signal.signal(signal.SIGALRM, signal_to_exception)
-    signal.signal(signal.SIGHUP, signal_to_exception)
     signal.signal(signal.SIGUSR2, signal_to_exception)
 
-    interval = float(collector.config['interval'])
-
     log.debug('Starting')
-    log.debug('Interval: %s seconds', interval)
 
-    # Validate the interval
-    if interval <= 0:
-        log.critical('interval of %s is not valid!', interval)
+    # Run the collector inline so the runs can be timed out with SIGALRM
+    scheduler = TimerScheduler(threads=0, log=log)
+    runners = schedule_collectors(scheduler, [collector], log, timeout=True)
+    if not runners:
         sys.exit(1)
-
-    # Start the next execution at the next window plus some stagger delay to
-    # avoid having all collectors running at the same time
-    next_window = math.floor(time.time() / interval) * interval
-    stagger_offset = random.uniform(0, interval - 1)
-
-    # Allocate time till the end of the window for the collector to run. With a
-    # minimum of 1 second
-    max_time = int(max(interval - stagger_offset, 1))
-    log.debug('Max collection time: %s seconds', max_time)
+    reload_on_hup(runners, log)
+    save_on_term(runners, log)
+    profile_on_usr1([collector.profiler], log)
 
     # Setup stderr/stdout as /dev/null so random print statements in thrid
     # party libs do not fail and prevent collectors from running.
@@ -55,64 +156,69 @@ def collector_process(collector, metric_queue, log):
     sys.stdout = open(os.devnull, 'w')
     sys.stderr = open(os.devnull, 'w')
 
-    while(True):
-        try:
-            time_to_sleep = (next_window + stagger_offset) - time.time()
-            if time_to_sleep > 0:
-                time.sleep(time_to_sleep)
-            elif time_to_sleep < 0:
-                # clock has jumped, lets skip missed intervals
-                next_window = time.time()
+    scheduler.run()
 
-            next_window += interval
 
-            # Ensure collector run times fit into the collection window
-            signal.alarm(max_time)
-
-            # Collect!
-            collector._run()
-
-            # Success! Disable the alarm
-            signal.alarm(0)
-
-        except SIGALRMException:
-            log.error('Took too long to run! Killed!')
-
-            # Adjust  the stagger_offset to allow for more time to run the
-            # collector
-            stagger_offset = stagger_offset * 0.9
+def shared_collector_process(collectors, metric_queue, log, threads=4):
+    """
+    Run a number of collectors in a single process, on a shared scheduler and
+    thread pool
+    """
+    proc = multiprocessing.current_process()
+    if setproctitle:
+        setproctitle('%s - %s' % (getproctitle(), proc.name))
 
-            max_time = int(max(interval - stagger_offset, 1))
-            log.debug('Max collection time: %s seconds', max_time)
+    log.debug('Starting process %s', proc.name)
 
-        except SIGHUPException:
-            # Reload the config if requested
-            # We must first disable the alarm as we don't want it to interrupt
-            # us and end up with half a loaded config
-            signal.alarm(0)
+    scheduler = TimerScheduler(threads=threads, log=log)
+    runners = schedule_collectors(scheduler, collectors, log)
+    reload_on_hup(runners, log)
+    save_on_term(runners, log)
+    profile_on_usr1([runner.collector.profiler for runner in runners], log)
 
-            log.info('Reloading config reload due to HUP')
-            collector.load_config()
-            log.info('Config reloaded')
+    # Setup stderr/stdout as /dev/null so random print statements in thrid
+    # party libs do not fail and prevent collectors from running.
+    sys.stdout = open(os.devnull, 'w')
+    sys.stderr = open(os.devnull, 'w')
 
-        except Exception:
-            log.exception('Collector failed!')
-            break
+    scheduler.run()
 
 
-def handler_process(handlers, metric_queue, log):
+def handler_process(handlers, metric_queue, log, workers=None):
     proc = multiprocessing.current_process()
     if setproctitle:
         setproctitle('%s - %s' % (getproctitle(), proc.name))
 
     log.debug('Starting process %s', proc.name)
 
+    # Each handler is fed by its own worker when the dispatch mode is thread
+    # or process
+    if workers:
+        for worker in workers:
+            worker.start()
+
+    # Handler worker processes handle the signal themselves
+    profile_on_usr1([handler.profiler for handler in handlers
+                     if getattr(handler, 'profiler', None) is not None], log)
+
+    decoder = MetricDecoder()
+
     while(True):
-        metric = metric_queue.get(block=True, timeout=None)
+        item = metric_queue.get(block=True, timeout=None)
         log.debug('in utils.scheduler.handler_process: metric_queue.qsize = ' +
                   str(metric_queue.qsize()))
-        for handler in handlers:
-            if metric is not None:
-                handler._process(metric)
-            else:
-                handler._flush()
+
+        # Metric batches arrive encoded by the QueueHandler
+        if isinstance(item, str):
+            try:
+                item = decoder.decode(item)
+            except WireError, e:
+                log.error('Dropping metric batch: %s', e)
+                continue
+
+        if workers:
+            for worker in workers:
+                worker.put(item)
+        else:
+            for handler in handlers:
+                process_item(handler, item)
@@ -0,0 +1,227 @@
+# coding=utf-8
+
+"""
+Metrics the agent keeps on itself, in shared memory.
+
+The collectors, the handlers and the handler process keep their counters in a
+RawArray created by the server before any of them is forked. Updating one is
+a store to memory rather than a message to another process, and the server
+reads the whole array every interval to publish it under the diamond
+namespace.
+
+Updating a counter or histogram reads and writes its slots without locking,
+so every slot has to have a single writer, one thread of one process. When
+two of them count the same thing, like the metrics a handler drops itself
+and the ones dropped before they reach it because its dispatch queue is
+full, each gets a metric of its own. Slots are allocated by name in the
+server before the processes using them are forked, and a name always gets
+the same slots so the counters of a restarted collector carry on.
+
+There are three kinds of metrics:
+
+  * counters, totals published as their change over the interval
+  * gauges, published as they are
+  * histograms of durations in ms, published as the number of observations,
+    the average and percentiles over the interval. A percentile is the upper
+    bound of the bucket it falls in.
+"""
+
+import bisect
+import ctypes
+import logging
+import multiprocessing
+import os
+
+DEFAULT_SLOTS = 4096
+
+# Upper bounds of the histogram buckets in ms, the last bucket is unbounded
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                   10000)
+
+PERCENTILES = (50, 90, 99)
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class NullMetric(object):
+    """
+    Stands in for a metric when there is no slot for it
+    """
+
+    def inc(self, value=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Slot(object):
+    """
+    A counter or gauge stored in a single slot
+    """
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def inc(self, value=1):
+        self.values[self.index] += value
+
+    def set(self, value):
+        self.values[self.index] = value
+
+    def get(self):
+        return self.values[self.index]
+
+
+class Histogram(object):
+    """
+    Counts the observations falling in each bucket, followed by their sum
+    """
+
+    def __init__(self, values, index, buckets=LATENCY_BUCKETS):
+        self.values = values
+        self.index = index
+        self.buckets = buckets
+
+    def observe(self, value):
+        values = self.values
+        values[self.index + bisect.bisect_left(self.buckets, value)] += 1
+        values[self.index + len(self.buckets) + 1] += value
+
+    def get(self):
+        """
+        Returns the counts of the buckets and the sum
+        """
+        end = self.index + len(self.buckets) + 1
+        return self.values[self.index:end], self.values[end]
+
+
+def get_rss_kb():
+    """
+    Returns the resident memory of the process in kB, or None
+    """
+    try:
+        f = open('/proc/self/statm')
+        try:
+            pages = int(f.read().split()[1])
+        finally:
+            f.close()
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * PAGE_SIZE / 1024
+
+
+def slots_needed(kind, buckets=LATENCY_BUCKETS):
+    if kind == HISTOGRAM:
+        return len(buckets) + 2
+    return 1
+
+
+class SelfMetrics(object):
+    """
+    Registry of the metrics of the agent. It has to be created, and its
+    metrics allocated, before the processes updating them are forked.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS, log=None):
+        self.log = log or logging.getLogger('diamond')
+        self.size = slots
+        self.values = multiprocessing.RawArray(ctypes.c_double, slots)
+        self.used = 0
+        # kind and metric of every name, in the order they were allocated
+        self.metrics = {}
+        self.names = []
+        # Values of the counters and histograms at the previous collect
+        self.previous = {}
+
+    def _allocate(self, name, kind, factory, size):
+        if name in self.metrics:
+            existing_kind, metric = self.metrics[name]
+            if existing_kind != kind:
+                raise ValueError('Self metric %s is a %s, not a %s' % (
+                    name, existing_kind, kind))
+            return metric
+
+        if self.used + size > self.size:
+            self.log.warning('Out of self metric slots, not tracking %s',
+                             name)
+            return NULL_METRIC
+
+        metric = factory(self.values, self.used)
+        self.used += size
+        self.metrics[name] = (kind, metric)
+        self.names.append(name)
+        return metric
+
+    def counter(self, name):
+        return self._allocate(name, COUNTER, Slot, 1)
+
+    def gauge(self, name):
+        return self._allocate(name, GAUGE, Slot, 1)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS):
+        def factory(values, index):
+            return Histogram(values, index, buckets)
+        return self._allocate(name, HISTOGRAM, factory,
+                              slots_needed(HISTOGRAM, buckets))
+
+    def collect(self):
+        """
+        Returns a list of (name, value) for every metric, with the counters
+        and histograms over the time since the previous call
+        """
+        results = []
+        for name in self.names:
+            kind, metric = self.metrics[name]
+            if kind == GAUGE:
+                results.append((name, metric.get()))
+            elif kind == COUNTER:
+                value = metric.get()
+                previous = self.previous.get(name, 0)
+                self.previous[name] = value
+                # A restarted process may have started over
+                results.append((name, max(value - previous, 0)))
+            else:
+                results.extend(self._collect_histogram(name, metric))
+        return results
+
+    def _collect_histogram(self, name, histogram):
+        counts, total = histogram.get()
+        previous_counts, previous_total = self.previous.get(
+            name, ([0] * len(counts), 0))
+        self.previous[name] = (counts, total)
+
+        counts = [max(count - previous, 0)
+                  for count, previous in zip(counts, previous_counts)]
+        count = sum(counts)
+        results = [(name + '.count', count)]
+        if not count:
+            return results
+
+        results.append((name + '.avg', max(total - previous_total, 0) /
+                        count))
+        for percentile in PERCENTILES:
+            rank = count * percentile / 100.0
+            seen = 0
+            for index, bucket_count in enumerate(counts):
+                seen += bucket_count
+                if seen >= rank:
+                    break
+            # Observations above the last bound are reported as the bound
+            bound = histogram.buckets[min(index, len(histogram.buckets) - 1)]
+            results.append(('%s.p%d' % (name, percentile), bound))
+        return results
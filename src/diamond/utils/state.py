@@ -0,0 +1,298 @@
+# coding=utf-8
+
+"""
+Bounded store for the last values of the counters of a collector.
+
+Collectors keep the previous value of every counter to compute rates. When
+the counters are keyed on something short lived, like container ids, pids or
+devices, the old values used to be kept for the lifetime of the process.
+CounterStore counts the collector runs as generations and forgets the
+counters that were not updated for ttl generations.
+
+The values are kept in a dict, or in an array.array of the given typecode
+which takes a fraction of the memory for numeric values. With a 'd' array,
+integers beyond 2**53 would be rounded, and a previous value rounded up
+would look like a counter rollover to derivative, so they are kept in a
+dict as they are.
+
+The counters can be saved to a file and restored after a restart so the
+first rates after it aren't lost. The file holds a header followed by a
+record per counter:
+
+    <magic:4s><version:uint8><timestamp:double><counters:uint32>
+    <key length:uint16><kind:uint8><key><value:8 bytes>   (for each counter)
+
+where the value is a signed or unsigned 64 bit integer or a double.
+"""
+
+import array
+import os
+import struct
+import time
+
+STATE_MAGIC = 'DCST'
+STATE_VERSION = 1
+STATE_HEADER = struct.Struct('<4sBdI')
+STATE_RECORD = struct.Struct('<HB')
+
+# Integers beyond this can't all be stored exactly in a double
+MAX_EXACT_INT = 2 ** 53
+
+KIND_INT = 0
+KIND_UINT = 1
+KIND_FLOAT = 2
+VALUE_STRUCTS = {
+    KIND_INT: struct.Struct('<q'),
+    KIND_UINT: struct.Struct('<Q'),
+    KIND_FLOAT: struct.Struct('<d'),
+}
+
+
+class StateError(Exception):
+    pass
+
+
+class CounterStore(object):
+    """
+    Dict like store of counter values evicting the counters that were not
+    updated for ttl generations, ttl 0 never evicts
+    """
+
+    def __init__(self, ttl=10, typecode=None):
+        self.ttl = ttl
+        self.typecode = typecode
+        # The generation each counter was last updated in
+        self.seen = {}
+        self.generation = 0
+        self.last_sweep = 0
+        # When the current values were collected, the end of the last run
+        self.timestamp = None
+        # When the restored values were collected, until the first run after
+        # the restore is done
+        self.restored = None
+        # Counters evicted by the last call to advance, and in total
+        self.evicted = 0
+        self.total_evicted = 0
+
+        if typecode is None:
+            self.values = {}
+        else:
+            self.slots = {}
+            self.array = array.array(typecode)
+            self.free = []
+            # Integer values the array can't hold exactly
+            self.exact = {}
+
+    def __len__(self):
+        return len(self.seen)
+
+    def __contains__(self, key):
+        return key in self.seen
+
+    def __iter__(self):
+        return iter(self.seen)
+
+    def __getitem__(self, key):
+        if self.typecode is None:
+            return self.values[key]
+        slot = self.slots.get(key)
+        if slot is None:
+            return self.exact[key]
+        return self.array[slot]
+
+    def __setitem__(self, key, value):
+        self.seen[key] = self.generation
+        if self.typecode is None:
+            self.values[key] = value
+            return
+        self._store(key, value)
+
+    def _store(self, key, value):
+        """
+        Store a value in the array, or in the exact values for integers the
+        array can't hold
+        """
+        if (isinstance(value, (int, long)) and
+                not -MAX_EXACT_INT <= value <= MAX_EXACT_INT):
+            slot = self.slots.pop(key, None)
+            if slot is not None:
+                self.free.append(slot)
+            self.exact[key] = value
+            return
+
+        slot = self.slots.get(key)
+        if slot is None:
+            self.exact.pop(key, None)
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = len(self.array)
+                self.array.append(0)
+            self.slots[key] = slot
+        self.array[slot] = value
+
+    def __delitem__(self, key):
+        del self.seen[key]
+        if self.typecode is None:
+            del self.values[key]
+            return
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            del self.exact[key]
+        else:
+            self.free.append(slot)
+
+    def swap(self, keys, values):
+        """
+        Store the values of many counters at once. Returns their previous
+        values, None for new counters
+        """
+        generation = self.generation
+        self.seen.update(dict.fromkeys(keys, generation))
+
+        if self.typecode is None:
+            old = map(self.values.get, keys)
+            self.values.update(zip(keys, values))
+            return old
+
+        slots = map(self.slots.get, keys)
+        data = self.array
+        exact = self.exact
+        old = [exact.get(key) if slot is None else data[slot]
+               for key, slot in zip(keys, slots)]
+        for i, slot in enumerate(slots):
+            value = values[i]
+            if slot is None or (isinstance(value, (int, long)) and
+                                not -MAX_EXACT_INT <= value <= MAX_EXACT_INT):
+                self._store(keys[i], value)
+            else:
+                data[slot] = value
+        return old
+
+    def get(self, key, default=None):
+        if key in self.seen:
+            return self[key]
+        return default
+
+    def keys(self):
+        return self.seen.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self.seen]
+
+    def clear(self):
+        self.seen.clear()
+        if self.typecode is None:
+            self.values.clear()
+        else:
+            self.slots.clear()
+            del self.array[:]
+            self.free = []
+            self.exact.clear()
+
+    def advance(self):
+        """
+        Start a new generation, called after every collector run. Counters
+        not updated for ttl generations are evicted, which is checked every
+        ttl generations so a counter is kept for at most twice as long.
+        """
+        self.generation += 1
+        self.timestamp = time.time()
+        self.restored = None
+        self.evicted = 0
+        if self.ttl <= 0 or self.generation - self.last_sweep < self.ttl:
+            return
+
+        self.last_sweep = self.generation
+        oldest = self.generation - self.ttl
+        for key in [key for key, generation in self.seen.iteritems()
+                    if generation < oldest]:
+            del self[key]
+            self.evicted += 1
+        self.total_evicted += self.evicted
+
+    def save(self, path):
+        """
+        Write the counters to a file. The file is replaced atomically so a
+        reader never sees a partial state
+        """
+        records = []
+        for key in self.seen:
+            value = self[key]
+            if not isinstance(key, str) or len(key) > 0xffff:
+                continue
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, (int, long)):
+                if -(2 ** 63) <= value < 2 ** 63:
+                    kind = KIND_INT
+                elif 0 <= value < 2 ** 64:
+                    kind = KIND_UINT
+                else:
+                    continue
+            elif isinstance(value, float):
+                kind = KIND_FLOAT
+            else:
+                continue
+            records.append(STATE_RECORD.pack(len(key), kind))
+            records.append(key)
+            records.append(VALUE_STRUCTS[kind].pack(value))
+
+        timestamp = self.timestamp
+        if timestamp is None:
+            timestamp = time.time()
+        header = STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, timestamp,
+                                   len(records) / 3)
+
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        f = open(tmp_path, 'wb')
+        try:
+            f.write(header)
+            f.write(''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+
+    def load(self, path, max_age=None):
+        """
+        Restore the counters saved to a file, unless they were collected
+        more than max_age seconds ago. Returns the number of counters
+        restored
+        """
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+
+        try:
+            magic, version, timestamp, count = STATE_HEADER.unpack_from(data)
+        except struct.error, e:
+            raise StateError('Invalid counter state %s: %s' % (path, e))
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise StateError('Invalid counter state %s' % path)
+
+        if max_age is not None and time.time() - timestamp > max_age:
+            return 0
+
+        values = []
+        offset = STATE_HEADER.size
+        try:
+            for i in xrange(count):
+                length, kind = STATE_RECORD.unpack_from(data, offset)
+                offset += STATE_RECORD.size
+                key = data[offset:offset + length]
+                offset += length
+                value, = VALUE_STRUCTS[kind].unpack_from(data, offset)
+                offset += VALUE_STRUCTS[kind].size
+                values.append((key, value))
+        except (struct.error, KeyError), e:
+            raise StateError('Invalid counter state %s: %s' % (path, e))
+
+        for key, value in values:
+            self[key] = value
+        self.timestamp = timestamp
+        self.restored = timestamp
+        return len(values)
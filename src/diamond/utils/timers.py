@@ -0,0 +1,255 @@
+# coding=utf-8
+
+"""
+Heap based timer scheduler running periodic jobs on a small thread pool.
+
+Used to run many lightweight collectors in a single process instead of one
+process each. The jobs are kept in a heap ordered by their next run time, the
+scheduler loop sleeps until the earliest one is due and hands it to the pool.
+A job is never run twice at the same time: when it is still running by the
+time it is due again the run is skipped.
+
+Times are taken from a monotonic clock so the schedule is not affected by the
+wall clock being changed. Every job keeps track of how late its runs start
+compared to when they were scheduled, how many intervals it skipped and how
+many of its runs took longer than the interval.
+"""
+
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import logging
+import math
+import os
+import Queue
+import sys
+import threading
+import time
+
+CLOCK_MONOTONIC = 1
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [
+        ('tv_sec', ctypes.c_long),
+        ('tv_nsec', ctypes.c_long),
+    ]
+
+
+def _get_monotonic():
+    """
+    Returns a function reading a monotonic clock in seconds, falling back to
+    time.time where there is none
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    if not sys.platform.startswith('linux'):
+        return time.time
+
+    try:
+        library = ctypes.util.find_library('rt') or ctypes.util.find_library(
+            'c')
+        clock_gettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        t = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+    return monotonic
+
+
+monotonic = _get_monotonic()
+
+
+def wall_to_monotonic(timestamp):
+    """
+    Convert a wall clock timestamp to the monotonic clock
+    """
+    return monotonic() + (timestamp - time.time())
+
+
+class Job(object):
+    """
+    A function run every interval seconds
+    """
+
+    def __init__(self, name, func, interval, next_run):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = next_run
+        self.running = False
+
+        # Time the current or last run was scheduled for
+        self.scheduled = None
+        # Seconds between when the last run was scheduled and when it started
+        self.lag = 0.0
+        self.max_lag = 0.0
+        # Seconds the last run took
+        self.duration = 0.0
+        # Intervals skipped since the previous run, and in total
+        self.missed = 0
+        self.pending_missed = 0
+        self.skipped = 0
+        self.runs = 0
+        self.overruns = 0
+
+    def skip(self, intervals=1):
+        self.pending_missed += intervals
+        self.skipped += intervals
+
+    def dispatch(self, scheduled):
+        self.scheduled = scheduled
+        self.missed = self.pending_missed
+        self.pending_missed = 0
+        self.running = True
+
+    def run(self, log, clock=None):
+        clock = clock or monotonic
+        start = clock()
+        self.lag = max(start - self.scheduled, 0.0)
+        self.max_lag = max(self.max_lag, self.lag)
+        try:
+            self.func()
+        except Exception:
+            log.exception('Job %s failed!', self.name)
+        finally:
+            self.duration = clock() - start
+            if self.duration > self.interval:
+                self.overruns += 1
+                log.warning('%s took %.2fs, longer than its %ss interval',
+                            self.name, self.duration, self.interval)
+            self.runs += 1
+            self.running = False
+
+    def stats(self):
+        return {
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'duration': self.duration,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'overruns': self.overruns,
+        }
+
+
+class TimerScheduler(object):
+    """
+    Runs jobs on a pool of threads, or inline in the scheduler loop when
+    threads is 0
+    """
+
+    def __init__(self, threads=4, log=None, clock=None):
+        self.threads = threads
+        self.log = log or logging.getLogger('diamond')
+        self.clock = clock or monotonic
+        self.heap = []
+        self.jobs = []
+        self.queue = Queue.Queue()
+        self.workers = []
+        # Breaks ties between jobs due at the same time
+        self.counter = itertools.count()
+
+    def add(self, name, func, interval, start=None):
+        """
+        Schedule func to run every interval seconds, starting at the given
+        time of the scheduler clock or right away
+        """
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError('Interval of %s is not valid' % interval)
+        if start is None:
+            start = self.clock()
+        job = Job(name, func, interval, start)
+        self.jobs.append(job)
+        self._push(job)
+        return job
+
+    def _push(self, job):
+        heapq.heappush(self.heap, (job.next_run, self.counter.next(), job))
+
+    def start(self):
+        """
+        Start the worker threads
+        """
+        while len(self.workers) < self.threads:
+            worker = threading.Thread(
+                name='Scheduler worker %d' % len(self.workers),
+                target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get(block=True, timeout=None)
+            job.run(self.log, self.clock)
+
+    def next_delay(self, now=None):
+        """
+        Seconds until the next job is due
+        """
+        if not self.heap:
+            return None
+        if now is None:
+            now = self.clock()
+        return max(self.heap[0][0] - now, 0)
+
+    def run_pending(self, now=None):
+        """
+        Hand every job that is due to the pool. Returns the number of jobs
+        started
+        """
+        if now is None:
+            now = self.clock()
+
+        started = 0
+        while self.heap and self.heap[0][0] <= now:
+            job = heapq.heappop(self.heap)[2]
+            scheduled = job.next_run
+
+            missed = int(math.floor((now - scheduled) / job.interval))
+            if missed > 0:
+                # The process stalled, only do the latest of the runs that
+                # are due and stay on the same schedule
+                scheduled += missed * job.interval
+                job.skip(missed)
+                self.log.warning('%s skipped %d intervals', job.name, missed)
+            job.next_run = scheduled + job.interval
+            self._push(job)
+
+            if job.running:
+                job.skip()
+                self.log.warning('%s is still running, skipping this run',
+                                 job.name)
+                continue
+
+            job.dispatch(scheduled)
+            started += 1
+            if self.threads > 0:
+                self.queue.put(job)
+            else:
+                job.run(self.log, self.clock)
+
+        return started
+
+    def run(self):
+        """
+        Run the jobs forever
+        """
+        self.start()
+        while True:
+            delay = self.next_delay()
+            if delay is None:
+                delay = 1
+            if delay > 0:
+                time.sleep(delay)
+            self.run_pending()
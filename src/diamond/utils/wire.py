@@ -0,0 +1,297 @@
+# coding=utf-8
+
+"""
+Compact binary encoding for the metric batches moved from the collector
+processes to the handler process.
+
+Pickling a Metric repeats the slot names and the full path and host strings
+for every metric. Instead every collector process owns a MetricEncoder that
+interns the path and host strings: the first batch using a string carries its
+definition, later batches only carry its numeric id. The handler process keeps
+a MetricDecoder holding the string table of every producer, keyed by a random
+producer id chosen when the encoder is created.
+
+A batch is encoded as:
+
+    <producer id:8s><flush:uint8><metrics:uint32><strings:uint32>
+    <string id:uint32><length:uint16><string>            (for each string)
+    <kind:uint8><record>                                 (for each metric)
+
+where the record is a fixed struct for metrics that fit in it and a length
+prefixed pickle otherwise.
+"""
+
+import os
+import struct
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle as pickle
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+
+BATCH_HEADER = struct.Struct('<8sBII')
+STRING_HEADER = struct.Struct('<IH')
+PICKLE_HEADER = struct.Struct('<I')
+
+KIND_INT = 0
+KIND_FLOAT = 1
+KIND_PICKLE = 2
+
+# flags, metric_type, precision, timestamp, value, raw_value, ttl, path id,
+# host id, path prefix id, collector path id, metric path id
+METRIC_INT = struct.Struct('<BBhqqddIIIII')
+METRIC_FLOAT = struct.Struct('<BBhqdddIIIII')
+
+FLAG_RAW_VALUE = 0x01
+FLAG_TTL = 0x02
+
+METRIC_TYPES = ('GAUGE', 'COUNTER')
+
+INT64_MIN = -(2 ** 63)
+INT64_MAX = (2 ** 63) - 1
+
+# Id 0 is reserved for a missing host or path component
+NO_STRING = 0
+
+
+class WireError(Exception):
+    pass
+
+
+class MetricEncoder(object):
+    """
+    Encodes MetricBatch objects for a single producer process
+    """
+
+    def __init__(self, max_strings=100000):
+        self.max_strings = max_strings
+        self.pid = os.getpid()
+        self.reset()
+
+    def reset(self):
+        """
+        Start over with a new producer id, which starts a new string table
+        on the decoding side. Used when whether the decoder got the last
+        encoded batch is unknown
+        """
+        self.producer_id = os.urandom(8)
+        self.strings = {}
+        self.next_id = NO_STRING + 1
+        self.pending = []
+
+    def _intern(self, string, definitions):
+        string_id = self.strings.get(string)
+        if string_id is None:
+            string_id = self.next_id
+            self.next_id += 1
+            self.strings[string] = string_id
+            self.pending.append(string)
+            definitions.append(STRING_HEADER.pack(string_id, len(string)))
+            definitions.append(string)
+        return string_id
+
+    def _encode_metric(self, metric, definitions):
+        """
+        Returns the kind and struct record for a metric, or None if the
+        metric holds something the struct can't represent
+        """
+        value = metric.value
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, long)):
+            if value < INT64_MIN or value > INT64_MAX:
+                return None
+            kind, fmt = KIND_INT, METRIC_INT
+        elif isinstance(value, float):
+            kind, fmt = KIND_FLOAT, METRIC_FLOAT
+        else:
+            return None
+
+        flags = 0
+        raw_value = metric.raw_value
+        if raw_value is not None:
+            if (isinstance(raw_value, bool) or
+                    not isinstance(raw_value, (int, long, float))):
+                return None
+            flags |= FLAG_RAW_VALUE
+            raw_value = float(raw_value)
+        else:
+            raw_value = 0.0
+
+        ttl = metric.ttl
+        if ttl is not None:
+            flags |= FLAG_TTL
+            ttl = float(ttl)
+        else:
+            ttl = 0.0
+
+        path = metric.path
+        if not isinstance(path, str) or len(path) > 0xffff:
+            return None
+        optional = (metric.host, metric.path_prefix, metric.collector_path,
+                    metric.metric_path)
+        for string in optional:
+            if string is not None and (not isinstance(string, str) or
+                                       len(string) > 0xffff):
+                return None
+
+        precision = metric.precision
+        if not isinstance(precision, (int, long)) or abs(precision) > 0x7fff:
+            return None
+
+        timestamp = metric.timestamp
+        if not isinstance(timestamp, (int, long)):
+            return None
+
+        try:
+            metric_type = METRIC_TYPES.index(metric.metric_type)
+        except ValueError:
+            return None
+
+        ids = [self._intern(path, definitions)]
+        for string in optional:
+            if string is None:
+                ids.append(NO_STRING)
+            else:
+                ids.append(self._intern(string, definitions))
+
+        return chr(kind) + fmt.pack(flags, metric_type, precision, timestamp,
+                                    value, raw_value, ttl, *ids)
+
+    def encode(self, batch):
+        """
+        Encode a MetricBatch. Strings defined by the batch are considered
+        known to the decoder unless rollback is called before the next
+        encode
+        """
+        if self.next_id > self.max_strings:
+            self.reset()
+        self.pending = []
+
+        definitions = []
+        records = []
+        for metric in batch.metrics:
+            record = None
+            if isinstance(metric, Metric):
+                record = self._encode_metric(metric, definitions)
+            if record is None:
+                data = pickle.dumps(metric, pickle.HIGHEST_PROTOCOL)
+                record = (chr(KIND_PICKLE) + PICKLE_HEADER.pack(len(data)) +
+                          data)
+            records.append(record)
+
+        header = BATCH_HEADER.pack(self.producer_id, int(batch.flush),
+                                   len(records), len(self.pending))
+        return ''.join([header] + definitions + records)
+
+    def rollback(self):
+        """
+        Forget the strings defined by the last encoded batch, used when the
+        batch never made it to the decoder
+        """
+        for string in self.pending:
+            del self.strings[string]
+        self.next_id -= len(self.pending)
+        self.pending = []
+
+
+class MetricDecoder(object):
+    """
+    Decodes batches from any number of producers
+    """
+
+    def __init__(self, max_producers=1024):
+        self.max_producers = max_producers
+        self.tables = OrderedDict()
+
+    def _table(self, producer_id):
+        table = self.tables.pop(producer_id, None)
+        if table is None:
+            table = [None]
+            if len(self.tables) >= self.max_producers:
+                # Forget the producer we heard from the longest time ago
+                self.tables.pop(iter(self.tables).next())
+        self.tables[producer_id] = table
+        return table
+
+    def decode(self, data):
+        """
+        Decode a batch created by MetricEncoder.encode
+        """
+        try:
+            return self._decode(data)
+        except (struct.error, IndexError, ValueError,
+                pickle.UnpicklingError), e:
+            raise WireError('Failed to decode metric batch: %s' % e)
+
+    def _decode(self, data):
+        producer_id, flush, count, strings = BATCH_HEADER.unpack_from(data)
+        offset = BATCH_HEADER.size
+        table = self._table(producer_id)
+
+        for i in xrange(strings):
+            string_id, length = STRING_HEADER.unpack_from(data, offset)
+            offset += STRING_HEADER.size
+            if string_id != len(table):
+                raise WireError('Unexpected string id %d from producer %r' %
+                                (string_id, producer_id))
+            table.append(data[offset:offset + length])
+            offset += length
+
+        metrics = []
+        new = Metric.__new__
+        for i in xrange(count):
+            kind = ord(data[offset])
+            offset += 1
+
+            if kind == KIND_PICKLE:
+                length, = PICKLE_HEADER.unpack_from(data, offset)
+                offset += PICKLE_HEADER.size
+                metrics.append(pickle.loads(data[offset:offset + length]))
+                offset += length
+                continue
+
+            if kind == KIND_INT:
+                fmt = METRIC_INT
+            else:
+                fmt = METRIC_FLOAT
+            (flags, metric_type, precision, timestamp, value, raw_value, ttl,
+             path_id, host_id, prefix_id, collector_id,
+             metric_id) = fmt.unpack_from(data, offset)
+            offset += fmt.size
+
+            if max(path_id, host_id, prefix_id, collector_id,
+                   metric_id) >= len(table):
+                raise WireError('Unknown string id from producer %r' %
+                                producer_id)
+
+            # Build the metric directly, it was validated when first created
+            metric = new(Metric)
+            metric.path = table[path_id]
+            metric.value = value
+            if flags & FLAG_RAW_VALUE:
+                metric.raw_value = raw_value
+            else:
+                metric.raw_value = None
+            metric.timestamp = timestamp
+            metric.precision = precision
+            metric.host = table[host_id]
+            metric.metric_type = METRIC_TYPES[metric_type]
+            if flags & FLAG_TTL:
+                metric.ttl = ttl
+            else:
+                metric.ttl = None
+            metric.path_prefix = table[prefix_id]
+            metric.collector_path = table[collector_id]
+            metric.metric_path = table[metric_id]
+            metrics.append(metric)
+
+        return MetricBatch(metrics, flush=bool(flush))